@@ -1,8 +1,14 @@
 # pylint: disable=invalid-name
+import hashlib
 import logging
 import json
+import os
+import time
+from collections import OrderedDict
 from functools import wraps
+from threading import Lock
 
+import gevent
 from requests.auth import HTTPBasicAuth
 import requests
 from flask_principal import (
@@ -18,6 +24,7 @@ from flask import (
 )
 import jwt
 
+from core import config
 from core.cognito_sync import CognitoUserSync
 from core.db.models import db
 from core.dbmethods.user import (
@@ -156,11 +163,191 @@ def transform_jwks(jwks):
     return {k['kid']: k for k in jwks['keys']}
 
 
-def populate_jwk_dict():
-    current_app.config['COGNITO_JWK_DICT'] = transform_jwks(download_jwks())
+def build_public_keys(jwk_dict, sign_alg_class):
+    return {kid: sign_alg_class.from_jwk(json.dumps(jwk)) for kid, jwk in jwk_dict.items()}
+
+
+class JwksManager:
+    """
+    Keeps public keys of the Cognito user pool:
+
+    - the keys are fetched when the app is created (before workers are forked if gunicorn runs with
+      --preload) and are saved to disk, so that a cold start does not depend on Cognito
+    - each worker refreshes the keys on a background greenlet (see ``start_background_refresh()``)
+    - an unknown kid (keys were rotated) triggers an on-demand fetch; concurrent requests wait
+      for a single fetch, fetches are not repeated more often than
+      COGNITO_JWKS_MIN_FETCH_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self._app = None
+        self._public_keys = {}
+        self._last_fetch_at = None
+        self._refresher_pid = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self._public_keys = {}
+        self._last_fetch_at = None
+        self._refresher_pid = None
+
+        self._load_from_disk()
+        try:
+            self.refresh()
+        except Exception:
+            logging.exception('Failed to prefetch Cognito JWKS (%s keys loaded from disk)',
+                              len(self._public_keys))
+
+    def refresh(self):
+        with self._lock:
+            self._fetch()
+
+    def get_public_key(self, kid):
+        try:
+            return self._public_keys[kid]
+        except KeyError:
+            pass
+
+        last_fetch_at = self._last_fetch_at
+        with self._lock:
+            if self._last_fetch_at == last_fetch_at and self._can_fetch_again():
+                try:
+                    self._fetch()
+                except Exception:
+                    logging.exception('Failed to fetch Cognito JWKS for unknown kid %s', kid)
+
+        return self._public_keys[kid]
+
+    def start_background_refresh(self):
+        interval = self._app.config['COGNITO_JWKS_REFRESH_INTERVAL']
+        if not interval or self._refresher_pid == os.getpid():
+            return
+        # greenlets do not survive fork, hence one refresher per worker process
+        self._refresher_pid = os.getpid()
+        gevent.spawn(self._refresh_forever, interval)
+
+    def _refresh_forever(self, interval):
+        while True:
+            gevent.sleep(interval)
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('Failed to refresh Cognito JWKS')
+
+    def _can_fetch_again(self):
+        return self._last_fetch_at is None or (
+            time.monotonic() - self._last_fetch_at
+            >= self._app.config['COGNITO_JWKS_MIN_FETCH_INTERVAL']
+        )
+
+    def _fetch(self):
+        self._last_fetch_at = time.monotonic()
+        with self._app.app_context():
+            jwks = download_jwks()
+        self._set_jwks(jwks)
+        self._save_to_disk(jwks)
+
+    def _set_jwks(self, jwks):
+        public_keys = build_public_keys(
+            transform_jwks(jwks), self._app.config['PYJWT_SIGN_ALG_CLASS']
+        )
+        if not set(self._public_keys).issubset(public_keys):
+            # tokens verified with the keys that were removed should be verified again
+            verified_token_cache.clear()
+        self._public_keys = public_keys
+
+    def _load_from_disk(self):
+        cache_path = self._app.config['COGNITO_JWKS_CACHE_PATH']
+        if not cache_path or not os.path.exists(cache_path):
+            return
+        try:
+            with open(cache_path) as file_p:
+                self._set_jwks(json.load(file_p))
+        except Exception:
+            logging.exception('Failed to load Cognito JWKS from %s', cache_path)
+
+    def _save_to_disk(self, jwks):
+        cache_path = self._app.config['COGNITO_JWKS_CACHE_PATH']
+        if not cache_path:
+            return
+        try:
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as file_p:
+                json.dump(jwks, file_p)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            logging.exception('Failed to save Cognito JWKS to %s', cache_path)
+
+
+jwks_manager = JwksManager()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded cache of payloads of already verified tokens keyed by sha256 of the encoded token.
+    A payload is kept for no longer than ``ttl`` seconds and never after the token expires.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._payloads = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token_encoded):
+        key = _get_token_hash(token_encoded)
+        with self._lock:
+            cached = self._payloads.get(key)
+            if cached is None:
+                return None
+            if cached[1] <= time.time():
+                del self._payloads[key]
+                return None
+            self._payloads.move_to_end(key)
+            return cached[0]
+
+    def put(self, token_encoded, token_decoded):
+        expires_at = time.time() + self.ttl
+        if 'exp' in token_decoded:
+            expires_at = min(expires_at, token_decoded['exp'])
+
+        key = _get_token_hash(token_encoded)
+        with self._lock:
+            self._payloads[key] = (token_decoded, expires_at)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.max_size:
+                self._payloads.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+
+
+def _get_token_hash(token_encoded):
+    return hashlib.sha256(token_encoded.encode('utf8')).digest()
+
+
+verified_token_cache = VerifiedTokenCache(
+    config.COGNITO_VERIFIED_TOKEN_CACHE_TTL, config.COGNITO_VERIFIED_TOKEN_CACHE_SIZE
+)
 
 
 def decode_verify_jwt(token_encoded, token_uses):
+    token_decoded = verified_token_cache.get(token_encoded)
+    if token_decoded is None:
+        token_decoded = _decode_verify_jwt(token_encoded)
+        verified_token_cache.put(token_encoded, token_decoded)
+
+    if token_decoded['token_use'] not in token_uses:
+        raise jwt.InvalidTokenError('Invalid token_use')
+
+    # https://docs.aws.amazon.com/cognito/latest/developerguide/amazon-cognito-user-pools-using-tokens-verifying-a-jwt.html
+    return token_decoded
+
+
+def _decode_verify_jwt(token_encoded):
     token_header = jwt.get_unverified_header(token_encoded)
 
     if current_app.logger.isEnabledFor(logging.DEBUG):
@@ -172,20 +359,14 @@ def decode_verify_jwt(token_encoded, token_uses):
             jwt.decode(token_encoded, verify=False)
         )
 
-    jwk = current_app.config['COGNITO_JWK_DICT'][token_header['kid']]
-    public_key = current_app.config['PYJWT_SIGN_ALG_CLASS'].from_jwk(json.dumps(jwk))
-    token_decoded = jwt.decode(
+    public_key = jwks_manager.get_public_key(token_header['kid'])
+    return jwt.decode(
         token_encoded, public_key, verify=True,
         algorithms=current_app.config['JWT_SIGN_ALG_NAME'],
         # audience=current_app.config['COGNITO_APP_CLIENT_ID'],
         # (not present in access token generated by cognito)
         issuer=current_app.config['COGNITO_USER_POOL_URL']
     )
-    if token_decoded['token_use'] not in token_uses:
-        raise jwt.InvalidTokenError('Invalid token_use')
-
-    # https://docs.aws.amazon.com/cognito/latest/developerguide/amazon-cognito-user-pools-using-tokens-verifying-a-jwt.html
-    return token_decoded
 
 
 def update_user_from_cognito(
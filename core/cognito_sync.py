@@ -5,20 +5,27 @@ import boto3
 import hmac
 
 import hashlib
+from types import SimpleNamespace
 
 from core import config
 from core.db.models import db
 from core.db.models.user import User
+from core.dbmethods import get_default_wine_expert
 from core.dbmethods.user import (
+    COGNITO_USER_FIELDS,
+    NEW_USER_COGNITO_FIELDS,
+    bulk_insert_users,
     populate_most_of_cognito_fields,
     populate_cognito_display_status,
-    create_user,
 )
 from core.order import celery_app
 
 DISABLE_COGNITO_ACTION = 'disable'
 ENABLE_COGNITO_ACTION = 'enable'
 
+NOT_CONNECTED_TO_COGNITO_STATUS = 'NOT_CONNECTED_TO_COGNITO'
+NOT_FOUND_IN_COGNITO_STATUS = 'NOT_FOUND_IN_COGNITO'
+
 
 @celery_app.task
 def run_full_cognito_user_sync():
@@ -157,7 +164,17 @@ class CognitoUserSync:
 
 
 class FullCognitoUserSync:
-    def __init__(self):
+    """
+    Streams the Cognito user pool page by page: every page is matched against the database
+    users with the same subjects, absent users are inserted and the session is committed in
+    batches of COGNITO_USER_SYNC_BATCH_SIZE users. Database users that were not seen in
+    Cognito are handled by a set difference once the whole pool was listed.
+
+    Cognito fields are computed on plain column values rather than ORM objects, only the
+    changed ones are written (with bulk UPDATEs) and absent users are inserted with a single
+    INSERT per page.
+    """
+    def __init__(self, batch_size=None):
         self.successfully_updated_count = 0
         self.successfully_added_count = 0
         self.exceptions_count = 0
@@ -170,7 +187,12 @@ class FullCognitoUserSync:
             region_name=config.COGNITO_AWS_REGION,
         )
 
-        self._cognito_user_dict = {}
+        self._batch_size = batch_size or config.COGNITO_USER_SYNC_BATCH_SIZE
+        self._seen_cognito_subs = set()
+        self._processed_cognito_user_count = 0
+        self._unchanged_count = 0
+        self._uncommitted_count = 0
+        self._default_wine_expert_id = None
 
     def stats_to_dict(self):
         stats = {
@@ -194,6 +216,17 @@ class FullCognitoUserSync:
         return stats
 
     def __call__(self):
+        for cognito_users in self._iterate_cognito_user_pages():
+            self._process_cognito_user_page(cognito_users)
+        db.session.commit()
+
+        self.cognito_list_complete = True
+
+        self._process_absent_db_users()
+
+        return self
+
+    def _iterate_cognito_user_pages(self):
         list_users_parameters = {
             'UserPoolId': config.COGNITO_USER_POOL_ID,
             'AttributesToGet': ['email', 'phone_number', 'email_verified', 'phone_number_verified'],
@@ -202,190 +235,185 @@ class FullCognitoUserSync:
         cognito_list_users_resp = self._client.list_users(
             **list_users_parameters
         )
-        self._populate_cognito_user_dict(cognito_list_users_resp)
+        yield cognito_list_users_resp['Users']
         pagination_token = cognito_list_users_resp.get('PaginationToken')
         while pagination_token:
             cognito_list_users_resp = self._client.list_users(
                 PaginationToken=pagination_token,
                 **list_users_parameters
             )
-            self._populate_cognito_user_dict(cognito_list_users_resp)
+            yield cognito_list_users_resp['Users']
             pagination_token = cognito_list_users_resp.get('PaginationToken')
 
-        self.cognito_list_complete = True
-
-        self._process_cognito_user_dict()
-        self._process_absent_cognito_users()
-
-        db.session.commit()
-
-        return self
-
-    def _populate_cognito_user_dict(self, cognito_list_users_resp):
-        for cognito_user in cognito_list_users_resp['Users']:
+    def _process_cognito_user_page(self, cognito_users):
+        cognito_user_dict = {}
+        for cognito_user in cognito_users:
             cognito_sub = cognito_user.get('Username')
             if cognito_sub:
-                self._cognito_user_dict[cognito_sub] = cognito_user
+                cognito_user_dict[cognito_sub] = cognito_user
             else:
                 self.exceptions_count += 1
                 logging.warning(
                     "Failed to load cognito user ('Username' is blank): %s",
                     cognito_user
                 )
-
-    def _process_cognito_user_dict(self):
-        for user in User.query.all():
+        self._seen_cognito_subs.update(cognito_user_dict)
+
+        if cognito_user_dict:
+            self._sync_present_cognito_users(cognito_user_dict)
+
+        self._processed_cognito_user_count += len(cognito_users)
+        self._uncommitted_count += len(cognito_users)
+        if self._uncommitted_count >= self._batch_size:
+            self._commit_batch()
+
+    def _sync_present_cognito_users(self, cognito_user_dict):
+        user_rows = db.session.query(
+            User.id, User.cognito_sub, *[getattr(User, field) for field in COGNITO_USER_FIELDS]
+        ).filter(
+            User.cognito_sub.in_(list(cognito_user_dict))
+        ).order_by(User.cognito_sub).yield_per(self._batch_size)
+
+        changed_user_mappings = []
+        present_cognito_subs = set()
+        for user_row in user_rows:
+            present_cognito_subs.add(user_row.cognito_sub)
+
+            old_values = {field: getattr(user_row, field) for field in COGNITO_USER_FIELDS}
+            user_values = SimpleNamespace(**old_values)
             try:
-                if user.cognito_sub:
-                    self._sync_user_with_cognito(user)
-                else:
-                    self._mark_user_as_not_connected(user)
+                populate_most_of_cognito_fields(
+                    user_values, user_row.cognito_sub, cognito_user_dict[user_row.cognito_sub]
+                )
+                populate_cognito_display_status(user_values)
+                self.successfully_updated_count += 1
             except:
+                # whatever was populated before the exception is still saved
                 self.exceptions_count += 1
                 logging.exception(
                     'Exception while processing user with id=%s and cognito_sub=%s',
-                    user.id, user.cognito_sub
+                    user_row.id, user_row.cognito_sub
                 )
 
-    def _process_absent_cognito_users(self):
-        for absent_user_subject, absent_user in self._cognito_user_dict.items():
+            changed_values = {
+                field: value for field, value in vars(user_values).items()
+                if value != old_values[field]
+            }
+            if changed_values:
+                changed_user_mappings.append(dict(changed_values, id=user_row.id))
+            else:
+                self._unchanged_count += 1
+
+        db.session.bulk_update_mappings(User, changed_user_mappings)
+
+        absent_cognito_subs = cognito_user_dict.keys() - present_cognito_subs
+        if absent_cognito_subs:
+            self._add_absent_cognito_users(
+                {sub: cognito_user_dict[sub] for sub in absent_cognito_subs}
+            )
+
+    def _add_absent_cognito_users(self, absent_cognito_user_dict):
+        wine_expert_id = self._get_default_wine_expert_id()
+        if wine_expert_id is None:
+            self.exceptions_count += len(absent_cognito_user_dict)
+            logging.error(
+                'Default wine expert was not found - %s Cognito users were not inserted',
+                len(absent_cognito_user_dict),
+            )
+            return
+
+        new_user_values = []
+        populated_cognito_subs = set()
+        for absent_user_subject, absent_user in absent_cognito_user_dict.items():
+            logging.warning(
+                "Cognito user with subject=%s is not present in the database - inserting...",
+                absent_user_subject,
+            )
+            user_values = SimpleNamespace(email=None, phone=None, **NEW_USER_COGNITO_FIELDS)
             try:
-                logging.warning(
-                    "Cognito user with subject=%s is not present in the database - inserting...",
-                    absent_user_subject,
-                )
-                user = create_user(absent_user_subject)
-                populate_most_of_cognito_fields(user, absent_user_subject, absent_user)
-                populate_cognito_display_status(user)
-                self.successfully_added_count += 1
+                populate_most_of_cognito_fields(user_values, absent_user_subject, absent_user)
+                populate_cognito_display_status(user_values)
+                populated_cognito_subs.add(absent_user_subject)
             except:
+                # the user is still inserted with whatever was populated before the exception
                 self.exceptions_count += 1
                 logging.exception(
                     'Exception while adding user with cognito_sub=%s to the database',
                     absent_user_subject
                 )
-
-    def _sync_user_with_cognito(self, user):
-        cognito_user = self._cognito_user_dict.pop(user.cognito_sub, None)
-        if cognito_user:
-            populate_most_of_cognito_fields(user, user.cognito_sub, cognito_user)
-            populate_cognito_display_status(user)
-            self.successfully_updated_count += 1
-        else:
+            new_user_values.append(dict(
+                vars(user_values),
+                cognito_sub=absent_user_subject,
+                wine_expert_id=wine_expert_id,
+            ))
+
+        inserted_cognito_subs = bulk_insert_users(new_user_values)
+        self.successfully_added_count += len(populated_cognito_subs.intersection(inserted_cognito_subs))
+        if len(inserted_cognito_subs) < len(new_user_values):
             logging.warning(
-                "Database user with id=%s and cognito_sub=%s was not found in Cognito",
-                user.id, user.cognito_sub,
+                '%s Cognito users were inserted into the database concurrently - '
+                'they will be synced next time',
+                len(new_user_values) - len(inserted_cognito_subs),
             )
-            if self.cognito_list_complete:
-                user.exists_in_cognito = False
-                user.cognito_enabled = False
-                user.cognito_status = 'NOT_FOUND_IN_COGNITO'
 
-                populate_cognito_display_status(user)
-                self.not_found_in_cognito_count += 1
+    def _get_default_wine_expert_id(self):
+        if self._default_wine_expert_id is None:
+            wine_expert = get_default_wine_expert()
+            if wine_expert is not None:
+                self._default_wine_expert_id = wine_expert.id
+        return self._default_wine_expert_id
 
-    def _mark_user_as_not_connected(self, user):
-        logging.warning(
-            "Database user with id=%s doesn't have cognito_sub assigned",
-            user.id,
+    def _commit_batch(self):
+        db.session.commit()
+        self._uncommitted_count = 0
+        logging.info(
+            'Full Cognito user sync progress: %s Cognito users processed '
+            '(%s updated, %s of them unchanged, %s added, %s exceptions)',
+            self._processed_cognito_user_count,
+            self.successfully_updated_count,
+            self._unchanged_count,
+            self.successfully_added_count,
+            self.exceptions_count,
         )
-        user.exists_in_cognito = False
-        user.cognito_enabled = False
-        user.cognito_status = 'NOT_CONNECTED_TO_COGNITO'
-        populate_cognito_display_status(user)
-        self.not_connected_to_cognito_count += 1
-
-
-
 
+    def _process_absent_db_users(self):
+        not_connected_user_ids = []
+        not_found_user_ids = []
+        user_rows = db.session.query(
+            User.id, User.cognito_sub, User.cognito_status
+        ).order_by(User.id).yield_per(self._batch_size)
+        for user_id, cognito_sub, cognito_status in user_rows:
+            if not cognito_sub:
+                logging.warning(
+                    "Database user with id=%s doesn't have cognito_sub assigned",
+                    user_id,
+                )
+                self.not_connected_to_cognito_count += 1
+                if cognito_status != NOT_CONNECTED_TO_COGNITO_STATUS:
+                    not_connected_user_ids.append(user_id)
+            elif cognito_sub not in self._seen_cognito_subs:
+                logging.warning(
+                    "Database user with id=%s and cognito_sub=%s was not found in Cognito",
+                    user_id, cognito_sub,
+                )
+                self.not_found_in_cognito_count += 1
+                if cognito_status != NOT_FOUND_IN_COGNITO_STATUS:
+                    not_found_user_ids.append(user_id)
 
-class FullCognitoUserSync:
-    def __init__(self):
-        self.successfully_updated_count = 0
-        self.successfully_added_count = 0
-        self.exceptions_count = 0
-        self.not_connected_to_cognito_count = 0
-        self.not_found_in_cognito_count = 0
-        self.cognito_list_complete = False
-
-        self._client = boto3.client(
-            'cognito-idp',
-            region_name=config.COGNITO_AWS_REGION,
-        )
-
-        self._cognito_user_dict = {}
+        self._mark_users_as_absent(not_connected_user_ids, NOT_CONNECTED_TO_COGNITO_STATUS)
+        self._mark_users_as_absent(not_found_user_ids, NOT_FOUND_IN_COGNITO_STATUS)
 
-    def stats_to_dict(self):
-        stats = {
-            'successfully_updated_count': self.successfully_updated_count,
-            'successfully_added_count': self.successfully_added_count,
-            'not_connected_to_cognito_count': self.not_connected_to_cognito_count,
-            'not_found_in_cognito_count': self.not_found_in_cognito_count,
-            'exceptions_count': self.exceptions_count,
-            'cognito_list_complete': self.cognito_list_complete,
-        }
-        logging.info(
-            'Full Cognito user sync results: '
-            'successfully_updated_count=%(successfully_updated_count)r; '
-            'successfully_added_count=%(successfully_added_count)r; '
-            'not_connected_to_cognito_count=%(not_connected_to_cognito_count)r; '
-            'not_found_in_cognito_count=%(not_found_in_cognito_count)r; '
-            'exceptions_count=%(exceptions_count)r; '
-            'cognito_list_complete=%(cognito_list_complete)r',
-            stats
+    def _mark_users_as_absent(self, user_ids, cognito_status):
+        user_values = SimpleNamespace(
+            exists_in_cognito=False,
+            cognito_enabled=False,
+            cognito_status=cognito_status,
         )
-        return stats
-
-    def __call__(self):
-        list_users_parameters = {
-            'UserPoolId': config.COGNITO_USER_POOL_ID,
-            'AttributesToGet': ['email', 'phone_number', 'email_verified', 'phone_number_verified'],
-        }
+        populate_cognito_display_status(user_values)
 
-        cognito_list_users_resp = self._client.list_users(
-            **list_users_parameters
-        )
-        self._populate_cognito_user_dict(cognito_list_users_resp)
-        pagination_token = cognito_list_users_resp.get('PaginationToken')
-        while pagination_token:
-            cognito_list_users_resp = self._client.list_users(
-                PaginationToken=pagination_token,
-                **list_users_parameters
+        for i in range(0, len(user_ids), self._batch_size):
+            user_id_chunk = user_ids[i:i + self._batch_size]
+            User.query.filter(User.id.in_(user_id_chunk)).update(
+                vars(user_values), synchronize_session=False
             )
-            self._populate_cognito_user_dict(cognito_list_users_resp)
-            pagination_token = cognito_list_users_resp.get('PaginationToken')
-
-        self.cognito_list_complete = True
-
-        self._process_cognito_user_dict()
-        self._process_absent_cognito_users()
-
-        db.session.commit()
-
-        return self
-
-    def _populate_cognito_user_dict(self, cognito_list_users_resp):
-        for cognito_user in cognito_list_users_resp['Users']:
-            cognito_sub = cognito_user.get('Username')
-            if cognito_sub:
-                self._cognito_user_dict[cognito_sub] = cognito_user
-            else:
-                self.exceptions_count += 1
-                logging.warning(
-                    "Failed to load cognito user ('Username' is blank): %s",
-                    cognito_user
-                )
-
-    def _process_cognito_user_dict(self):
-        for user in User.query.all():
-            try:
-                if user.cognito_sub:
-                    self._sync_user_with_cognito(user)
-                else:
-                    self._mark_user_as_not_connected(user)
-            except:
-                self.exceptions_count += 1
-                logging.exception(
-                    'Exception while processing user with id=%s and cognito_sub=%s',
-                    user.id, user.cognito_sub
-                )
+            db.session.commit()
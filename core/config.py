@@ -6,6 +6,7 @@ from os import (
     environ,
 )
 from pathlib import Path
+from tempfile import gettempdir
 import jwt
 
 DEBUG = bool(strtobool(getenv('DEBUG', 'True')))  # set DEBUG=False in production
@@ -13,23 +14,81 @@ TESTING = bool(strtobool(getenv('TESTING', 'False')))
 SQLALCHEMY_ECHO = bool(strtobool(getenv('SQLALCHEMY_ECHO', 'False')))
 LOG_GQL = bool(strtobool(getenv('LOG_GQL', 'True')))
 
+# Max number of parsed and validated GraphQL documents (incl. persisted queries) kept in memory
+GRAPHQL_QUERY_CACHE_SIZE = int(getenv('GRAPHQL_QUERY_CACHE_SIZE', '1000'))
+# Max number of memoized lists of SQLAlchemy loader options (see core.graphql.schemas.optimize_resolve)
+GRAPHQL_QUERY_OPTIONS_CACHE_SIZE = int(getenv('GRAPHQL_QUERY_OPTIONS_CACHE_SIZE', '5000'))
+# totalCount of admin lists is cached for this many seconds (0 disables the cache)
+GRAPHQL_TOTAL_COUNT_CACHE_TTL = float(getenv('GRAPHQL_TOTAL_COUNT_CACHE_TTL', '30'))
+GRAPHQL_TOTAL_COUNT_CACHE_SIZE = int(getenv('GRAPHQL_TOTAL_COUNT_CACHE_SIZE', '1000'))
+# responses to queries of anonymous users (M3_SECRET) are cached for this many seconds
+# (0 disables the cache)
+GRAPHQL_RESPONSE_CACHE_TTL = float(getenv('GRAPHQL_RESPONSE_CACHE_TTL', '60'))
+GRAPHQL_RESPONSE_CACHE_SIZE = int(getenv('GRAPHQL_RESPONSE_CACHE_SIZE', '1000'))
+# wall time and SQL statements of every resolver are aggregated by resolver path (see /metrics);
+# admins may ask for the timings of a request with "extensions": {"tracing": true}
+GRAPHQL_TRACING = bool(strtobool(getenv('GRAPHQL_TRACING', 'True')))
+GRAPHQL_TRACING_MAX_PATHS = int(getenv('GRAPHQL_TRACING_MAX_PATHS', '5000'))
+
 BASE_PATH = Path(__file__).parents[1]
 
 SQLALCHEMY_DATABASE_URI = getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + str(
     BASE_PATH / 'temporary-m3-database.sqlite3'))  # switch to PostgreSQL
-SQLALCHEMY_POOL_SIZE = 50
+# psycopg2 waits for the server cooperatively (psycogreen), so that a slow query blocks only
+# its own greenlet and not every request of the gevent worker
+DB_COOPERATIVE = bool(strtobool(getenv('DB_COOPERATIVE', 'True')))
+# every process connecting to the database has pools of its own, so the connections of all of
+# them must fit into max_connections of PostgreSQL (minus superuser_reserved_connections):
+#   DB_WEB_PROCESSES * (SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW)
+#   + DB_CELERY_PROCESSES * (CELERY_SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW)
+#   <= DB_MAX_CONNECTIONS
+# the Celery processes get what their largest task needs and the gunicorn workers share the rest
+# (without overflow by default). A gevent worker serves many requests at once, each holding
+# a connection until the end of the request; a request waits for SQLALCHEMY_POOL_TIMEOUT seconds
+# at most. The replica (if set) has pools of the same size of its own.
+DB_MAX_CONNECTIONS = int(getenv('DB_MAX_CONNECTIONS', '95'))
+# gunicorn --workers (see Dockerfile)
+DB_WEB_PROCESSES = int(getenv('DB_WEB_PROCESSES', '4'))
+# processes of celery_worker (-c 2) and celery_worker_external (-c 4) and celery beat
+# (see docker-compose.yml)
+DB_CELERY_PROCESSES = int(getenv('DB_CELERY_PROCESSES', '7'))
+# a Celery process runs one task at a time - run_orders holds two connections per greenlet
+# (2 * ORDER_SCHEDULER_CONCURRENCY)
+CELERY_SQLALCHEMY_POOL_SIZE = int(getenv('CELERY_SQLALCHEMY_POOL_SIZE', '10'))
+SQLALCHEMY_POOL_SIZE = int(getenv('SQLALCHEMY_POOL_SIZE', str(max(
+    1, (DB_MAX_CONNECTIONS - DB_CELERY_PROCESSES * CELERY_SQLALCHEMY_POOL_SIZE) // DB_WEB_PROCESSES
+))))
+SQLALCHEMY_MAX_OVERFLOW = int(getenv('SQLALCHEMY_MAX_OVERFLOW', '0'))
+SQLALCHEMY_POOL_TIMEOUT = int(getenv('SQLALCHEMY_POOL_TIMEOUT', '10'))
+SQLALCHEMY_POOL_RECYCLE = int(getenv('SQLALCHEMY_POOL_RECYCLE', '3600'))
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# GraphQL queries read from this replica if it is set
+SQLALCHEMY_REPLICA_URI = getenv('SQLALCHEMY_REPLICA_URI')
+SQLALCHEMY_BINDS = {'replica': SQLALCHEMY_REPLICA_URI} if SQLALCHEMY_REPLICA_URI else None
 
 COGNITO_AWS_REGION = environ['COGNITO_AWS_REGION']
 COGNITO_USER_POOL_ID = environ['COGNITO_USER_POOL_ID']
 
 COGNITO_USER_POOL_URL = f'https://cognito-idp.{COGNITO_AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
 COGNITO_JWKS_URL = COGNITO_USER_POOL_URL + '/.well-known/jwks.json'
+# JWKS is refreshed in the background every COGNITO_JWKS_REFRESH_INTERVAL seconds (0 disables)
+COGNITO_JWKS_REFRESH_INTERVAL = int(getenv('COGNITO_JWKS_REFRESH_INTERVAL', '3600'))
+# unknown kid does not trigger a new fetch more often than this
+COGNITO_JWKS_MIN_FETCH_INTERVAL = int(getenv('COGNITO_JWKS_MIN_FETCH_INTERVAL', '30'))
+# JWKS saved on disk to be used upon cold start if Cognito is unavailable (empty disables)
+COGNITO_JWKS_CACHE_PATH = getenv(
+    'COGNITO_JWKS_CACHE_PATH', str(Path(gettempdir()) / 'm3-cognito-jwks.json')
+)
 
 JWT_SIGN_ALG_NAME = 'RS256'
 PYJWT_SIGN_ALG_CLASS = jwt.algorithms.RSAAlgorithm
+# verified access tokens are not verified again for this many seconds (or until they expire)
+COGNITO_VERIFIED_TOKEN_CACHE_TTL = int(getenv('COGNITO_VERIFIED_TOKEN_CACHE_TTL', '300'))
+COGNITO_VERIFIED_TOKEN_CACHE_SIZE = int(getenv('COGNITO_VERIFIED_TOKEN_CACHE_SIZE', '10000'))
 
 COGNITO_USER_SYNC_CRON_EXP = getenv('COGNITO_USER_SYNC_CRON_EXP', '0 11 * * *')
+# full Cognito user sync commits (and logs its progress) every COGNITO_USER_SYNC_BATCH_SIZE users
+COGNITO_USER_SYNC_BATCH_SIZE = int(getenv('COGNITO_USER_SYNC_BATCH_SIZE', '500'))
 
 M3_SECRET = environ['M3_SECRET']
 M3_SYSTEM_SECRET = environ['M3_SYSTEM_SECRET']
@@ -57,12 +116,52 @@ AWS_DEFAULT_REGION = getenv('AWS_DEFAULT_REGION', 'us-east-1')
 
 SEARCH_API_URL = getenv('SEARCH_API_URL', '')
 INTEGRATION_API_URL = getenv('INTEGRATION_API_URL', '')
+# pooled HTTP clients of the search and integration APIs (timeouts are in seconds)
+HTTP_CLIENT_POOL_SIZE = int(getenv('HTTP_CLIENT_POOL_SIZE', '20'))
+HTTP_CLIENT_CONNECT_TIMEOUT = float(getenv('HTTP_CLIENT_CONNECT_TIMEOUT', '5'))
+HTTP_CLIENT_READ_TIMEOUT = float(getenv('HTTP_CLIENT_READ_TIMEOUT', '60'))
+INTEGRATION_API_READ_TIMEOUT = float(getenv('INTEGRATION_API_READ_TIMEOUT', '300'))
+HTTP_CLIENT_MAX_RETRIES = int(getenv('HTTP_CLIENT_MAX_RETRIES', '2'))
+HTTP_CLIENT_RETRY_BACKOFF = float(getenv('HTTP_CLIENT_RETRY_BACKOFF', '0.5'))
+# the circuit opens after HTTP_CLIENT_BREAKER_FAILURE_THRESHOLD consecutive failures
+# and lets a trial request through after HTTP_CLIENT_BREAKER_RESET_TIMEOUT seconds
+HTTP_CLIENT_BREAKER_FAILURE_THRESHOLD = int(getenv('HTTP_CLIENT_BREAKER_FAILURE_THRESHOLD', '5'))
+HTTP_CLIENT_BREAKER_RESET_TIMEOUT = float(getenv('HTTP_CLIENT_BREAKER_RESET_TIMEOUT', '30'))
+# shipping and tax rates are served from an in-process index that checks the rate tables for
+# changes at most every RATE_INDEX_CHECK_INTERVAL seconds (0 disables the index)
+RATE_INDEX_CHECK_INTERVAL = int(getenv('RATE_INDEX_CHECK_INTERVAL', '60'))
+# master products and sources used to build product offers are cached for this many seconds
+# (0 disables the cache)
+CATALOG_CACHE_TTL = float(getenv('CATALOG_CACHE_TTL', '600'))
+CATALOG_CACHE_SIZE = int(getenv('CATALOG_CACHE_SIZE', '10000'))
+# ... and dropped when an integration sync changes them (checked at most every
+# CATALOG_CACHE_CHECK_INTERVAL seconds)
+CATALOG_CACHE_CHECK_INTERVAL = int(getenv('CATALOG_CACHE_CHECK_INTERVAL', '30'))
+# themes, theme groups and domain cards are served from an in-process snapshot that checks the
+# catalog tables for changes at most every CATALOG_SNAPSHOT_CHECK_INTERVAL seconds (0 disables it)
+CATALOG_SNAPSHOT_CHECK_INTERVAL = int(getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL', '30'))
 
 EMAIL_SENDER = getenv('EMAIL_SENDER', 'Magia <support@magia.ai>')
 SES_CONFIGURATION_SET_NAME = getenv('SES_CONFIGURATION_SET_NAME', 'send_mail_set')
 
 # Celery
 CELERY_BROKER_URL = getenv('CELERY_BROKER_URL', 'redis://redis')
+CELERY_TASK_ALWAYS_EAGER = bool(strtobool(getenv('CELERY_TASK_ALWAYS_EAGER', 'False')))  # (tests)
+# order actions calling external services (search API, SES, Stripe) run on this queue
+ORDER_EXTERNAL_QUEUE = getenv('ORDER_EXTERNAL_QUEUE', 'orders_external')
+# a run_order task hands the remaining actions of the order over to a new task
+# once it has been running for ORDER_STEP_TIME_BUDGET seconds
+ORDER_STEP_TIME_BUDGET = float(getenv('ORDER_STEP_TIME_BUDGET', '30'))
+# an order waiting in a queue is not enqueued again (the mark expires after this many seconds
+# in case the task is lost)
+ORDER_ENQUEUE_DEDUP_TTL = int(getenv('ORDER_ENQUEUE_DEDUP_TTL', '600'))
+# run_scheduled_orders enqueues at most ORDER_SCHEDULER_MAX_ORDERS_PER_RUN orders per beat tick
+# (the rest wait for the next tick) in tasks of ORDER_SCHEDULER_CHUNK_SIZE orders
+ORDER_SCHEDULER_MAX_ORDERS_PER_RUN = int(getenv('ORDER_SCHEDULER_MAX_ORDERS_PER_RUN', '2000'))
+ORDER_SCHEDULER_CHUNK_SIZE = int(getenv('ORDER_SCHEDULER_CHUNK_SIZE', '10'))
+# orders of a chunk are run concurrently by up to ORDER_SCHEDULER_CONCURRENCY greenlets (each
+# holds two connections of the pool - its session and the execution lock of its order)
+ORDER_SCHEDULER_CONCURRENCY = int(getenv('ORDER_SCHEDULER_CONCURRENCY', '5'))
 
 # Stripe
 STRIPE_SECRET_KEY = getenv('STRIPE_SECRET_KEY', 'sk_test_sGPjOMBUtH2YDEBEGji5C67j')
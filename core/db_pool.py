@@ -0,0 +1,33 @@
+# pylint: disable=unused-argument
+import os
+
+from sqlalchemy import (
+    event,
+    exc,
+)
+from sqlalchemy.pool import Pool
+
+
+def _remember_connection_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+def _discard_connection_of_another_process(dbapi_connection, connection_record, connection_proxy):
+    """
+    A connection opened before gunicorn (with --preload) forked the worker is shared with
+    the parent and the other workers - it is dropped (and the pool opens a new one) instead of
+    being used by two processes at once.
+    """
+    if connection_record.info['pid'] != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            'Connection record belongs to pid %s, attempting to check out in pid %s' % (
+                connection_record.info['pid'], os.getpid()
+            )
+        )
+
+
+def register_fork_safe_pool():
+    if not event.contains(Pool, 'connect', _remember_connection_pid):
+        event.listen(Pool, 'connect', _remember_connection_pid)
+        event.listen(Pool, 'checkout', _discard_connection_of_another_process)
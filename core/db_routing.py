@@ -0,0 +1,81 @@
+# pylint: disable=protected-access
+from contextlib import contextmanager
+
+from flask import (
+    _app_ctx_stack,
+    g,
+    has_app_context,
+)
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+
+def _is_read_only():
+    return (
+        has_app_context() and
+        g.get('m3_db_read_only', False) and
+        not g.get('m3_db_primary_sticky', False)
+    )
+
+
+def stick_to_primary():
+    """
+    Read-your-writes: once the request (app context) has written anything, it reads from
+    the primary till the end.
+    """
+    if has_app_context():
+        g.m3_db_primary_sticky = True
+
+
+@contextmanager
+def read_only_db():
+    """
+    SELECT statements are sent to the replica bind (if SQLALCHEMY_BINDS has one) while in
+    the block. Anything else (flushes, DML, locking selects) still goes to the primary
+    and makes the rest of the request stick to it.
+    """
+    previous = g.get('m3_db_read_only', False)
+    g.m3_db_read_only = True
+    try:
+        yield
+    finally:
+        g.m3_db_read_only = previous
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self._db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or clause is not None and not isinstance(clause, Select):
+            stick_to_primary()
+        elif (
+                isinstance(clause, Select) and
+                clause._for_update_arg is None and
+                _is_read_only() and
+                REPLICA_BIND in (self.app.config.get('SQLALCHEMY_BINDS') or ())
+        ):
+            return self._db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+def reset_db_routing():
+    """
+    Called at the beginning of every Celery task - the tasks of a worker share one app context.
+    """
+    g.pop('m3_db_read_only', None)
+    g.pop('m3_db_primary_sticky', None)
+
+
+def register_session_routing(db):
+    if issubclass(db.session.session_factory.class_, RoutingSession):
+        return
+    db.session = orm.scoped_session(
+        orm.sessionmaker(class_=RoutingSession, db=db, query_cls=db.Query),
+        scopefunc=_app_ctx_stack.__ident_func__,
+    )
@@ -30,6 +30,11 @@ from core.db.models.source_location import SourceLocation
 from core.db.models.salestax_rate import SalestaxRate
 from core.db.models.user_subscription import UserSubscription
 from core.db.models.user_subscription_snapshot import UserSubscriptionSnapshot
+from core.dbmethods.rates import (
+    query_source_rates,
+    rate_index,
+    to_postcode_number,
+)
 
 USA_STATES_POSTCODE = {
     'Alabama': 'AL',
@@ -117,9 +122,16 @@ def state_to_postcode(state_name):
     return USA_STATES_POSTCODE.get(state_name)
 
 
-def get_orders_to_run():
-    orders = db.session.query(
-        Order
+def claim_order_ids_to_run(limit=None):
+    """
+    Returns a query of ids of the orders that are due (the longest waiting first). The rows are
+    locked with FOR UPDATE SKIP LOCKED, so until the caller ends the transaction concurrent
+    callers skip them instead of getting the same orders. The lock ends with the transaction -
+    the caller keeps the claim of the enqueued orders with core.order.locks.claim_order_enqueue()
+    until their tasks start.
+    """
+    query = db.session.query(
+        Order.id
     ).join(
         Order.subscription
     ).filter(
@@ -129,12 +141,16 @@ def get_orders_to_run():
             UserSubscription.state == SUBSCRIPTION_ACTIVE_STATE,
             Order.state != STARTED_STATE
         ),
-    ).all()
-    db.session.close()
-    return orders
+    ).order_by(
+        Order.scheduled_for, Order.id
+    ).with_for_update(skip_locked=True, of=Order)
+    if limit:
+        query = query.limit(limit)
+    return query
 
 
 def get_timed_out_orders():
+    # read from the primary - the orders are marked as timed out right away
     orders = db.session.query(
         Order
     ).join(
@@ -229,31 +245,85 @@ def create_order(user_id, subscription_id, scheduled_for=None):
     return order
 
 
+# The parent history lookups below (and the order history of the admin UI) rely on
+#     CREATE INDEX ix_order_history_order_id_created_at ON order_history (order_id, created_at);
+# which turns them into an index scan of the order's rows instead of a sort.
+
+
 def move_order(order, action, state, exception_msg=None):
+    utcnow = datetime.utcnow()
     order.action = action
     order.state = state
     order.scheduled_for = None
     order.exception_message = exception_msg
+    order.state_changed_at = utcnow
 
-    parent_order_history = db.session.query(OrderHistory).filter_by(
-        order_id=order.id
-    ).order_by(OrderHistory.created_at.desc()).first()
+    # the parent is looked up by a subquery of the INSERT itself
+    parent_order_history_id = db.session.query(OrderHistory.id).filter(
+        OrderHistory.order_id == order.id
+    ).order_by(OrderHistory.created_at.desc()).limit(1).as_scalar()
 
     order_history = OrderHistory(
         order_id=order.id,
         state=order.state,
-        parent_id=parent_order_history.id,
-        exception_message=exception_msg
+        parent_id=parent_order_history_id,
+        exception_message=exception_msg,
+        created_at=utcnow,
     )
 
     db.session.add(order_history)
-    db.session.flush()
-    order.state_changed_at = order_history.created_at
     db.session.commit()
 
     return order
 
 
+def move_orders(transitions):
+    """
+    Bulk version of move_order(): transitions are (order_id, action, state, exception_msg)
+    tuples. History rows are inserted in bulk and orders are updated with one UPDATE per
+    (action, state, exception_msg) group.
+    """
+    if not transitions:
+        return
+
+    order_ids = [order_id for order_id, _, _, _ in transitions]
+    parent_order_history_ids = dict(db.session.query(
+        OrderHistory.order_id, OrderHistory.id
+    ).filter(
+        OrderHistory.order_id.in_(order_ids)
+    ).distinct(
+        OrderHistory.order_id
+    ).order_by(
+        OrderHistory.order_id, OrderHistory.created_at.desc()
+    ))
+
+    utcnow = datetime.utcnow()
+    db.session.bulk_insert_mappings(OrderHistory, [
+        {
+            'order_id': order_id,
+            'state': state,
+            'parent_id': parent_order_history_ids.get(order_id),
+            'exception_message': exception_msg,
+            'created_at': utcnow,
+        } for order_id, _, state, exception_msg in transitions
+    ])
+
+    order_ids_by_transition = {}
+    for order_id, action, state, exception_msg in transitions:
+        order_ids_by_transition.setdefault((action, state, exception_msg), []).append(order_id)
+
+    for (action, state, exception_msg), transition_order_ids in order_ids_by_transition.items():
+        db.session.query(Order).filter(Order.id.in_(transition_order_ids)).update({
+            Order.action: action,
+            Order.state: state,
+            Order.scheduled_for: None,
+            Order.exception_message: exception_msg,
+            Order.state_changed_at: utcnow,
+        }, synchronize_session=False)
+
+    db.session.commit()
+
+
 def get_wine_expert_for_order(order_id):
     expert = aliased(User)
 
@@ -282,14 +352,40 @@ def save_device_token(user_id, token):
     db.session.commit()
 
 
+def _use_rate_index(postcode_number):
+    return bool(config.RATE_INDEX_CHECK_INTERVAL) and postcode_number is not None
+
+
+def get_source_rates(source_ids, bottle_qty, postcode):
+    """
+    Returns {source_id: (shipping_cost, tax_rate)} of the sources that have both
+    the shipping cost of bottle_qty bottles and the tax rate for the postcode.
+    """
+    postcode_number = to_postcode_number(postcode)
+    try:
+        if _use_rate_index(postcode_number):
+            return rate_index.get_source_rates(source_ids, bottle_qty, postcode_number)
+        return query_source_rates(source_ids, bottle_qty, postcode)
+    except Exception as e:
+        logging.exception(
+            'Error when getting rates for sources: %s, postcode: %s, bottle_qty: %s, %s' %
+            (source_ids, postcode, bottle_qty, e)
+        )
+        raise
+
+
 def get_shipping_cost(source_id, bottle_qty, postcode):
+    postcode_number = to_postcode_number(postcode)
     try:
-        shipping_cost = db.session.query(ShippingRate.shipping_cost).join(SourceLocation).filter(
-            SourceLocation.source_id == source_id,
-            ShippingRate.bottle_qty == bottle_qty,
-            ShippingRate.from_postcode <= postcode,
-            ShippingRate.to_postcode >= postcode
-        ).first()
+        if _use_rate_index(postcode_number):
+            shipping_cost = rate_index.get_shipping_cost(source_id, bottle_qty, postcode_number)
+        else:
+            shipping_cost = db.session.query(ShippingRate.shipping_cost).join(SourceLocation).filter(
+                SourceLocation.source_id == source_id,
+                ShippingRate.bottle_qty == bottle_qty,
+                ShippingRate.from_postcode <= postcode,
+                ShippingRate.to_postcode >= postcode
+            ).limit(1).scalar()
     except Exception as e:
         logging.exception(
             'Error when getting shipping cost for source: %s, postcode: %s, bottle_qty: %s, %s' %
@@ -303,16 +399,20 @@ def get_shipping_cost(source_id, bottle_qty, postcode):
             (source_id, postcode, bottle_qty)
         )
 
-    return shipping_cost[0]
+    return shipping_cost
 
 
 def get_tax_rate(source_id, postcode):
+    postcode_number = to_postcode_number(postcode)
     try:
-        tax_rate = db.session.query(SalestaxRate.taxrate).join(SourceLocation).filter(
-            SourceLocation.source_id == source_id,
-            SalestaxRate.from_postcode <= postcode,
-            SalestaxRate.to_postcode >= postcode
-        ).first()
+        if _use_rate_index(postcode_number):
+            tax_rate = rate_index.get_tax_rate(source_id, postcode_number)
+        else:
+            tax_rate = db.session.query(SalestaxRate.taxrate).join(SourceLocation).filter(
+                SourceLocation.source_id == source_id,
+                SalestaxRate.from_postcode <= postcode,
+                SalestaxRate.to_postcode >= postcode
+            ).limit(1).scalar()
     except Exception as e:
         logging.exception(
             'Error when getting tax rate for source: %s, postcode: %s, %s' %
@@ -326,21 +426,27 @@ def get_tax_rate(source_id, postcode):
             (source_id, postcode)
         )
 
-    return tax_rate[0]
+    return tax_rate
 
 
 def get_sources_budget(sources, budget, bottle_qty, postcode):
+    try:
+        source_rates = get_source_rates(sources, bottle_qty, postcode)
+    except Exception:
+        # logged by get_source_rates() - the sources are skipped, the search goes on without them
+        return {}
+
     res = {}
     for source_id in sources:
         try:
-            shipping_cost = get_shipping_cost(source_id, bottle_qty, postcode)
-            tax_rate = get_tax_rate(source_id, postcode)
-
-            res[source_id] = int((budget - shipping_cost) / (1 + tax_rate))
-        except Exception:
-            logging.exception(
-                'Error when getting shipping or tax rates for source: %s' % source_id
+            shipping_cost, tax_rate = source_rates[source_id]
+        except KeyError:
+            logging.error(
+                'Shipping cost or tax rate not found for source: %s, postcode: %s, bottle_qty: %s',
+                source_id, postcode, bottle_qty,
             )
+        else:
+            res[source_id] = int((budget - shipping_cost) / (1 + tax_rate))
 
     return res
 
@@ -0,0 +1,124 @@
+#
+# pylint: disable=no-member,invalid-name
+import time
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+from threading import Lock
+
+from core import config
+from core.db.models import db
+from core.db.models.master_product import MasterProduct
+from core.db.models.source import Source
+from core.sql_stats import get_table_change_count_query
+
+# plain rows, so that cached values never get attached to (or expire with) a session
+MasterProductRow = namedtuple('MasterProductRow', 'id source_id')
+SourceRow = namedtuple('SourceRow', 'id name')
+
+MASTER_PRODUCT_KEY = 'master_product'
+SOURCE_KEY = 'source'
+
+# changes whenever an integration sync writes master products or sources
+CATALOG_CACHE_VERSION_QUERY = get_table_change_count_query(
+    MasterProduct.__tablename__,
+    Source.__tablename__,
+)
+
+
+class CatalogCache:
+    """
+    Read-through cache of the catalog rows used while building product offers. The cache is
+    process-local. Integration syncs run in the integration service and finish after
+    RunPipelineSequence has returned, so every process drops its rows when
+    CATALOG_CACHE_VERSION_QUERY (checked at most every check_interval seconds) changes - that is
+    when a sync has finished writing. Rows also expire after ttl seconds.
+    """
+
+    def __init__(self, ttl, max_size, check_interval):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._rows = OrderedDict()
+        self._version = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def get_master_product(self, master_product_id):
+        query = db.session.query(MasterProduct.id, MasterProduct.source_id).filter(
+            MasterProduct.id == master_product_id
+        )
+        return self._get_or_load((MASTER_PRODUCT_KEY, master_product_id), query, MasterProductRow)
+
+    def get_source(self, source_id):
+        query = db.session.query(Source.id, Source.name).filter(Source.id == source_id)
+        return self._get_or_load((SOURCE_KEY, source_id), query, SourceRow)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._version = None
+            self._checked_at = None
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats_to_dict(self):
+        return {
+            'size': len(self._rows),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'check_interval': self.check_interval,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+    def _drop_if_changed(self, now):
+        # called with the lock held
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+
+        version = tuple(db.session.execute(CATALOG_CACHE_VERSION_QUERY).first())
+        if version != self._version:
+            if self._version is not None:
+                self._rows.clear()
+                self.invalidations += 1
+            self._version = version
+        self._checked_at = now
+
+    def _get_or_load(self, key, query, row_class):
+        now = time.monotonic()
+        with self._lock:
+            if self.ttl > 0:
+                self._drop_if_changed(now)
+            cached = self._rows.get(key)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                self._rows.move_to_end(key)
+                return cached[0]
+
+        row = query.first()
+
+        with self._lock:
+            self.misses += 1
+            if row is None:
+                # unknown rows are not cached - they may be created by the next sync
+                return None
+            row = row_class(*row)
+            if self.ttl > 0:
+                self._rows[key] = (row, now + self.ttl)
+                self._rows.move_to_end(key)
+                while len(self._rows) > self.max_size:
+                    self._rows.popitem(last=False)
+        return row
+
+
+catalog_cache = CatalogCache(
+    config.CATALOG_CACHE_TTL, config.CATALOG_CACHE_SIZE, config.CATALOG_CACHE_CHECK_INTERVAL
+)
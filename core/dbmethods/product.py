@@ -1,6 +1,5 @@
 # pylint: disable=no-member
 
-import requests
 from decimal import Decimal
 
 from sqlalchemy import text
@@ -11,23 +10,20 @@ from core import (
     to_decimal,
 )
 from core.db.models import db
-from core.db.models.master_product import MasterProduct
 from core.db.models.product_offer import ProductOffer
 from core.db.models.offer_item import OfferItem
-from core.db.models.source import Source
+from core.db.models.pipeline_review_content import PipelineReviewContent
 from core.db.models.order import Order
 from core.dbmethods import (
     get_order,
     get_shipping_cost,
     get_tax_rate,
 )
+from core.dbmethods.catalog import catalog_cache
+from core.http_client import search_api_client
 from core.order.exceptions import OrderException
 
 
-def get_master_product(master_product_id):
-    return db.session.query(MasterProduct).filter_by(id=master_product_id).first()
-
-
 def get_priority(products):
     """Returns dict of {offer index (position in products list): priority}"""
     product_scores = []
@@ -58,7 +54,7 @@ def get_product_by_sku(sku):
     m_product_id, source_id = res
     url = (config.SEARCH_API_URL +
            f'/api/search/{source_id}/product_data/{m_product_id}')
-    response = requests.get(url)
+    response = search_api_client.get(url)
     if response.status_code != 200:
         raise OrderException(response.text)
     res = response.json()['data']
@@ -66,8 +62,33 @@ def get_product_by_sku(sku):
     return res
 
 
-def create_offer_item_from_dict(product_dict, product_offer_id):
-    offer_item = OfferItem(
+def get_prof_reviews(master_product_ids):
+    """
+    Returns {master_product_id: prof_reviews} fetched with one query
+    (reviews without a score are skipped, the reviews of a product are in the order of
+    the OfferItem.product_reviews relationship).
+    """
+    prof_reviews = {master_product_id: [] for master_product_id in master_product_ids}
+    reviews = db.session.query(
+        PipelineReviewContent.master_product_id,
+        PipelineReviewContent.reviewer_name,
+        PipelineReviewContent.review_score,
+    ).filter(
+        PipelineReviewContent.master_product_id.in_(prof_reviews.keys())
+    ).order_by(
+        *(OfferItem.product_reviews.property.order_by or ())
+    )
+    for master_product_id, reviewer_name, review_score in reviews:
+        if review_score:
+            prof_reviews[master_product_id].append({
+                'name': reviewer_name,
+                'score': to_int(review_score)
+            })
+    return prof_reviews
+
+
+def _get_offer_item_values(product_dict, product_offer_id, prof_reviews):
+    return dict(
         product_offer_id=product_offer_id,
         master_product_id=product_dict['master_product_id'],
         name=product_dict.get('wine_name') or '',
@@ -83,20 +104,32 @@ def create_offer_item_from_dict(product_dict, product_offer_id):
         product_url=product_dict.get('product_url'),
         highlights=product_dict.get('highlights'),
         varietals=product_dict.get('varietals'),
-        best_theme_id=to_int(product_dict.get('best_theme'))
+        best_theme_id=to_int(product_dict.get('best_theme')),
+        prof_reviews=prof_reviews[product_dict['master_product_id']],
     )
+
+
+def create_offer_item_from_dict(product_dict, product_offer_id):
+    prof_reviews = get_prof_reviews([product_dict['master_product_id']])
+    offer_item = OfferItem(**_get_offer_item_values(product_dict, product_offer_id, prof_reviews))
     db.session.add(offer_item)
     db.session.flush()
 
-    offer_item.prof_reviews = [{
-        'name': r.reviewer_name,
-        'score': to_int(r.review_score)
-    } for r in offer_item.product_reviews if r.review_score]
-    # TODO otereshchenko: optimize db fetching of offer_item.product_reviews for batch
-
     return offer_item
 
 
+def create_offer_items_from_dicts(product_dicts, product_offer_id):
+    """
+    Batch version of create_offer_item_from_dict(): one query for the reviews
+    and one insert statement for the offer items.
+    """
+    prof_reviews = get_prof_reviews({p['master_product_id'] for p in product_dicts})
+    db.session.bulk_insert_mappings(OfferItem, [
+        _get_offer_item_values(product_dict, product_offer_id, prof_reviews)
+        for product_dict in product_dicts
+    ])
+
+
 def delete_product_offers(order_id):
     OfferItem.query.filter(OfferItem.product_offer_id.in_(
         db.session.query(ProductOffer.id).filter(ProductOffer.order_id == order_id).subquery()
@@ -111,9 +144,9 @@ def create_product_offers(order_id, products_list):
     products = products_list[0]
 
     master_product_id = products[0]['master_product_id']
-    master_product = get_master_product(master_product_id)
+    master_product = catalog_cache.get_master_product(master_product_id)
 
-    source = db.session.query(Source).filter_by(id=master_product.source_id).first()
+    source = catalog_cache.get_source(master_product.source_id)
 
     product_offer = ProductOffer(
         order_id=order_id,
@@ -126,10 +159,10 @@ def create_product_offers(order_id, products_list):
     db.session.add(product_offer)
     db.session.flush()
 
-    for product in products:
-        create_offer_item_from_dict(product, product_offer.id)
+    create_offer_items_from_dicts(products, product_offer.id)
 
-    db.session.flush()
+    # the offer items have been inserted bypassing the session
+    db.session.expire(product_offer, ['offer_items'])
     populate_offer_costs(product_offer)
 
 
@@ -0,0 +1,203 @@
+#
+# pylint: disable=no-member,invalid-name
+import logging
+import time
+from bisect import bisect_right
+from threading import Lock
+
+from core import config
+from core.db.models import db
+from core.db.models.salestax_rate import SalestaxRate
+from core.db.models.shipping_rate import ShippingRate
+from core.db.models.source_location import SourceLocation
+from core.sql_stats import get_table_change_count_query
+
+# changes whenever a rate or a source location is inserted, updated or deleted
+RATES_VERSION_QUERY = get_table_change_count_query(
+    ShippingRate.__tablename__, SalestaxRate.__tablename__, SourceLocation.__tablename__
+)
+
+
+def to_postcode_number(postcode):
+    """
+    Returns the postcode as a number comparable with rate intervals
+    or None if it is not numeric.
+    """
+    try:
+        return int(postcode)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateIntervals:
+    """
+    Postcode intervals of one source (and bottle quantity) sorted by from_postcode. Intervals
+    may overlap - the one with the greatest from_postcode that contains the postcode wins.
+    """
+
+    def __init__(self):
+        self._from_postcodes = []
+        self._intervals = []
+        # _max_to_postcodes[i]: the greatest to_postcode of intervals 0..i
+        self._max_to_postcodes = []
+
+    def add(self, from_postcode, to_postcode, value):
+        # rows are added in from_postcode order
+        self._from_postcodes.append(from_postcode)
+        self._intervals.append((from_postcode, to_postcode, value))
+        if self._max_to_postcodes:
+            to_postcode = max(to_postcode, self._max_to_postcodes[-1])
+        self._max_to_postcodes.append(to_postcode)
+
+    def find(self, postcode):
+        i = bisect_right(self._from_postcodes, postcode) - 1
+        # no interval up to i reaches the postcode once the prefix max does not
+        while i >= 0 and self._max_to_postcodes[i] >= postcode:
+            _, to_postcode, value = self._intervals[i]
+            if to_postcode >= postcode:
+                return value
+            i -= 1
+        return None
+
+
+class RateIndex:
+    """
+    In-process index of shipping and sales tax rates by source. It is loaded on first use and
+    reloaded when RATES_VERSION_QUERY (checked at most every check_interval seconds) changes.
+    The rates are written by the integration service, so the index polls the change counters
+    of the tables instead of being invalidated by the writers.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self.load_count = 0
+
+        self._shipping_rates = {}  # (source_id, bottle_qty) -> RateIntervals
+        self._tax_rates = {}  # source_id -> RateIntervals
+        self._version = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def get_source_rates(self, source_ids, bottle_qty, postcode):
+        """
+        Returns {source_id: (shipping_cost, tax_rate)} of the sources that have both rates
+        for the postcode.
+        """
+        self._refresh_if_changed()
+
+        res = {}
+        for source_id in source_ids:
+            shipping_cost = self._find(self._shipping_rates, (source_id, bottle_qty), postcode)
+            tax_rate = self._find(self._tax_rates, source_id, postcode)
+            if shipping_cost is not None and tax_rate is not None:
+                res[source_id] = (shipping_cost, tax_rate)
+        return res
+
+    def get_shipping_cost(self, source_id, bottle_qty, postcode):
+        self._refresh_if_changed()
+        return self._find(self._shipping_rates, (source_id, bottle_qty), postcode)
+
+    def get_tax_rate(self, source_id, postcode):
+        self._refresh_if_changed()
+        return self._find(self._tax_rates, source_id, postcode)
+
+    def clear(self):
+        with self._lock:
+            self._shipping_rates = {}
+            self._tax_rates = {}
+            self._version = None
+            self._checked_at = None
+
+    def stats_to_dict(self):
+        return {
+            'check_interval': self.check_interval,
+            'load_count': self.load_count,
+            'shipping_rate_keys': len(self._shipping_rates),
+            'tax_rate_keys': len(self._tax_rates),
+        }
+
+    @staticmethod
+    def _find(rates, key, postcode):
+        intervals = rates.get(key)
+        if intervals is None:
+            return None
+        return intervals.find(postcode)
+
+    def _refresh_if_changed(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+
+            # the check is stamped only once it has succeeded - a failed (re)load raises and is
+            # retried by the next call instead of serving an empty index for check_interval
+            version = tuple(db.session.execute(RATES_VERSION_QUERY).first())
+            if version != self._version:
+                self._load()
+                self._version = version
+            self._checked_at = now
+
+    def _load(self):
+        shipping_rates = {}
+        for source_id, bottle_qty, from_postcode, to_postcode, shipping_cost in db.session.query(
+                SourceLocation.source_id,
+                ShippingRate.bottle_qty,
+                ShippingRate.from_postcode,
+                ShippingRate.to_postcode,
+                ShippingRate.shipping_cost,
+        ).select_from(ShippingRate).join(SourceLocation).order_by(ShippingRate.from_postcode):
+            shipping_rates.setdefault((source_id, bottle_qty), RateIntervals()).add(
+                from_postcode, to_postcode, shipping_cost
+            )
+
+        tax_rates = {}
+        for source_id, from_postcode, to_postcode, tax_rate in db.session.query(
+                SourceLocation.source_id,
+                SalestaxRate.from_postcode,
+                SalestaxRate.to_postcode,
+                SalestaxRate.taxrate,
+        ).select_from(SalestaxRate).join(SourceLocation).order_by(SalestaxRate.from_postcode):
+            tax_rates.setdefault(source_id, RateIntervals()).add(from_postcode, to_postcode, tax_rate)
+
+        self._shipping_rates = shipping_rates
+        self._tax_rates = tax_rates
+        self.load_count += 1
+        logging.info(
+            'Loaded rate index: %s shipping rate keys, %s tax rate keys',
+            len(shipping_rates), len(tax_rates),
+        )
+
+
+def query_source_rates(source_ids, bottle_qty, postcode):
+    """
+    The same as RateIndex.get_source_rates() with a single query
+    (used when the index is disabled or the postcode is not numeric).
+    """
+    shipping_costs = db.session.query(
+        SourceLocation.source_id.label('source_id'),
+        ShippingRate.shipping_cost.label('shipping_cost'),
+    ).select_from(ShippingRate).join(SourceLocation).filter(
+        SourceLocation.source_id.in_(source_ids),
+        ShippingRate.bottle_qty == bottle_qty,
+        ShippingRate.from_postcode <= postcode,
+        ShippingRate.to_postcode >= postcode,
+    ).distinct(SourceLocation.source_id).order_by(SourceLocation.source_id).subquery()
+
+    tax_rates = db.session.query(
+        SourceLocation.source_id.label('source_id'),
+        SalestaxRate.taxrate.label('taxrate'),
+    ).select_from(SalestaxRate).join(SourceLocation).filter(
+        SourceLocation.source_id.in_(source_ids),
+        SalestaxRate.from_postcode <= postcode,
+        SalestaxRate.to_postcode >= postcode,
+    ).distinct(SourceLocation.source_id).order_by(SourceLocation.source_id).subquery()
+
+    rows = db.session.query(
+        shipping_costs.c.source_id, shipping_costs.c.shipping_cost, tax_rates.c.taxrate
+    ).join(
+        tax_rates, tax_rates.c.source_id == shipping_costs.c.source_id
+    )
+    return {source_id: (shipping_cost, tax_rate) for source_id, shipping_cost, tax_rate in rows}
+
+
+rate_index = RateIndex(config.RATE_INDEX_CHECK_INTERVAL)
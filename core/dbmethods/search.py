@@ -0,0 +1,85 @@
+# pylint: disable=no-member
+"""
+Substring search for the admin lists.
+
+All the searched expressions are supposed to be covered by pg_trgm GIN indexes (these make
+ILIKE '%term%' filters and similarity ranking index assisted, a btree index can not be used for
+a leading wildcard). rankByRelevance needs the similarity() function of pg_trgm - the extension
+and the indexes are created by search_trgm.sql (see create_search_indexes()).
+"""
+from pathlib import Path
+
+from sqlalchemy import func
+
+from core.db.models import db
+from core.db.models.order import Order
+from core.db.models.user import User
+
+SEARCH_TRGM_SQL_PATH = Path(__file__).parent / 'search_trgm.sql'
+
+# the expression should match ix_users_display_name_trgm exactly, otherwise the index is not used
+USER_DISPLAY_NAME = func.coalesce(User.first_name, '') + ' ' + func.coalesce(User.last_name, '')
+
+USER_SEARCH_COLUMNS = {
+    'user_number': User.user_number,
+    'display_name': USER_DISPLAY_NAME,
+}
+ORDER_SEARCH_COLUMNS = {
+    'order_number': Order.order_number,
+}
+
+
+def create_search_indexes():
+    db.session.execute(SEARCH_TRGM_SQL_PATH.read_text())
+    db.session.commit()
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def contains_ignore_case(expression, term):
+    return expression.ilike(f'%{_escape_like(term)}%', escape='\\')
+
+
+def filter_by_search_terms(query, search_columns, terms, rank=False):
+    """
+    Filters the query by ``{search column name: term}`` (all the terms should match). If ``rank`` is
+    True the query is ordered by trigram similarity of the matched columns to their terms (most
+    similar first, the previous ORDER BY is kept as a tie breaker).
+    """
+    similarities = []
+    for name, term in terms.items():
+        if not term:
+            continue
+        expression = search_columns[name]
+        query = query.filter(contains_ignore_case(expression, term))
+        similarities.append(func.similarity(expression, term))
+
+    if rank and similarities:
+        order_by = query._order_by or ()
+        rank_expression = similarities[0] if len(similarities) == 1 else func.greatest(*similarities)
+        query = query.order_by(None).order_by(rank_expression.desc(), *order_by)
+    return query
+
+
+def filter_users(query, user_number=None, display_name=None, rank=False):
+    return filter_by_search_terms(
+        query,
+        USER_SEARCH_COLUMNS,
+        {'user_number': user_number, 'display_name': display_name},
+        rank=rank,
+    )
+
+
+def filter_orders(query, order_number=None, user_display_name=None, rank=False):
+    query = filter_by_search_terms(
+        query, ORDER_SEARCH_COLUMNS, {'order_number': order_number}, rank=rank
+    )
+    if user_display_name:
+        query = query.filter(
+            Order.user_id.in_(
+                filter_users(db.session.query(User.id), display_name=user_display_name).subquery()
+            )
+        )
+    return query
@@ -0,0 +1,7 @@
+-- pg_trgm and the GIN indexes of the admin list search (see core.dbmethods.search),
+-- safe to run again
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_users_user_number_trgm ON users USING gin (user_number gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_display_name_trgm ON users
+    USING gin ((coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_orders_order_number_trgm ON orders USING gin (order_number gin_trgm_ops);
@@ -9,6 +9,7 @@ from random import randint
 import stripe
 from isounidecode import unidecode
 from stripe.error import StripeError
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
 from core import (
@@ -105,15 +106,32 @@ def populate_cognito_display_status(user):
     ])
 
 
+# user columns populated by populate_most_of_cognito_fields() and populate_cognito_display_status()
+COGNITO_USER_FIELDS = (
+    'exists_in_cognito',
+    'cognito_enabled',
+    'cognito_status',
+    'cognito_display_status',
+    'cognito_phone_verified',
+    'cognito_email_verified',
+    'email',
+    'phone',
+)
+
+NEW_USER_COGNITO_FIELDS = {
+    'exists_in_cognito': None,
+    'cognito_enabled': False,
+    'cognito_status': 'UNKNOWN',
+    'cognito_display_status': 'UNKNOWN',
+    'cognito_phone_verified': False,
+    'cognito_email_verified': False,
+}
+
+
 def create_user(cognito_sub, assign_wine_expert=True):
     user = User(
         cognito_sub=cognito_sub,
-        exists_in_cognito=None,
-        cognito_enabled=False,
-        cognito_status='UNKNOWN',
-        cognito_display_status='UNKNOWN',
-        cognito_phone_verified=False,
-        cognito_email_verified=False,
+        **NEW_USER_COGNITO_FIELDS
     )
     if assign_wine_expert:
         # Assign Wine Expert
@@ -127,6 +145,27 @@ def create_user(cognito_sub, assign_wine_expert=True):
     return user
 
 
+def bulk_insert_users(user_values):
+    """
+    Inserts users given as dicts of column values (each with a cognito_sub) with a single
+    INSERT ... ON CONFLICT (cognito_sub) DO NOTHING and assigns user numbers to the inserted
+    rows. Returns cognito subjects of the inserted users (the rest already existed).
+    """
+    if not user_values:
+        return []
+
+    inserted_rows = db.session.execute(
+        insert(User.__table__).values(user_values).on_conflict_do_nothing(
+            index_elements=[User.cognito_sub]
+        ).returning(User.id, User.cognito_sub)
+    ).fetchall()
+
+    db.session.bulk_update_mappings(User, [
+        {'id': user_id, 'user_number': f'{user_id:07}'} for user_id, _ in inserted_rows
+    ])
+    return [cognito_sub for _, cognito_sub in inserted_rows]
+
+
 def get_user(user_id):
     return db.session.query(User).filter_by(id=user_id).first()
 
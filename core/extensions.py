@@ -2,10 +2,18 @@
 from flask_principal import Principal
 
 from core.db.models import db
+from core.db_pool import register_fork_safe_pool
+from core.db_routing import register_session_routing
+from core.sql_stats import register_sql_query_counter
+from core.tracing import register_sql_tracing
 
 principal = Principal(use_sessions=False)
 
 
 def register_extensions(app):
+    register_session_routing(db)
     db.init_app(app)
     principal.init_app(app)
+    register_sql_query_counter()
+    register_sql_tracing()
+    register_fork_safe_pool()
@@ -0,0 +1,237 @@
+#
+# pylint: disable=no-member,too-few-public-methods
+import logging
+import time
+from threading import Lock
+
+from core import config
+from core.db.models import db
+from core.db.models.domain_card import DomainCard
+from core.db.models.theme import Theme
+from core.db.models.theme_example_wine import ThemeExampleWine
+from core.db.models.theme_group import ThemeGroup
+from core.response_cache import response_cache
+from core.sql_stats import get_table_change_count_query
+
+# changes whenever a theme group, a theme, an example wine or a domain card is inserted, updated
+# or deleted (the catalog is edited outside of this service, there is no mutation to invalidate
+# the snapshot from)
+CATALOG_VERSION_QUERY = get_table_change_count_query(
+    ThemeGroup.__tablename__,
+    Theme.__tablename__,
+    ThemeExampleWine.__tablename__,
+    DomainCard.__tablename__,
+)
+
+
+def get_catalog_snapshot():
+    # None if the snapshot is disabled or could not be built - the caller queries the db then
+    if not config.CATALOG_SNAPSHOT_CHECK_INTERVAL:
+        return None
+    return catalog_snapshot_cache.get()
+
+
+class CatalogRecord:
+    """
+    Read-only stand-in for a model instance - the GraphQL types resolve both
+    (see OptimizeResolveObjectType.is_type_of()).
+    """
+    __slots__ = ()
+    model = None
+    columns = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.columns, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.id}>'
+
+
+class ThemeGroupRecord(CatalogRecord):
+    model = ThemeGroup
+    columns = ('id', 'user_id', 'sort_order', 'is_active', 'is_promoted', 'title', 'description')
+    __slots__ = columns + ('themes',)
+
+
+class ThemeRecord(CatalogRecord):
+    model = Theme
+    columns = (
+        'id', 'theme_group_id', 'title', 'image', 'short_description', 'sort_order',
+        'content_blocks', 'wine_types',
+    )
+    __slots__ = columns + ('theme_group',)
+
+
+class ThemeExampleWineRecord(CatalogRecord):
+    model = ThemeExampleWine
+    columns = (
+        'id', 'theme_id', 'brand', 'name', 'score_num', 'image', 'description', 'sort_order',
+        'location', 'highlights', 'varietals', 'qty', 'sku', 'qoh', 'product_url', 'price', 'msrp',
+        'prof_reviews',
+    )
+    # _product_reviews_cache: see core.graphql.schemas.build_product_reviews_cached()
+    __slots__ = columns + ('theme', '_product_reviews_cache')
+
+
+class DomainCardRecord(CatalogRecord):
+    model = DomainCard
+    columns = (
+        'id', 'category_id', 'display_title', 'display_text', 'display_image', 'display_order',
+    )
+    __slots__ = columns
+
+
+class CatalogSnapshot:
+    """
+    Immutable catalog arrays sorted the same way as the corresponding SQL queries
+    (see resolve_themes() and resolve_theme_groups() of core.graphql.query.Query). The records
+    are sorted by the db when they are loaded, so titles follow the collation of the db.
+    """
+    __slots__ = (
+        'themes',
+        'theme_groups',
+        'example_wines_by_theme_id',
+        'domain_cards_by_category_id',
+    )
+
+    def __init__(self, themes, theme_groups, example_wines_by_theme_id, domain_cards_by_category_id):
+        self.themes = themes
+        self.theme_groups = theme_groups
+        self.example_wines_by_theme_id = example_wines_by_theme_id
+        self.domain_cards_by_category_id = domain_cards_by_category_id
+
+    def get_example_wines(self, theme_id):
+        return self.example_wines_by_theme_id.get(theme_id, ())
+
+    def get_domain_cards(self, category_id):
+        return self.domain_cards_by_category_id.get(category_id, ())
+
+
+def _load_records(record_class, *order_by):
+    model = record_class.model
+    query = db.session.query(
+        *(getattr(model, name) for name in record_class.columns)
+    ).order_by(*order_by, model.id)
+    return [record_class(*row) for row in query]
+
+
+def _group_by(records, get_key):
+    # keeps the order of the records
+    groups = {}
+    for record in records:
+        groups.setdefault(get_key(record), []).append(record)
+    return {key: tuple(group) for key, group in groups.items()}
+
+
+def build_catalog_snapshot():
+    theme_groups = _load_records(
+        ThemeGroupRecord,
+        ThemeGroup.is_promoted.desc(),
+        ThemeGroup.sort_order.asc(),
+        ThemeGroup.title.asc(),
+    )
+    themes = _load_records(ThemeRecord, Theme.sort_order.asc(), Theme.title.asc())
+    example_wines = _load_records(
+        ThemeExampleWineRecord, ThemeExampleWine.sort_order.asc(), ThemeExampleWine.name.asc()
+    )
+    domain_cards = _load_records(DomainCardRecord, DomainCard.display_order.asc())
+
+    theme_groups_by_id = {r.id: r for r in theme_groups}
+    themes_by_id = {r.id: r for r in themes}
+
+    for theme in themes:
+        theme.wine_types = tuple(theme.wine_types or ())
+        theme.theme_group = theme_groups_by_id.get(theme.theme_group_id)
+
+    themes_by_group_id = _group_by(themes, lambda r: r.theme_group_id)
+    for theme_group in theme_groups:
+        theme_group.themes = themes_by_group_id.get(theme_group.id, ())
+
+    for example_wine in example_wines:
+        example_wine.theme = themes_by_id.get(example_wine.theme_id)
+
+    active_theme_groups = [r for r in theme_groups if r.is_active]
+    return CatalogSnapshot(
+        themes=tuple(
+            theme for theme_group in active_theme_groups for theme in theme_group.themes
+        ),
+        theme_groups=tuple(r for r in active_theme_groups if r.themes),
+        example_wines_by_theme_id=_group_by(example_wines, lambda r: r.theme_id),
+        domain_cards_by_category_id=_group_by(domain_cards, lambda r: r.category_id),
+    )
+
+
+class CatalogSnapshotCache:
+    """
+    In-process snapshot of the public catalog (themes, theme groups, their example wines and
+    domain cards). It is built on first use and rebuilt when CATALOG_VERSION_QUERY (checked at
+    most every check_interval seconds) changes. Fields that depend on the user (isSelected,
+    selectedThemes, the creator of a group) are still resolved per request.
+
+    get() returns None while there is no snapshot (the first build failed), the resolvers fall
+    back to SQL then. A failed rebuild keeps serving the previous snapshot, the next request
+    retries.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self.build_count = 0
+
+        self._snapshot = None
+        self._version = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            try:
+                version = tuple(db.session.execute(CATALOG_VERSION_QUERY).first())
+                if version != self._version:
+                    self._snapshot = self._build()
+                    if self._version is not None:
+                        # cached anonymous responses were built from the previous snapshot
+                        response_cache.invalidate()
+                    self._version = version
+            except Exception:
+                logging.exception('Failed to refresh catalog snapshot')
+                db.session.rollback()
+            else:
+                self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._checked_at = None
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            self._version = None
+            self._checked_at = None
+
+    def stats_to_dict(self):
+        snapshot = self._snapshot
+        return {
+            'check_interval': self.check_interval,
+            'build_count': self.build_count,
+            'themes': len(snapshot.themes) if snapshot else 0,
+            'theme_groups': len(snapshot.theme_groups) if snapshot else 0,
+        }
+
+    def _build(self):
+        snapshot = build_catalog_snapshot()
+        self.build_count += 1
+        logging.info(
+            'Built catalog snapshot: %s themes, %s theme groups',
+            len(snapshot.themes), len(snapshot.theme_groups),
+        )
+        return snapshot
+
+
+catalog_snapshot_cache = CatalogSnapshotCache(config.CATALOG_SNAPSHOT_CHECK_INTERVAL)
@@ -0,0 +1,77 @@
+# pylint: disable=invalid-name
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from core import config
+
+PAGINATION_ARGS = ('first', 'last', 'before', 'after', 'offset', 'sort')
+
+
+def get_total_count_key(table_name, args):
+    """
+    (table name, normalized filter arguments) - pagination and sort arguments do not affect
+    the total count and are not part of the key.
+    """
+    filter_args = {k: v for k, v in args.items() if k not in PAGINATION_ARGS}
+    return table_name, json.dumps(filter_args, sort_keys=True, default=str)
+
+
+class TotalCountCache:
+    """
+    Short-lived cache of connection total counts. The cache is process-local - mutations
+    invalidate counts of their tables in the current process only, other processes rely on TTL.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._counts = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_count(self, key, count):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+
+        total_count = count()
+
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = (total_count, now + self.ttl)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return total_count
+
+    def invalidate(self, table_name):
+        with self._lock:
+            for key in [k for k in self._counts if k[0] == table_name]:
+                del self._counts[key]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats_to_dict(self):
+        return {
+            'size': len(self._counts),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+total_count_cache = TotalCountCache(
+    config.GRAPHQL_TOTAL_COUNT_CACHE_TTL, config.GRAPHQL_TOTAL_COUNT_CACHE_SIZE
+)
@@ -6,6 +6,10 @@ from promise import Promise
 from promise.dataloader import DataLoader
 
 from core.db.models import db
+from core.db.models.order import Order
+from core.db.models.order_shipping_carrier import OrderShippingCarrier
+from core.db.models.order_shipping_method import OrderShippingMethod
+from core.db.models.product_offer import ProductOffer
 from core.db.models.theme import Theme
 from core.db.models.theme_example_wine import ThemeExampleWine
 from core.db.models.theme_group import ThemeGroup
@@ -18,6 +22,10 @@ from core.graphql.schemas import (
     SORT_SELECTED_THEMES_SELECTED_AT_ASC,
     SORT_SELECTED_THEMES_SELECTED_AT_DESC,
 )
+from core.order.order_manager import (
+    USER_PROPOSED_ORDER_STATES,
+    USER_UPCOMING_ORDER_STATES,
+)
 
 
 def get_theme_is_selected_data_loader(cognito_sub):
@@ -75,6 +83,15 @@ def get_theme_example_wines_data_loader():
     )
 
 
+def get_user_data_loader():
+    return get_data_loader(
+        get_user_data_loader,
+        User.query,
+        User.id,
+        rows_to_value=_first_or_none,
+    )
+
+
 def get_creator_theme_groups_data_loader():
     return get_data_loader(
         get_creator_theme_groups_data_loader,
@@ -171,6 +188,137 @@ def get_theme_group_selected_themes_data_loader(cognito_sub):
     )
 
 
+def get_user_orders_data_loader():
+    return get_by_foreign_key_data_loader(
+        get_user_orders_data_loader,
+        Order.user_id,
+        order_by=(Order.state_changed_at.desc(),),
+    )
+
+
+def get_user_current_order_data_loader():
+    return get_latest_by_foreign_key_data_loader(
+        get_user_current_order_data_loader,
+        Order.user_id,
+        order_by=(Order.created_at.desc(),),
+    )
+
+
+def get_user_proposed_order_data_loader():
+    return get_filtered_by_state_data_loader(
+        get_user_proposed_order_data_loader,
+        Order.user_id,
+        Order.state,
+        USER_PROPOSED_ORDER_STATES,
+        order_by=(Order.id.asc(),),
+        first_only=True,
+    )
+
+
+def get_user_upcoming_order_data_loader():
+    return get_filtered_by_state_data_loader(
+        get_user_upcoming_order_data_loader,
+        Order.user_id,
+        Order.state,
+        USER_UPCOMING_ORDER_STATES,
+        order_by=(Order.id.asc(),),
+        first_only=True,
+    )
+
+
+def get_product_offer_owner_data_loader():
+    return get_data_loader(
+        get_product_offer_owner_data_loader,
+
+        db.session.query(User, ProductOffer.id).join(
+            Order, Order.user_id == User.id
+        ).join(
+            ProductOffer, ProductOffer.order_id == Order.id
+        ),
+
+        ProductOffer.id,
+        get_row_key=lambda r: r[1],
+        rows_to_value=lambda r_list: r_list[0][0] if r_list else None,
+    )
+
+
+def get_tracking_url_template_data_loader():
+    return get_data_loader(
+        get_tracking_url_template_data_loader,
+
+        db.session.query(OrderShippingMethod.id, OrderShippingCarrier.tracking_url_template).join(
+            OrderShippingCarrier, OrderShippingCarrier.id == OrderShippingMethod.carrier_id
+        ),
+
+        OrderShippingMethod.id,
+        get_row_key=lambda r: r[0],
+        rows_to_value=lambda r_list: r_list[0][1] if r_list else None,
+    )
+
+
+def _first_or_none(r_list):
+    return r_list[0] if r_list else None
+
+
+def get_by_foreign_key_data_loader(
+        loader_key, key_column, criteria=(), order_by=(), first_only=False
+):
+    """
+    Loads rows of the model that ``key_column`` belongs to grouped by ``key_column`` value
+    (a list of rows per key or the first row only if ``first_only=True``).
+    """
+    query = db.session.query(key_column.class_)
+    if criteria:
+        query = query.filter(*criteria)
+    if order_by:
+        query = query.order_by(*order_by)
+
+    key_attr = key_column.key
+    return get_data_loader(
+        loader_key,
+        query,
+        key_column,
+        get_row_key=lambda r: getattr(r, key_attr),
+        rows_to_value=_first_or_none if first_only else lambda r_list: r_list,
+    )
+
+
+def get_latest_by_foreign_key_data_loader(loader_key, key_column, order_by, criteria=()):
+    """
+    Loads exactly one (the first according to ``order_by``) row per ``key_column`` value -
+    PostgreSQL ``DISTINCT ON`` is used so that the rest of the rows never leave the db.
+    """
+    query = db.session.query(key_column.class_).distinct(key_column)
+    if criteria:
+        query = query.filter(*criteria)
+    query = query.order_by(key_column, *order_by)
+
+    key_attr = key_column.key
+    return get_data_loader(
+        loader_key,
+        query,
+        key_column,
+        get_row_key=lambda r: getattr(r, key_attr),
+        rows_to_value=_first_or_none,
+    )
+
+
+def get_filtered_by_state_data_loader(
+        loader_key, key_column, state_column, states, order_by=(), first_only=False
+):
+    return get_by_foreign_key_data_loader(
+        loader_key,
+        key_column,
+        criteria=(state_column.in_(states),),
+        order_by=order_by,
+        first_only=first_only,
+    )
+
+
+def reset_data_loaders():
+    g.pop('m3_graphql_data_loaders', None)
+
+
 def get_data_loader(
         loader_key,
         query,
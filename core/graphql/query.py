@@ -12,6 +12,7 @@ from core.dbmethods.user import (
     get_user_by_sub,
     get_user_by_username,
 )
+from core.graphql.catalog_snapshot import get_catalog_snapshot
 from core.graphql.schemas.order import (
     SaveOrder,
     # RunAction,
@@ -96,6 +97,9 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_domain_cards(_, info, sort=None, **kwargs):
+        snapshot = get_catalog_snapshot() if sort == 'display_order_asc' else None
+        if snapshot is not None:
+            return snapshot.get_domain_cards(current_app.config['M3_DOMAIN_CATEGORY_ID'])
         return DomainCardsConnection.get_query(
             info,
             sort=sort,
@@ -106,6 +110,9 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_themes(_, info, sort=None, **kwargs):
+        snapshot = get_catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.themes
         return ThemesConnection.get_query(
             info,
             sort=None,
@@ -124,6 +131,9 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_theme_groups(_, info, sort=None, **kwargs):
+        snapshot = get_catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.theme_groups
         return ThemeGroupsConnection.get_query(
             info,
             sort=None,
@@ -0,0 +1,153 @@
+# pylint: disable=invalid-name
+import hashlib
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from graphql import (
+    parse,
+    validate,
+)
+from graphql.backend import (
+    GraphQLBackend,
+    GraphQLDocument,
+)
+from graphql.execution import (
+    execute,
+    ExecutionResult,
+)
+
+from core import config
+from core.db_routing import (
+    read_only_db,
+    stick_to_primary,
+)
+from core.response_cache import mark_response_uncacheable
+
+
+def get_document_hash(document_string):
+    return hashlib.sha256(document_string.encode('utf8')).hexdigest()
+
+
+def _return_validation_errors(validation_errors, *args, **kwargs):
+    return ExecutionResult(errors=validation_errors, invalid=True)
+
+
+class QueryDocumentCache(GraphQLBackend):
+    """
+    GraphQL backend that keeps an LRU cache of parsed AND validated documents keyed by sha256 of
+    the document string (graphql-core default backend parses and validates on every request).
+
+    The same hashes are used as ids of persisted queries: a client may send only the hash of a
+    document that was registered earlier (see ``register()``). One cache instance is supposed to
+    serve one schema.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.registrations = 0
+        self.not_found = 0
+
+        self._documents = OrderedDict()
+        self._lock = Lock()
+
+    def document_from_string(self, schema, document_string):
+        return self._get_or_build(schema, get_document_hash(document_string), document_string)
+
+    def get_document_string(self, document_hash):
+        with self._lock:
+            document = self._documents.get(document_hash)
+            if document is None:
+                self.not_found += 1
+                return None
+            self._documents.move_to_end(document_hash)
+            return document.document_string
+
+    def register(self, schema, document_hash, document_string):
+        if get_document_hash(document_string) != document_hash:
+            raise ValueError('Provided sha256Hash does not match query')
+
+        self._get_or_build(schema, document_hash, document_string, is_registration=True)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = 0
+            self.misses = 0
+            self.registrations = 0
+            self.not_found = 0
+
+    def stats_to_dict(self):
+        return {
+            'size': len(self._documents),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'registrations': self.registrations,
+            'not_found': self.not_found,
+        }
+
+    def _get_or_build(self, schema, document_hash, document_string, is_registration=False):
+        with self._lock:
+            document = self._documents.get(document_hash)
+            if document is not None:
+                self._documents.move_to_end(document_hash)
+                if not is_registration:
+                    self.hits += 1
+                return document
+
+        # parsing errors are propagated to the caller and are not cached
+        document = _build_document(schema, document_string)
+
+        with self._lock:
+            if is_registration:
+                self.registrations += 1
+            else:
+                self.misses += 1
+
+            self._documents[document_hash] = document
+            self._documents.move_to_end(document_hash)
+            while len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+        return document
+
+
+def _build_document(schema, document_string):
+    document_ast = parse(document_string)
+
+    document = GraphQLDocument(
+        schema=schema,
+        document_string=document_string,
+        document_ast=document_ast,
+        execute=None,
+    )
+
+    validation_errors = validate(schema, document_ast)
+    if validation_errors:
+        document.execute = partial(_return_validation_errors, validation_errors)
+    else:
+        document.execute = partial(_execute_on_routed_db, document)
+    return document
+
+
+def _execute_on_routed_db(document, *args, **kwargs):
+    """
+    Queries read from the replica, mutations (and whatever runs after them in the same
+    request) use the primary.
+    """
+    if document.get_operation_type(kwargs.get('operation_name')) == 'query':
+        with read_only_db():
+            result = execute(document.schema, document.document_ast, *args, **kwargs)
+    else:
+        stick_to_primary()
+        mark_response_uncacheable()
+        result = execute(document.schema, document.document_ast, *args, **kwargs)
+
+    if getattr(result, 'errors', None):
+        mark_response_uncacheable()
+    return result
+
+
+query_document_cache = QueryDocumentCache(config.GRAPHQL_QUERY_CACHE_SIZE)
@@ -1,13 +1,23 @@
 # pylint: disable=no-member
+import json
 import logging
 
-from collections import namedtuple
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
+from datetime import (
+    date,
+    datetime,
+)
+from decimal import Decimal
 
 import graphene
 from graphene import (
     relay,
     Enum,
 )
+from graphene.relay.connection import PageInfo
 from graphene.utils.str_converters import to_camel_case
 from graphene_sqlalchemy import (
     SQLAlchemyObjectType,
@@ -18,19 +28,50 @@ from graphene_sqlalchemy.utils import (
     _ENUM_CACHE,
     EnumValue,
 )
+from sqlalchemy import (
+    and_,
+    false,
+    or_,
+    Column,
+)
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm.exc import UnmappedColumnError
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from graphql.error import GraphQLError
 from graphql.language.ast import (
     FragmentSpread,
     InlineFragment,
 )
-from graphql_relay.connection.arrayconnection import offset_to_cursor
+from graphql_relay.connection.arrayconnection import (
+    get_offset_with_default,
+    offset_to_cursor,
+)
+from graphql_relay.utils import (
+    base64,
+    unbase64,
+)
+from promise import (
+    is_thenable,
+    Promise,
+)
 
-from core import to_int
+from core import (
+    config,
+    to_int,
+)
 from core.cognito import (
     admin_user_permission,
     anonymous_user_permission,
 )
 from core.db.models import db
+from core.graphql.catalog_snapshot import CatalogRecord
+from core.graphql.count_cache import (
+    get_total_count_key,
+    total_count_cache,
+)
+from core.response_cache import mark_response_uncacheable
 
 OptimizeResolveTuple = namedtuple('OptimizeResolveTuple', [
     'query_options',
@@ -141,7 +182,7 @@ def _get_ast_field_dict(ast, fragments):
     return ast_field_dict
 
 
-def _get_optimizer_dict(obj_type):
+def _build_optimizer_dict(obj_type):
     optimizer_dict = {}
 
     optimize_resolve_prefix = 'optimize_resolve_'
@@ -160,8 +201,17 @@ def _get_optimizer_dict(obj_type):
     return optimizer_dict
 
 
+def _get_optimizer_dict(obj_type):
+    # optimizer dicts are built once per type when the schema is being built
+    # (see __init_subclass_with_meta__ of OptimizeResolveObjectType and OptimizeResolveConnection)
+    return getattr(obj_type, 'optimizer_dict', None) or {}
+
+
 def _optimize_resolve(obj_type, query_options, query_path, ast, fragments):
     optimizer_dict = _get_optimizer_dict(obj_type)
+    if not optimizer_dict:
+        return
+
     ast_field_dict = _get_ast_field_dict(ast, fragments)
 
     for field_name, optimizer in optimizer_dict.items():
@@ -185,14 +235,34 @@ def _optimize_resolve(obj_type, query_options, query_path, ast, fragments):
         )
 
 
-def optimize_resolve(obj_type, query, info):
-    query_options = []
+# {(obj_type, field_ast): query_options} - AST nodes are hashed by identity, parsed documents are
+# reused between requests (see core.graphql.query_cache) and so are the query options built for them
+_query_options_cache = OrderedDict()
+
+
+def _get_query_options_cached(obj_type, field_ast, fragments):
+    key = (obj_type, field_ast)
+    try:
+        query_options = _query_options_cache[key]
+    except KeyError:
+        query_options = []
+        _optimize_resolve(obj_type, query_options, '', field_ast, fragments)
 
+        _query_options_cache[key] = query_options
+        while len(_query_options_cache) > config.GRAPHQL_QUERY_OPTIONS_CACHE_SIZE:
+            _query_options_cache.popitem(last=False)
+    else:
+        _query_options_cache.move_to_end(key)
+
+    return query_options
+
+
+def optimize_resolve(obj_type, query, info):
     if len(info.field_asts) != 1:
         raise ValueError(
             f'len(info.field_asts) expected to be 1 but is {len(info.field_asts)} - investigate why'
         )
-    _optimize_resolve(obj_type, query_options, '', info.field_asts[0], info.fragments)
+    query_options = _get_query_options_cached(obj_type, info.field_asts[0], info.fragments)
     if query_options:
         query = query.options(*query_options)
 
@@ -213,14 +283,49 @@ def from_global_id_assert_type(global_id, expected_node_type, id_converter=int):
     return id_converter(node_id) if id_converter else node_id
 
 
+def get_estimated_row_count(query):
+    """
+    Returns the PostgreSQL estimate (pg_class.reltuples) of the number of rows of the table the
+    query selects from or None if the query is filtered/joined or the table was never analyzed.
+    """
+    if query.whereclause is not None or query._from_obj or len(query.column_descriptions) != 1:
+        return None
+    entity = query.column_descriptions[0]['entity']
+    if entity is None:
+        return None
+
+    estimate = db.session.execute(
+        'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)',
+        {'table_name': inspect(entity).local_table.name},
+    ).scalar()
+    if not estimate or estimate < 0:
+        return None
+    return estimate
+
+
 class TotalCountConnection(relay.Connection):
     class Meta:
         abstract = True
 
-    total_count = graphene.Int()
+    total_count = graphene.Int(estimated=graphene.Boolean(default_value=False))
 
     @staticmethod
-    def resolve_total_count(root, info):
+    def resolve_total_count(root, info, estimated=False):
+        if root.length is not None:
+            return root.length
+
+        query = root.iterable
+        if estimated:
+            estimate = get_estimated_row_count(query)
+            if estimate is not None:
+                return estimate
+
+        # COUNT(*) is executed only when totalCount is actually requested
+        total_count_key = getattr(root, 'total_count_key', None)
+        if total_count_key is not None:
+            root.length = total_count_cache.get_or_count(total_count_key, query.count)
+        else:
+            root.length = query.count()
         return root.length
 
 
@@ -231,6 +336,7 @@ class OptimizeResolveConnection(TotalCountConnection):
     class OptimizeResolveEdges:
         def __init__(self, node_class):
             self._node_class = node_class
+            self.optimizer_dict = _build_optimizer_dict(self)
 
         def optimize_resolve_node(self, query_parent_path):
             return OptimizeResolveTuple(
@@ -239,12 +345,18 @@ class OptimizeResolveConnection(TotalCountConnection):
                 child_node_class=self._node_class
             )
 
+    @classmethod
+    def __init_subclass_with_meta__(cls, **options):
+        super().__init_subclass_with_meta__(**options)
+        cls._optimize_resolve_edges_node = cls.OptimizeResolveEdges(cls._meta.node)
+        cls.optimizer_dict = _build_optimizer_dict(cls)
+
     @classmethod
     def optimize_resolve_edges(cls, query_parent_path):
         return OptimizeResolveTuple(
             query_options=None,
             query_child_path=query_parent_path,
-            child_node_class=cls.OptimizeResolveEdges(cls._meta.node)
+            child_node_class=cls._optimize_resolve_edges_node
         )
 
     @classmethod
@@ -263,6 +375,11 @@ class OptimizeResolveObjectType(SQLAlchemyObjectType):
     class Meta:
         abstract = True
 
+    @classmethod
+    def __init_subclass_with_meta__(cls, **options):
+        super().__init_subclass_with_meta__(**options)
+        cls.optimizer_dict = _build_optimizer_dict(cls)
+
     @classmethod
     def get_model_class(cls):
         return cls._meta.model
@@ -272,6 +389,18 @@ class OptimizeResolveObjectType(SQLAlchemyObjectType):
         query = super().get_query(info)
         return optimize_resolve(cls, query, info)
 
+    @classmethod
+    def is_type_of(cls, root, info):
+        # records of the catalog snapshot (see core.graphql.catalog_snapshot) stand in for models
+        if isinstance(root, CatalogRecord):
+            return root.model is cls._meta.model
+        return super().is_type_of(root, info)
+
+    def resolve_id(self, info):
+        if isinstance(self, CatalogRecord):
+            return self.id
+        return SQLAlchemyObjectType.resolve_id(self, info)
+
 
 class RegisteredUserObjectType(OptimizeResolveObjectType):
     class Meta:
@@ -292,6 +421,7 @@ class RegisteredUserObjectType(OptimizeResolveObjectType):
     @classmethod
     def get_node(cls, info, node_id):
         with anonymous_user_permission.require(http_exception=401) as identity:
+            mark_response_uncacheable()
             model = super().get_node(info, node_id)
 
             if not model:
@@ -301,18 +431,150 @@ class RegisteredUserObjectType(OptimizeResolveObjectType):
                 return model
 
             owner = cls.get_model_owner(model)
-            if owner:
-                if cls.is_node_shared(model, owner, identity):
-                    return model
-                if identity.id and owner.cognito_sub == identity.id.subject:
-                    return model
-            elif cls.is_orphan_node_accessible(model):
+            if is_thenable(owner):
+                # owner may be fetched with a data loader
+                return Promise.resolve(owner).then(
+                    lambda resolved_owner: cls._get_node_if_accessible(
+                        model, resolved_owner, identity
+                    )
+                )
+            return cls._get_node_if_accessible(model, owner, identity)
+
+    @classmethod
+    def _get_node_if_accessible(cls, model, owner, identity):
+        if owner:
+            if cls.is_node_shared(model, owner, identity):
+                return model
+            if identity.id and owner.cognito_sub == identity.id.subject:
                 return model
+        elif cls.is_orphan_node_accessible(model):
+            return model
+
+        return None
+
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+KEYSET_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _keyset_value_to_json(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.strftime(KEYSET_DATETIME_FORMAT)}
+    if isinstance(value, date):
+        return {'date': value.strftime('%Y-%m-%d')}
+    if isinstance(value, Decimal):
+        return {'decimal': str(value)}
+    return value
+
+
+def _keyset_value_from_json(value):
+    if isinstance(value, dict):
+        if 'datetime' in value:
+            return datetime.strptime(value['datetime'], KEYSET_DATETIME_FORMAT)
+        if 'date' in value:
+            return datetime.strptime(value['date'], '%Y-%m-%d').date()
+        if 'decimal' in value:
+            return Decimal(value['decimal'])
+    return value
+
+
+def keyset_to_cursor(values):
+    return base64(KEYSET_CURSOR_PREFIX + json.dumps([_keyset_value_to_json(v) for v in values]))
+
+
+def cursor_to_keyset(cursor):
+    """
+    Returns the list of sort values encoded in the cursor or None if it is not a keyset cursor
+    (offset cursors are still accepted by all the connections).
+    """
+    if not cursor:
+        return None
+    try:
+        cursor = unbase64(cursor)
+    except (ValueError, TypeError):
+        return None
+    if not cursor.startswith(KEYSET_CURSOR_PREFIX):
+        return None
+
+    try:
+        return [_keyset_value_from_json(v) for v in json.loads(cursor[len(KEYSET_CURSOR_PREFIX):])]
+    except ValueError:
+        raise GraphQLError('Invalid cursor')
+
+
+def get_keyset_columns(query, model):
+    """
+    Returns [(attribute name, column, is_desc)] for ORDER BY of the query (with the primary key
+    appended as a tie breaker) or None if keyset pagination can not be used for the query (it is
+    ordered by an expression or by a column of another table).
+    """
+    mapper = inspect(model)
+    keyset_columns = []
+    for clause in query._order_by or ():
+        is_desc = False
+        column = clause
+        if isinstance(clause, UnaryExpression):
+            if clause.modifier is operators.desc_op:
+                is_desc = True
+            elif clause.modifier is not operators.asc_op:
+                return None
+            column = clause.element
 
+        if not isinstance(column, Column):
+            return None
+        try:
+            prop = mapper.get_property_by_column(column)
+        except UnmappedColumnError:
             return None
+        keyset_columns.append((prop.key, column, is_desc))
+
+    keyset_keys = {key for key, _, _ in keyset_columns}
+    is_desc = keyset_columns[-1][2] if keyset_columns else False
+    for column in mapper.primary_key:
+        key = mapper.get_property_by_column(column).key
+        if key not in keyset_keys:
+            keyset_columns.append((key, column, is_desc))
+
+    return keyset_columns
+
+
+def _keyset_column_after(column, value, is_desc):
+    # PostgreSQL default NULL ordering: NULLS LAST for ASC and NULLS FIRST for DESC
+    if value is None:
+        return column.isnot(None) if is_desc else None
+    if is_desc:
+        return column < value
+    return or_(column > value, column.is_(None))
+
+
+def filter_after_keyset(query, keyset_columns, values):
+    if len(values) != len(keyset_columns):
+        raise GraphQLError('Cursor does not match the sort order')
+
+    criteria = []
+    equal_criteria = []
+    for (_, column, is_desc), value in zip(keyset_columns, values):
+        after_criterion = _keyset_column_after(column, value, is_desc)
+        if after_criterion is not None:
+            criteria.append(and_(*equal_criteria, after_criterion))
+        equal_criteria.append(column.is_(None) if value is None else column == value)
+
+    return query.filter(or_(*criteria) if criteria else false())
 
 
 class OffsetSQLAlchemyConnectionField(SQLAlchemyConnectionField):
+    """
+    Supports ``offset`` argument in addition to relay pagination arguments.
+
+    Forward pagination (``first``/``after``) of queries fetches ``first + 1`` rows and does not
+    execute COUNT(*) unless ``totalCount`` is requested. Subclasses with ``keyset_pagination``
+    switched on return cursors that encode the sort values of the node (for example
+    ``(state_changed_at, id)`` for ``order_time_desc``), so that the next page is found with
+    WHERE instead of OFFSET.
+    """
+    keyset_pagination = False
+    cache_total_count = False
+
     def __init__(self, type, *args, **kwargs):
         kwargs.setdefault('offset', graphene.Int())
         super().__init__(type, *args, **kwargs)
@@ -322,7 +584,84 @@ class OffsetSQLAlchemyConnectionField(SQLAlchemyConnectionField):
         offset = args.get('offset')
         if offset is not None:
             args.setdefault('after', offset_to_cursor(offset - 1))
-        return super().resolve_connection(connection_type, model, info, args, resolved)
+
+        if resolved is None:
+            resolved = cls.get_query(model, info, **args)
+
+        after_keyset = cursor_to_keyset(args.get('after'))
+        if args.get('last') is not None or args.get('before'):
+            if after_keyset is not None or cursor_to_keyset(args.get('before')) is not None:
+                raise GraphQLError('Keyset cursors support forward pagination only')
+            return super().resolve_connection(connection_type, model, info, args, resolved)
+
+        if not isinstance(resolved, Query):
+            return super().resolve_connection(connection_type, model, info, args, resolved)
+
+        keyset_columns = None
+        if cls.keyset_pagination:
+            keyset_columns = get_keyset_columns(resolved, model)
+
+        query = resolved
+        if after_keyset is not None:
+            if keyset_columns is None:
+                raise GraphQLError('Keyset cursors are not supported by this connection')
+            query = filter_after_keyset(query, keyset_columns, after_keyset)
+            start_offset = None
+        else:
+            start_offset = get_offset_with_default(args.get('after'), -1) + 1
+            if start_offset:
+                query = query.offset(start_offset)
+
+        first = args.get('first')
+        if first is not None:
+            first = max(first, 0)
+            rows = query.limit(first + 1).all()
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+        else:
+            rows = query.all()
+            has_next_page = False
+
+        if keyset_columns is not None:
+            cursors = [
+                keyset_to_cursor([getattr(row, key) for key, _, _ in keyset_columns])
+                for row in rows
+            ]
+        else:
+            cursors = [offset_to_cursor(start_offset + i) for i in range(len(rows))]
+
+        edges = [
+            connection_type.Edge(node=row, cursor=cursor) for row, cursor in zip(rows, cursors)
+        ]
+        connection = connection_type(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=cursors[0] if cursors else None,
+                end_cursor=cursors[-1] if cursors else None,
+                has_previous_page=False,
+                has_next_page=has_next_page,
+            )
+        )
+        connection.iterable = resolved
+        if first is None and start_offset is not None and (rows or not start_offset):
+            connection.length = start_offset + len(rows)
+        else:
+            connection.length = None  # see TotalCountConnection.resolve_total_count()
+        if cls.cache_total_count:
+            connection.total_count_key = get_total_count_key(inspect(model).local_table.name, args)
+        return connection
+
+
+class KeysetSQLAlchemyConnectionField(OffsetSQLAlchemyConnectionField):
+    keyset_pagination = True
+
+
+class ManagementSQLAlchemyConnectionField(KeysetSQLAlchemyConnectionField):
+    """
+    Admin lists: keyset pagination and total counts cached per filter (see
+    core.graphql.count_cache - mutations that change the lists should invalidate the cache).
+    """
+    cache_total_count = True
 
 
 def save_input_field(input_dict, input_key, model, model_attr=None):
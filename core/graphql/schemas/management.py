@@ -4,9 +4,7 @@ import graphene
 from graphene_sqlalchemy import utils
 from sqlalchemy import or_
 
-from core.graphql.schemas import (
-    OffsetSQLAlchemyConnectionField,
-)
+from core.graphql.schemas import ManagementSQLAlchemyConnectionField
 from core.graphql.schemas.order import (
     OrdersConnection,
     OrderFilter,
@@ -32,10 +30,15 @@ from core.db.models.order import Order as OrderModel
 from core.db.models.order_shipping_method import OrderShippingMethod as OrderShippingMethodModel
 from core.db.models.pipeline_sequence import PipelineSequence as PipelineSequenceModel
 from core.db.models.source import Source as SourceModel
+from core.dbmethods.search import (
+    filter_orders,
+    filter_users,
+)
+from core.order.order_manager import run_order
 
 
 class UserManagement(graphene.ObjectType):
-    users = OffsetSQLAlchemyConnectionField(
+    users = ManagementSQLAlchemyConnectionField(
         UsersConnection,
         list_filter=graphene.Argument(UserFilter),
         sort=graphene.Argument(
@@ -52,15 +55,12 @@ class UserManagement(graphene.ObjectType):
     def resolve_users(_, info, sort=None, list_filter=None, **kwargs):
         query = UsersConnection.get_query(info, sort=sort, **kwargs)
         if list_filter:
-            if list_filter.user_number:
-                query = query.filter(
-                    UserModel.user_number.ilike(f'%{list_filter.user_number}%')
-                )
-            if list_filter.display_name:
-                # TODO introduce real users.display_name column to the db
-                query = query.filter(
-                    UserModel.first_name.ilike(f'%{list_filter.display_name}%')
-                )
+            query = filter_users(
+                query,
+                user_number=list_filter.user_number,
+                display_name=list_filter.display_name,
+                rank=list_filter.rank_by_relevance,
+            )
             if list_filter.cognito_display_status:
                 if list_filter.cognito_display_status == 'UNKNOWN':
                     query = query.filter(
@@ -87,7 +87,7 @@ class UserManagement(graphene.ObjectType):
 
 
 class OrderManagement(graphene.ObjectType):
-    orders = OffsetSQLAlchemyConnectionField(
+    orders = ManagementSQLAlchemyConnectionField(
         OrdersConnection,
         list_filter=graphene.Argument(OrderFilter),
         sort=graphene.Argument(
@@ -99,6 +99,8 @@ class OrderManagement(graphene.ObjectType):
     )
     order_states = graphene.List(OrderStateEnum)
     shipping_methods = graphene.List(OrderShippingMethod)
+    # Celery state (PENDING, STARTED, SUCCESS, FAILURE...) of a task returned by saveOrder
+    order_task_state = graphene.String(task_id=graphene.String(required=True))
 
     @staticmethod
     def resolve_orders(_, info, sort=None, list_filter=None, **kwargs):
@@ -118,12 +120,12 @@ class OrderManagement(graphene.ObjectType):
             query = OrdersConnection.get_query(info, sort=sort, **kwargs)
 
         if list_filter:
-            if list_filter.order_number:
-                query = query.filter(OrderModel.order_number.ilike(f'%{list_filter.order_number}%'))
-            if list_filter.user:
-                query = query.join(OrderModel.user).filter(
-                    UserModel.first_name.ilike(f'%{list_filter.user}%')
-                )
+            query = filter_orders(
+                query,
+                order_number=list_filter.order_number,
+                user_display_name=list_filter.user,
+                rank=list_filter.rank_by_relevance,
+            )
             if list_filter.state:
                 query = query.filter(OrderModel.state == list_filter.state)
         return query
@@ -137,9 +139,13 @@ class OrderManagement(graphene.ObjectType):
     def resolve_shipping_methods(_, info):
         return OrderShippingMethodModel.query.order_by(OrderShippingMethodModel.name.asc())
 
+    @staticmethod
+    def resolve_order_task_state(_, info, task_id):
+        return run_order.AsyncResult(task_id).state
+
 
 class ScheduleManagement(graphene.ObjectType):
-    pipeline_sequences = OffsetSQLAlchemyConnectionField(
+    pipeline_sequences = ManagementSQLAlchemyConnectionField(
         PipelineSequencesConnection,
         sort=graphene.Argument(
             graphene.List(PipelineSequenceSortEnum),
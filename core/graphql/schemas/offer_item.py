@@ -4,14 +4,15 @@ import graphene
 from graphene import relay
 
 from core.db.models import db
-from core.db.models.master_product import MasterProduct
 from core.db.models.offer_item import OfferItem as OfferItemModel
 from core.db.models.product_offer import ProductOffer as ProductOfferModel
+from core.dbmethods.catalog import catalog_cache
 from core.dbmethods.product import (
     get_product_by_sku,
     create_offer_item_from_dict,
     populate_offer_costs,
 )
+from core.graphql.data_loaders import get_product_offer_owner_data_loader
 from core.graphql.schemas import (
     RegisteredUserObjectType,
     build_product_reviews_cached,
@@ -50,7 +51,7 @@ class OfferItem(RegisteredUserObjectType):
 
     @staticmethod
     def get_model_owner(model):
-        return model.product_offer.order.user
+        return get_product_offer_owner_data_loader().load(model.product_offer_id)
 
     @staticmethod
     def resolve_price(model, info):
@@ -105,7 +106,7 @@ def replace_offer_items(order_inp, order):
 
             if product_dict:
                 product_offer = offer_item.product_offer
-                new_master_product = MasterProduct.query.get(product_dict['master_product_id'])
+                new_master_product = catalog_cache.get_master_product(product_dict['master_product_id'])
 
                 if new_master_product.source_id == product_offer.source_id:
                     best_theme_id = offer_item.best_theme_id
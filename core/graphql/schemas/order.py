@@ -3,14 +3,17 @@
 import logging
 
 import graphene
-from celery.exceptions import TimeoutError
 from graphene import relay
+from graphql.error import GraphQLError
+from sqlalchemy import inspect
 from sqlalchemy.orm import (
     joinedload,
     selectinload,
 )
 
 from core.cognito import admin_user_permission
+from core.graphql.count_cache import total_count_cache
+from core.graphql.data_loaders import get_tracking_url_template_data_loader
 from core.graphql.schemas import (
     OptimizeResolveConnection,
     RegisteredUserObjectType,
@@ -39,8 +42,11 @@ from core.db.models import (
 )
 from core.db.models import db
 from core.db.models.order import Order as OrderModel
+from core.order.exceptions import OrderLockedException
 from core.order.order_manager import (
+    INLINE_ACTIONS,
     VALID_MANUAL_STATE_ACTIONS,
+    enqueue_order,
     run_order,
     # OrderManager,
 )
@@ -191,7 +197,15 @@ class Order(RegisteredUserObjectType):
 
     @staticmethod
     def resolve_shipping_tracking_url(model, info):
-        return get_order_tracking_url(model)
+        if model.shipping_method_id is None:
+            return None
+        if 'shipping_method' not in inspect(model).unloaded:
+            # already eager loaded by optimize_resolve_shipping_tracking_url()
+            return get_order_tracking_url(model)
+
+        return get_tracking_url_template_data_loader().load(model.shipping_method_id).then(
+            lambda template: template.format(model.shipping_tracking_num) if template else None
+        )
 
     @staticmethod
     def optimize_resolve_shipping_tracking_url(query_parent_path):
@@ -241,6 +255,8 @@ class SaveOrder(relay.ClientIDMutation):
         offer_item_replacements = graphene.List(OfferItemReplacementInput)
 
     order = graphene.Field(Order)
+    # id of the run_order task of the action (null if the action has been run inline)
+    task_id = graphene.String()
 
     @classmethod
     @admin_user_permission.require(http_exception=401, pass_identity=False)
@@ -250,6 +266,12 @@ class SaveOrder(relay.ClientIDMutation):
 
         order = OrderModel.query.get(order_id)
 
+        order_action = inp.get('action')
+        if order_action and order_action not in VALID_MANUAL_STATE_ACTIONS.get(order.state, ()):
+            raise GraphQLError(
+                'Invalid action: {} for state: {}'.format(order_action, order.state)
+            )
+
         save_input_fields(
             inp,
             (
@@ -280,20 +302,30 @@ class SaveOrder(relay.ClientIDMutation):
 
         db.session.commit()
 
-        order_action = inp.get('action')
-        if order_action:
-            task_res = run_order.delay(order.id, action=order_action)
+        task_id = None
+        if order_action in INLINE_ACTIONS:
+            # quick state change - its follow-up actions are enqueued
             try:
-                # wait for the task for up to 10 seconds (some order actions are quick)
-                task_res.wait(timeout=10)
-            except TimeoutError:
-                pass
-
+                run_order(order.id, order_action)
+            except OrderLockedException as e:
+                raise GraphQLError(e.msg + ' (the other changes of the order are saved)')
+        elif order_action:
+            # the client polls the order (isInProcess) or orderManagement.orderTaskState
+            task_res = enqueue_order(order.id, order_action)
+            if task_res is None:
+                raise GraphQLError(
+                    'Order: {} is already queued - action: {} not run '
+                    '(the other changes of the order are saved)'.format(order.id, order_action)
+                )
+            task_id = task_res.id
+
+        total_count_cache.invalidate(OrderModel.__tablename__)
         db.session.expire_all()
-        return SaveOrder(order=get_order(order.id))
+        return SaveOrder(order=get_order(order.id), task_id=task_id)
 
 
 class OrderFilter(graphene.InputObjectType):
     order_number = graphene.Field(graphene.String)
     user = graphene.Field(graphene.String)
     state = graphene.Field(OrderStateEnum)
+    rank_by_relevance = graphene.Field(graphene.Boolean)  # the most similar order numbers first
@@ -3,13 +3,13 @@
 import logging
 
 import graphene
-import requests
 from graphene import relay
 from sqlalchemy.orm import joinedload
 from flask import current_app
 
 from core.cognito import admin_user_permission
 from core.dbmethods import fetch_schedules_by_ids
+from core.http_client import integration_api_client
 from core.graphql.schemas import (
     RegisteredUserObjectType,
     OptimizeResolveConnection,
@@ -89,7 +89,7 @@ class PipelineSequencesConnection(OptimizeResolveConnection):
 def _run_pipeline_sequence_full(source_id):
     url = f'{current_app.config["INTEGRATION_API_URL"]}/api/1/source/{source_id}/sync/'
     logging.info('calling integration api: "%s"', url)
-    response = requests.get(url)
+    response = integration_api_client.get(url)
     logging.info('got response: %s', response.text)
     response.raise_for_status()
     return response.json()
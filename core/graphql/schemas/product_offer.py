@@ -4,6 +4,7 @@ from decimal import Decimal
 
 import graphene
 from graphene import relay
+from graphql.error import GraphQLError
 from sqlalchemy.orm import (
     selectinload,
     joinedload,
@@ -19,6 +20,10 @@ from core.graphql.schemas import (
 )
 from core.graphql.schemas.offer_item import OfferItem
 from core.db.models import db
+from core.order.exceptions import (
+    InvalidOrderActionException,
+    OrderLockedException,
+)
 from core.order.order_manager import (
     ACCEPT_ACTION,
     run_order,
@@ -169,6 +174,12 @@ class AcceptProductOffer(relay.ClientIDMutation):
         db.session.commit()
 
         # Lock money
-        run_order(order_id, ACCEPT_ACTION)
+        try:
+            run_order(order_id, ACCEPT_ACTION)
+        except (OrderLockedException, InvalidOrderActionException) as e:
+            # the offer has not been accepted - the user can try again
+            offer.accepted = False
+            db.session.commit()
+            raise GraphQLError(e.msg)
 
         return AcceptProductOffer()
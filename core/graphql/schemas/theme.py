@@ -17,6 +17,7 @@ from core.db.models.user import (
 from core.db.models.theme_group import ThemeGroup as ThemeGroupModel
 from core.db.models.theme import Theme as ThemeModel
 from core.dbmethods.user import get_or_create_user
+from core.graphql.catalog_snapshot import get_catalog_snapshot
 from core.graphql.data_loaders import (
     get_theme_is_selected_data_loader,
     get_theme_example_wines_data_loader,
@@ -31,6 +32,7 @@ from core.graphql.schemas import (
     from_global_id_assert_type,
 )
 from core.graphql.schemas.user_subscription import SubscriptionType
+from core.response_cache import response_cache
 
 
 class ContentBlock(graphene.ObjectType):
@@ -66,6 +68,9 @@ class Theme(OptimizeResolveObjectType):
 
     @staticmethod
     def resolve_example_wines(model, info, **kwargs):
+        snapshot = get_catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.get_example_wines(model.id)
         return get_theme_example_wines_data_loader().load(model.id)
 
     @staticmethod
@@ -186,5 +191,7 @@ class SetUserThemeSelections(relay.ClientIDMutation):
             ).count()
 
         db.session.commit()
+        # follower counts of the creators are public
+        response_cache.invalidate()
 
         return SetUserThemeSelections()
@@ -8,7 +8,11 @@ from sqlalchemy.orm import (
 
 from core.cognito import registered_user_permission
 from core.db.models.theme_group import ThemeGroup as ThemeGroupModel
-from core.graphql.data_loaders import get_theme_group_selected_themes_data_loader
+from core.graphql.catalog_snapshot import CatalogRecord
+from core.graphql.data_loaders import (
+    get_theme_group_selected_themes_data_loader,
+    get_user_data_loader,
+)
 from core.graphql.schemas import (
     OptimizeResolveObjectType,
     OptimizeResolveConnection,
@@ -37,6 +41,13 @@ class ThemeGroup(OptimizeResolveObjectType):
     def resolve_selected_themes(model, info, identity):
         return get_theme_group_selected_themes_data_loader(identity.id.subject).load(model.id)
 
+    @staticmethod
+    def resolve_user(model, info):
+        if isinstance(model, CatalogRecord):
+            # the catalog snapshot keeps only the id of the creator
+            return get_user_data_loader().load(model.user_id)
+        return model.user
+
     @staticmethod
     def optimize_resolve_user(query_parent_path):
         from core.graphql.schemas.user import User
@@ -24,10 +24,14 @@ from core.cognito_sync import (
 from core.db.models.user import User as UserModel
 from core.db.models.user_address import UserAddress as UserAddressModel
 from core.db.models.user_card import UserCard as UserCardModel
+from core.graphql.count_cache import total_count_cache
 from core.graphql.data_loaders import (
     get_creator_theme_groups_data_loader,
+    get_user_orders_data_loader,
+    get_user_proposed_order_data_loader,
     get_user_selected_themes_data_loader,
     get_user_selected_theme_groups_data_loader,
+    get_user_upcoming_order_data_loader,
 )
 from core.graphql.schemas.theme import ThemesConnection
 from core.graphql.schemas import (
@@ -82,6 +86,7 @@ from core.order.order_manager import (
     USER_PROPOSED_ORDER_STATES,
     USER_ORDER_HISTORY_STATES,
 )
+from core.response_cache import response_cache
 
 UserSortEnum = utils.sort_enum_for_model(UserModel)
 
@@ -245,17 +250,11 @@ class User(RegisteredUserObjectType):
 
     @staticmethod
     def resolve_proposed_order(model, info):
-        return db.session.query(OrderModel).filter(
-            OrderModel.user_id == model.id,
-            OrderModel.state.in_(USER_PROPOSED_ORDER_STATES),
-        ).first()
+        return get_user_proposed_order_data_loader().load(model.id)
 
     @staticmethod
     def resolve_upcoming_order(model, info):
-        return db.session.query(OrderModel).filter(
-            OrderModel.user_id == model.id,
-            OrderModel.state.in_(USER_UPCOMING_ORDER_STATES),
-        ).first()
+        return get_user_upcoming_order_data_loader().load(model.id)
 
     #@staticmethod
     #def resolve_current_orders(model, info):
@@ -266,9 +265,7 @@ class User(RegisteredUserObjectType):
 
     @staticmethod
     def resolve_all_orders(model, info):
-        return db.session.query(OrderModel).filter(
-            OrderModel.user_id == model.id,
-        ).order_by(OrderModel.state_changed_at.desc())
+        return get_user_orders_data_loader().load(model.id)
 
     @staticmethod
     def resolve_current_orders(model, info, sort=None, **kwargs):
@@ -470,6 +467,9 @@ class SaveUser(relay.ClientIDMutation):
             user.registration_finished = True
 
         db.session.commit()
+        total_count_cache.invalidate(UserModel.__tablename__)
+        # profiles of creators are public
+        response_cache.invalidate()
 
         return SaveUser(user=user)
 
@@ -566,6 +566,7 @@ class UserFilter(graphene.InputObjectType):
     user_number = graphene.Field(graphene.String)
     display_name = graphene.Field(graphene.String)
     cognito_display_status = graphene.Field(graphene.String)
+    rank_by_relevance = graphene.Field(graphene.Boolean)  # the most similar matches first
 
 
 class StartSearch(relay.ClientIDMutation):
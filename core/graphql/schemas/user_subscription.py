@@ -5,9 +5,11 @@ from decimal import Decimal
 import graphene
 from graphene import relay
 
-from core.graphql.data_loaders import get_subscription_selected_theme_types_data_loader
+from core.graphql.data_loaders import (
+    get_subscription_selected_theme_types_data_loader,
+    get_user_current_order_data_loader,
+)
 from core.graphql.schemas import RegisteredUserObjectType
-from core.dbmethods import get_current_order
 from core.db.models.user_subscription import UserSubscription as UserSubscriptionModel
 from core.db.models.user_subscription_snapshot import UserSubscriptionSnapshot as UserSubscriptionSnapshotModel
 from core.db.models import (
@@ -59,31 +61,27 @@ class UserSubscription(RegisteredUserObjectType):
 
     @staticmethod
     def resolve_month_to_process(model, info):
-        order = _get_current_order_cached(model)
-        if order is None:
-            return datetime.utcnow().month
-        return order.month
+        return _get_current_order_promise(model).then(
+            lambda order: datetime.utcnow().month if order is None else order.month
+        )
 
     @staticmethod
     def resolve_order_month_time(model, info):
-        order = _get_current_order_cached(model)
-        if order is None:
-            return None
-        return order.month_time
+        return _get_current_order_promise(model).then(
+            lambda order: None if order is None else order.month_time
+        )
 
     @staticmethod
     def resolve_order_is_in_process(model, info):
-        order = _get_current_order_cached(model)
-        if order is None:
-            return False
-        return order.is_in_process
+        return _get_current_order_promise(model).then(
+            lambda order: False if order is None else order.is_in_process
+        )
 
     @staticmethod
     def resolve_order_is_active(model, info):
-        order = _get_current_order_cached(model)
-        if order is None:
-            return False
-        return order.is_active
+        return _get_current_order_promise(model).then(
+            lambda order: False if order is None else order.is_active
+        )
 
     @staticmethod
     def resolve_red_themes_selected(model, info):
@@ -100,10 +98,8 @@ def _is_theme_type_selected_promise(subscription_id, theme_type):
     ).then(did_fulfill=lambda wine_types: theme_type in wine_types)
 
 
-def _get_current_order_cached(model):
-    if not hasattr(model, '_current_order_cache'):
-        model._current_order_cache = get_current_order(model.user.id)
-    return model._current_order_cache
+def _get_current_order_promise(model):
+    return get_user_current_order_data_loader().load(model.user_id)
 
 
 class UserSubscriptionSnapshot(RegisteredUserObjectType):
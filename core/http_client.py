@@ -0,0 +1,168 @@
+# pylint: disable=invalid-name
+import logging
+import random
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core import config
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures; while open, requests fail immediately.
+    After reset_timeout seconds one trial request is let through (half open) - its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.open_count = 0
+
+        self._failure_count = 0
+        self._opened_at = None
+        self._lock = Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self._failure_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failure_count += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failure_count >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.open_count += 1
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+
+class ApiClient:
+    """
+    HTTP client of one of our APIs: a keep-alive connection pool shared by all callers of the
+    process, timeouts, retries of failed GET requests (connection errors, timeouts and 5xx
+    responses) with exponential backoff and full jitter, and a circuit breaker.
+    """
+
+    def __init__(
+            self,
+            name,
+            timeout=None,
+            max_retries=None,
+            backoff=None,
+            pool_size=None,
+            failure_threshold=None,
+            reset_timeout=None,
+    ):
+        self.name = name
+        self.timeout = timeout or (config.HTTP_CLIENT_CONNECT_TIMEOUT, config.HTTP_CLIENT_READ_TIMEOUT)
+        self.max_retries = config.HTTP_CLIENT_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = config.HTTP_CLIENT_RETRY_BACKOFF if backoff is None else backoff
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold or config.HTTP_CLIENT_BREAKER_FAILURE_THRESHOLD,
+            config.HTTP_CLIENT_BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout,
+        )
+
+        self.request_count = 0
+        self.error_count = 0
+        self.retry_count = 0
+        self.rejected_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        pool_size = pool_size or config.HTTP_CLIENT_POOL_SIZE
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._lock = Lock()
+
+    def get(self, url, **kwargs):
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow_request():
+                with self._lock:
+                    self.rejected_count += 1
+                raise CircuitOpenError(f'{self.name} API circuit is open, not calling "{url}"')
+
+            try:
+                response = self._request('GET', url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.circuit_breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                logging.warning('%s API request failed: GET "%s"', self.name, url, exc_info=True)
+            else:
+                if response.status_code < 500:
+                    self.circuit_breaker.record_success()
+                    return response
+                self.circuit_breaker.record_failure()
+                if attempt >= self.max_retries:
+                    return response
+                logging.warning(
+                    '%s API responded with %s: GET "%s"', self.name, response.status_code, url
+                )
+
+            attempt += 1
+            with self._lock:
+                self.retry_count += 1
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started_at = time.monotonic()
+        try:
+            return self._session.request(method, url, **kwargs)
+        except:
+            with self._lock:
+                self.error_count += 1
+            raise
+        finally:
+            latency = time.monotonic() - started_at
+            with self._lock:
+                self.request_count += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def stats_to_dict(self):
+        return {
+            'request_count': self.request_count,
+            'error_count': self.error_count,
+            'retry_count': self.retry_count,
+            'rejected_count': self.rejected_count,
+            'avg_latency': self.total_latency / self.request_count if self.request_count else None,
+            'max_latency': self.max_latency,
+            'circuit_state': self.circuit_breaker.state,
+            'circuit_open_count': self.circuit_breaker.open_count,
+        }
+
+
+search_api_client = ApiClient('search')
+integration_api_client = ApiClient(
+    'integration',
+    # source syncs take long and should not be repeated
+    timeout=(config.HTTP_CLIENT_CONNECT_TIMEOUT, config.INTEGRATION_API_READ_TIMEOUT),
+    max_retries=0,
+)
@@ -8,6 +8,8 @@ celery_app = Celery(
     broker=config.CELERY_BROKER_URL,
     backend=config.CELERY_BROKER_URL
 )
+celery_app.conf.task_always_eager = config.CELERY_TASK_ALWAYS_EAGER
+celery_app.conf.task_track_started = True  # orderTaskState reports STARTED tasks
 celery_app.conf.task_routes = {
     'core.order.order_manager.*': {'queue': 'orders'},
     'core.cognito_sync.*': {'queue': 'orders'},  # TODO otereshchenko: configure 'users' queue ?
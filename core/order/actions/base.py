@@ -12,6 +12,9 @@ CHARSET = 'UTF-8'
 
 
 class Action:
+    # True for actions that only return the next (action, state) without touching the db or
+    # calling external services - only these can be run by OrderManager.run_bulk()
+    transition_only = False
 
     def run(self, order_id):
         raise NotImplementedError
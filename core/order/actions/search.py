@@ -3,8 +3,6 @@ import json
 import logging
 from datetime import datetime
 
-import requests
-
 from core import config
 from core.dbmethods import (
     get_order,
@@ -27,6 +25,7 @@ from core.db.models import (
     SEARCH_ACTION,
     STARTED_STATE,
 )
+from core.http_client import search_api_client
 from core.order.actions.base import Action
 from core.order.exceptions import OrderException
 
@@ -41,7 +40,7 @@ def do_search(number_wines, wine_types, themes, sources_budget, sent_wines):
     }
     url = config.SEARCH_API_URL + '/api/search'
     logging.info('calling search api: "%s" with params: %s', url, params)
-    response = requests.get(url, params=params)
+    response = search_api_client.get(url, params=params)
     logging.info('got response: %s', response.text)
     if response.status_code > 500:
         response.raise_for_status()
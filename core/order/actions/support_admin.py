@@ -71,6 +71,7 @@ class PlaceOrderAction(Action):
 
 
 class SetShippedAction(Action):
+    transition_only = True
 
     def run(self, order_id):
         logging.info('running SetShippedAction order_id: %s', order_id)
@@ -78,6 +79,7 @@ class SetShippedAction(Action):
 
 
 class SetUserReceivedAction(Action):
+    transition_only = True
 
     def run(self, order_id):
         logging.info('running SetUserReceivedAction order_id: %s', order_id)
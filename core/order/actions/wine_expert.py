@@ -28,6 +28,7 @@ class NotifyWineExpertAction(Action):
 
 
 class ApproveAction(Action):
+    transition_only = True
 
     def run(self, order_id):
         logging.info('approving order: %s', order_id)
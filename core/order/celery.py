@@ -6,20 +6,28 @@ gevent.monkey.patch_all()
 import logging
 
 from celery.schedules import crontab
+from celery.signals import task_prerun
 
 from core import (
     config,
     cognito_sync,
 )
+from core.db_routing import reset_db_routing
 from core.startup import create_app
 from core.order import (
     celery_app,
     order_manager,
 )
 
-app = create_app()
+app = create_app(SQLALCHEMY_POOL_SIZE=config.CELERY_SQLALCHEMY_POOL_SIZE)
 app.app_context().push()
 
+
+@task_prerun.connect
+def _reset_db_routing(**kwargs):
+    reset_db_routing()
+
+
 cognito_user_sync_cron_exp = config.COGNITO_USER_SYNC_CRON_EXP.split()
 if len(cognito_user_sync_cron_exp) != 5:
     raise ValueError(
@@ -4,3 +4,13 @@ class OrderException(Exception):
 
     def __init__(self, msg):
         self.msg = msg
+
+
+class OrderLockedException(OrderException):
+    """
+    The order is being run by another task - the requested action has not been run.
+    """
+
+
+class InvalidOrderActionException(OrderException):
+    pass
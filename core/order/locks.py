@@ -0,0 +1,91 @@
+# pylint: disable=invalid-name
+from contextlib import contextmanager
+
+import redis
+from sqlalchemy import text
+
+from core import config
+from core.db.models import db
+
+# the first key of the two-key advisory locks taken for orders
+ORDER_ADVISORY_LOCK_NAMESPACE = 1
+ENQUEUED_ORDER_KEY_PREFIX = 'm3:enqueued-order:'
+
+_redis_client = None
+
+
+@contextmanager
+def order_execution_lock(order_id):
+    """
+    Yields True if the PostgreSQL advisory lock of the order was acquired and False if another
+    process holds it. The lock is taken on a dedicated connection because the ORM session
+    commits (and gives its connection back to the pool) after every state change.
+    """
+    connection = db.engine.connect()
+    try:
+        acquired = connection.execute(
+            text('select pg_try_advisory_lock(:namespace, :order_id)'),
+            namespace=ORDER_ADVISORY_LOCK_NAMESPACE,
+            order_id=order_id,
+        ).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(
+                    text('select pg_advisory_unlock(:namespace, :order_id)'),
+                    namespace=ORDER_ADVISORY_LOCK_NAMESPACE,
+                    order_id=order_id,
+                )
+    finally:
+        connection.close()
+
+
+def try_order_transaction_locks(order_ids):
+    """
+    Returns the ids of the orders whose advisory locks were acquired in the current transaction
+    of the ORM session (they are released when it ends). Orders held by order_execution_lock()
+    in other processes are left out.
+    """
+    if not order_ids:
+        return []
+    return [order_id for order_id, in db.session.execute(
+        text(
+            'select id from unnest(cast(:order_ids as integer[])) id '
+            'where pg_try_advisory_xact_lock(:namespace, id)'
+        ),
+        {'order_ids': list(order_ids), 'namespace': ORDER_ADVISORY_LOCK_NAMESPACE},
+    )]
+
+
+def _get_redis_client():
+    global _redis_client  # pylint: disable=global-statement
+    if _redis_client is None:
+        _redis_client = redis.StrictRedis.from_url(config.CELERY_BROKER_URL)
+    return _redis_client
+
+
+def claim_order_enqueue(order_ids):
+    """
+    Returns the ids of the orders that are not waiting in a queue yet and marks them as waiting
+    (for ORDER_ENQUEUE_DEDUP_TTL seconds at most), so that duplicate enqueues collapse into one.
+    """
+    if config.CELERY_TASK_ALWAYS_EAGER:
+        # nothing waits in a queue
+        return list(order_ids)
+
+    pipeline = _get_redis_client().pipeline(transaction=False)
+    for order_id in order_ids:
+        pipeline.set(
+            ENQUEUED_ORDER_KEY_PREFIX + str(order_id), 1, nx=True, ex=config.ORDER_ENQUEUE_DEDUP_TTL
+        )
+    return [order_id for order_id, claimed in zip(order_ids, pipeline.execute()) if claimed]
+
+
+def release_order_enqueue(order_id):
+    """
+    Called when the task of the order starts - from now on the order can be enqueued again.
+    """
+    if config.CELERY_TASK_ALWAYS_EAGER:
+        return
+    _get_redis_client().delete(ENQUEUED_ORDER_KEY_PREFIX + str(order_id))
@@ -1,13 +1,26 @@
 # pylint: disable=fixme,no-member
 import logging
+import time
 import traceback
 
+from flask import current_app
+from gevent.pool import Pool
+
+from core import config
+from core.http_client import search_api_client
 from core.order import celery_app
+from core.order.locks import (
+    claim_order_enqueue,
+    order_execution_lock,
+    release_order_enqueue,
+    try_order_transaction_locks,
+)
 from core.dbmethods import (
+    claim_order_ids_to_run,
     create_order,
     move_order,
+    move_orders,
     get_order,
-    get_orders_to_run,
     get_timed_out_orders,
     get_wine_expert_for_order,
 )
@@ -79,7 +92,11 @@ from core.db.models import (
 from core.db.models.order import Order
 from core.order.actions.search import RetrySearchAction
 from core.order.actions.support_admin import SetUserReceivedAction
-from core.order.exceptions import OrderException
+from core.order.exceptions import (
+    InvalidOrderActionException,
+    OrderException,
+    OrderLockedException,
+)
 
 VALID_STATE_ACTIONS = {
     STARTED_STATE: {SEARCH_ACTION},
@@ -158,18 +175,153 @@ USER_ORDER_HISTORY_STATES = (
     COMPLETED_STATE,
 )
 
+ORDERS_QUEUE = 'orders'
+# actions calling the search API, SES or Stripe - they run on config.ORDER_EXTERNAL_QUEUE,
+# so that slow external calls do not hold up the quick state changes of other orders
+EXTERNAL_CALL_ACTIONS = {
+    SEARCH_ACTION,
+    NOTIFY_WINE_EXPERT_ACTION,
+    NOTIFY_USER_ACTION,
+    ACCEPT_ACTION,
+    NOTIFY_ACCEPTED_OFFER_ACTION,
+    PLACE_ORDER_ACTION,
+    CAPTURE_MONEY_ACTION,
+    NOTIFY_USER_SHIPPED_ACTION,
+    NOTIFY_EXCEPTION_ACTION,
+}
+
+
+def get_action_queue(action):
+    return config.ORDER_EXTERNAL_QUEUE if action in EXTERNAL_CALL_ACTIONS else ORDERS_QUEUE
+
+
+def get_task_queue(task):
+    """
+    Returns the queue the current request of the task was delivered from (None when the task
+    runs eagerly).
+    """
+    return (task.request.delivery_info or {}).get('routing_key')
+
 
 @celery_app.task
 def run_scheduled_orders():
     logging.info('running run_scheduled_orders')
-    orders = get_orders_to_run()
-    for order in orders:
-        run_order.delay(order.id)
+    try:
+        order_ids = [
+            order_id for order_id, in claim_order_ids_to_run(
+                limit=config.ORDER_SCHEDULER_MAX_ORDERS_PER_RUN
+            ).yield_per(config.ORDER_SCHEDULER_CHUNK_SIZE * 100)
+        ]
+        if order_ids:
+            # the row locks end with this transaction - the claim of the orders is kept by their
+            # enqueue marks until their tasks start, so orders still waiting in a queue since
+            # the previous tick are not enqueued again
+            order_ids = claim_order_enqueue(order_ids)
+            logging.info('enqueueing %s scheduled orders', len(order_ids))
+            chunk_size = config.ORDER_SCHEDULER_CHUNK_SIZE
+            for i in range(0, len(order_ids), chunk_size):
+                run_orders.delay(order_ids[i:i + chunk_size])
+    finally:
+        # the claimed rows stay locked until the orders are enqueued
+        db.session.commit()
+        db.session.close()
 
 
 @celery_app.task
-def run_order(order_id, action=None):
-    OrderManager(order_id).run_action(action=action)
+def run_orders(order_ids):
+    """
+    Batch mode of scheduled runs: the orders are run concurrently by a pool of
+    ORDER_SCHEDULER_CONCURRENCY greenlets (each with its own app context and database session),
+    so their search API calls are in flight at the same time. The pool size caps the number
+    of concurrent search API calls per worker process.
+    """
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    queue = get_task_queue(run_orders)
+
+    def _run_order(order_id):
+        with app.app_context():
+            try:
+                _run_order_exclusively(order_id, queue=queue)
+            except Exception:
+                logging.exception('Error while running order: %s', order_id)
+
+    Pool(config.ORDER_SCHEDULER_CONCURRENCY).map(_run_order, order_ids)
+    logging.info('search API client stats: %s', search_api_client.stats_to_dict())
+
+
+@celery_app.task
+def run_order(order_id, action=None, handover=False):
+    _run_order_exclusively(order_id, action, queue=get_task_queue(run_order), handover=handover)
+
+
+def _run_order_exclusively(order_id, action=None, queue=None, handover=False):
+    """
+    Runs the order under its execution lock, so that duplicate tasks of the order (or a task
+    and AcceptProductOffer) never run its actions at the same time. The remaining actions
+    are handed over once the lock is released.
+
+    Scheduled runs (no action) and hand-overs of follow-up actions (handover=True) are
+    skipped while the order runs elsewhere and continue with the order's current action when
+    their action has already been run. An explicitly requested action raises
+    OrderLockedException or InvalidOrderActionException instead.
+    """
+    release_order_enqueue(order_id)
+    explicit_action = action is not None and not handover
+
+    with order_execution_lock(order_id) as acquired:
+        if not acquired:
+            if explicit_action:
+                raise OrderLockedException(
+                    'Order: {} is already running - action: {} not run'.format(order_id, action)
+                )
+            logging.info('order: %s is already running - skipped', order_id)
+            return
+
+        manager = OrderManager(order_id)
+        if action is not None and not manager.is_action_valid(action):
+            if explicit_action:
+                raise InvalidOrderActionException(
+                    'Invalid action: {} for state: {}'.format(action, manager.order.state)
+                )
+            # the action has been run by a duplicate task (whose hand-over was collapsed
+            # into this task) - the order continues with its current action
+            logging.warning(
+                'Invalid action: %s for state: %s of order: %s - running action: %s instead',
+                action, manager.order.state, order_id, manager.order.action,
+            )
+            action = manager.order.action
+            if action is None:
+                return
+
+        next_action = manager.run_action(
+            action=action, time_budget=config.ORDER_STEP_TIME_BUDGET, queue=queue
+        )
+
+    if next_action is not None:
+        logging.info(
+            'handing over action: %s of order: %s to queue: %s',
+            next_action, order_id, get_action_queue(next_action),
+        )
+        enqueue_order(order_id, next_action, handover=True)
+
+
+def enqueue_order(order_id, action, handover=False):
+    """
+    Returns the AsyncResult of the run_order task or None if the order is already waiting
+    in a queue (the waiting task runs the order's current action anyway). handover=True
+    for follow-up actions of the order (see _run_order_exclusively()).
+    """
+    if not claim_order_enqueue([order_id]):
+        logging.info('order: %s is already enqueued - action: %s skipped', order_id, action)
+        return None
+    return run_order.apply_async(
+        (order_id,), {'action': action, 'handover': handover}, queue=get_action_queue(action)
+    )
+
+
+@celery_app.task
+def run_bulk_orders(order_ids, action):
+    OrderManager.run_bulk(order_ids, action)
 
 
 @celery_app.task
@@ -250,10 +402,35 @@ class OrderManager:
         )
         return cls(order.id)
 
-    def run_action(self, action=None):
+    def run_action(self, action=None, time_budget=None, queue=None):
+        """
+        Runs the action and then the follow-up actions of the order one by one. Without
+        time_budget the whole chain runs here. With it (in seconds) the loop stops once the
+        budget is used up or when the next action belongs to another queue than the one the
+        task runs on (queue, the queue of the first action if it is not known - see
+        get_action_queue()) and returns the next action to be handed over to a new run_order
+        task - every state change is committed, so the task can always resume from the order's
+        current action.
+        """
         _action = action or self.order.action
+        queue = queue or get_action_queue(_action)
+        started_at = time.monotonic()
 
-        if not self._is_action_valid(_action):
+        while True:
+            self._run_step(_action)
+
+            _action = self.order.action
+            if _action is None:
+                return None
+
+            if time_budget is not None and (
+                    time.monotonic() - started_at >= time_budget
+                    or get_action_queue(_action) != queue
+            ):
+                return _action
+
+    def _run_step(self, _action):
+        if not self.is_action_valid(_action):
             raise RuntimeError(
                 'Invalid action: {} for state: {}'.format(
                     _action, self.order.state
@@ -271,25 +448,91 @@ class OrderManager:
 
             db.session.rollback()
 
-            if isinstance(e, OrderException):
-                msg = e.msg
-            else:
-                msg = traceback.format_exc()
-            logging.exception('Error while executing action: %s', _action)
-            next_action = NOTIFY_EXCEPTION_ACTION
-            next_state = self.EXCEPTIONS.get(_action, EXCEPTION_TO_NOTIFY_STATE)
-            exception_msg = "Error while executing action: %s, for order: %s.\n\nException: %s" % (
-                _action, self.order.id, msg
+            next_action, next_state, exception_msg = self._get_exception_transition(
+                _action, self.order.id, e
             )
 
         self.order = move_order(
             self.order, action=next_action, state=next_state, exception_msg=exception_msg
         )
 
-        if self.order.action is None:
-            return
+    @classmethod
+    def run_bulk(cls, order_ids, action):
+        """
+        Runs a transition only action (see Action.transition_only) for many orders at once:
+        the orders are locked (orders running elsewhere are skipped), validated against
+        VALID_STATE_ACTIONS in memory (orders in other states are skipped) and moved with
+        move_orders(). Follow-up transition only actions are enqueued as one run_bulk_orders
+        task per next action, any other follow-up action is enqueued per order with
+        enqueue_order(). Returns (order_id, next_action, next_state, exception_msg) tuples.
+        """
+        action_class = cls.ACTIONS[action]
+        if not action_class.transition_only:
+            raise ValueError('Action: {} can not be run in bulk'.format(action))
+
+        locked_order_ids = try_order_transaction_locks(order_ids)
+        skipped_order_ids = set(order_ids) - set(locked_order_ids)
+        if skipped_order_ids:
+            logging.warning(
+                'orders: %s are already running - action: %s skipped',
+                sorted(skipped_order_ids), action,
+            )
 
-        self.run_action()
+        order_states = db.session.query(Order.id, Order.state).filter(
+            Order.id.in_(locked_order_ids)
+        ).with_for_update()
+
+        valid_order_ids = []
+        for order_id, state in order_states:
+            if action in VALID_STATE_ACTIONS[state]:
+                valid_order_ids.append(order_id)
+            else:
+                logging.warning(
+                    'Invalid action: %s for state: %s of order: %s', action, state, order_id
+                )
+
+        logging.info('running action: %s for %s orders', action, len(valid_order_ids))
+        action_instance = action_class()
+        transitions = [
+            (order_id,) + action_instance.run(order_id) + (None,) for order_id in valid_order_ids
+        ]
+        # commits, which also releases the locks
+        move_orders(transitions)
+
+        next_action_order_ids = {}
+        for order_id, next_action, _, _ in transitions:
+            if next_action is not None:
+                next_action_order_ids.setdefault(next_action, []).append(order_id)
+        for next_action, next_order_ids in next_action_order_ids.items():
+            if cls.ACTIONS[next_action].transition_only:
+                run_bulk_orders.apply_async(
+                    (next_order_ids, next_action), queue=get_action_queue(next_action)
+                )
+            else:
+                for order_id in next_order_ids:
+                    enqueue_order(order_id, next_action, handover=True)
 
-    def _is_action_valid(self, action):
+        return transitions
+
+    @classmethod
+    def _get_exception_transition(cls, action, order_id, e):
+        if isinstance(e, OrderException):
+            msg = e.msg
+        else:
+            msg = traceback.format_exc()
+        logging.exception('Error while executing action: %s', action)
+        next_action = NOTIFY_EXCEPTION_ACTION
+        next_state = cls.EXCEPTIONS.get(action, EXCEPTION_TO_NOTIFY_STATE)
+        exception_msg = "Error while executing action: %s, for order: %s.\n\nException: %s" % (
+            action, order_id, msg
+        )
+        return next_action, next_state, exception_msg
+
+    def is_action_valid(self, action):
         return action in VALID_STATE_ACTIONS[self.order.state]
+
+
+# quick state changes without external calls - SaveOrder runs them inline in the request
+INLINE_ACTIONS = {
+    action for action, action_class in OrderManager.ACTIONS.items() if action_class.transition_only
+}
@@ -0,0 +1,115 @@
+# pylint: disable=invalid-name
+import hashlib
+import json
+import time
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
+from threading import Lock
+
+from flask import (
+    g,
+    has_app_context,
+)
+
+from core import config
+
+CachedResponse = namedtuple('CachedResponse', [
+    'body',
+    'etag',
+    'expires_at',
+])
+
+
+def get_response_cache_key(document_hash, operation_name, variables):
+    if isinstance(variables, str):
+        return document_hash, operation_name, variables
+    return document_hash, operation_name, json.dumps(variables, sort_keys=True, default=str)
+
+
+def mark_response_uncacheable():
+    """
+    Called by whatever makes the response of the current request unfit for caching (mutations,
+    errors, node lookups of user-owned data).
+    """
+    if has_app_context():
+        g.m3_response_uncacheable = True
+
+
+def is_response_cacheable():
+    return not g.get('m3_response_uncacheable', False)
+
+
+def reset_response_cacheability():
+    g.pop('m3_response_uncacheable', None)
+
+
+class ResponseCache:
+    """
+    Encoded GraphQL responses of anonymous users keyed by (document hash, operation name,
+    variables) and served with strong ETags. The cache is process-local - mutations that change
+    what anonymous users see invalidate it in the current process only, other processes rely
+    on TTL.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._responses = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None and cached.expires_at > now:
+                self._responses.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            return None
+
+    def set(self, key, body):
+        cached = CachedResponse(
+            body=body,
+            etag=hashlib.sha256(body).hexdigest(),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            self._responses[key] = cached
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+        return cached
+
+    def invalidate(self):
+        with self._lock:
+            self._responses.clear()
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats_to_dict(self):
+        return {
+            'size': len(self._responses),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    config.GRAPHQL_RESPONSE_CACHE_TTL, config.GRAPHQL_RESPONSE_CACHE_SIZE
+)
@@ -1,16 +1,57 @@
 # pylint: disable=invalid-name
+import json
 import logging
 from flask import (
+    g,
     request,
+    jsonify,
     Blueprint,
+    Response,
 )
 from flask_graphql import GraphQLView
+from graphql.error import GraphQLError
+from graphql_server import HttpQueryError
+from core import config
 from core.config import (
     DEBUG,
     LOG_GQL,
 )
+from core.dbmethods.catalog import catalog_cache
+from core.dbmethods.rates import rate_index
 from core.graphql import schema
-from core.cognito import anonymous_user_permission
+from core.graphql.catalog_snapshot import catalog_snapshot_cache
+from core.graphql.count_cache import total_count_cache
+from core.graphql.data_loaders import reset_data_loaders
+from core.graphql.query_cache import (
+    get_document_hash,
+    query_document_cache,
+)
+from core.cognito import (
+    admin_user_permission,
+    anonymous_user_permission,
+    system_user_permission,
+)
+from core.http_client import (
+    integration_api_client,
+    search_api_client,
+)
+from core.response_cache import (
+    get_response_cache_key,
+    is_response_cacheable,
+    mark_response_uncacheable,
+    reset_response_cacheability,
+    response_cache,
+)
+from core.sql_stats import (
+    get_sql_query_count,
+    reset_sql_query_count,
+)
+from core.tracing import (
+    finish_request_trace,
+    resolver_metrics,
+    resolver_tracing_middleware,
+    start_request_trace,
+)
 
 core_blueprint = Blueprint('core', __name__)
 
@@ -27,7 +68,201 @@ logger = logging.getLogger(__name__)
 #     return wrapper
 
 
-class LoggingGraphQLView(GraphQLView):
+@core_blueprint.before_request
+def reset_request_scope():
+    # data loaders cache loaded rows, they should never outlive a request
+    reset_data_loaders()
+    reset_sql_query_count()
+    reset_response_cacheability()
+
+
+def _get_extensions(data):
+    extensions = data.get('extensions') or request.args.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpQueryError(400, 'Extensions are invalid JSON.')
+
+    if not isinstance(extensions, dict):
+        return None
+    return extensions
+
+
+def _get_persisted_query_extension(data):
+    extensions = _get_extensions(data)
+    if not extensions:
+        return None
+    return extensions.get('persistedQuery')
+
+
+class PersistedQueryGraphQLView(GraphQLView):
+    """
+    Supports persisted queries (the protocol of Apollo "automatic persisted queries"): a client
+    sends ``extensions.persistedQuery.sha256Hash`` instead of the full query. If the hash is
+    unknown "PersistedQueryNotFound" error is returned and the client is expected to repeat the
+    request with both the hash and the query (which registers the query).
+    """
+
+    _raw_body = None
+
+    def parse_raw_body(self):
+        # the body as sent - before the persisted query is looked up
+        if self._raw_body is None:
+            self._raw_body = super().parse_body()
+        return self._raw_body
+
+    def parse_body(self):
+        data = self.parse_raw_body()
+        if not isinstance(data, dict):
+            return data  # batch requests are not supported by persisted queries
+
+        persisted_query = _get_persisted_query_extension(data)
+        if not persisted_query:
+            return data
+
+        document_hash = persisted_query.get('sha256Hash')
+        if not document_hash:
+            raise HttpQueryError(400, 'persistedQuery.sha256Hash is missing.')
+
+        data = data.to_dict() if hasattr(data, 'to_dict') else dict(data)
+        query = data.get('query') or request.args.get('query')
+        if query:
+            try:
+                query_document_cache.register(self.schema, document_hash, query)
+            except ValueError as e:
+                raise HttpQueryError(400, str(e))
+            except GraphQLError:
+                pass  # syntax errors are going to be reported by regular query execution
+        else:
+            query = query_document_cache.get_document_string(document_hash)
+            if not query:
+                # the client is about to repeat the request with the query
+                mark_response_uncacheable()
+                raise HttpQueryError(200, 'PersistedQueryNotFound')
+
+        data['query'] = query
+        return data
+
+
+def _is_anonymous_request():
+    # the M3_SECRET identity - the same for every visitor (see core.cognito.identity_loader)
+    identity = g.identity
+    return (
+        identity.auth_type == 'SECRET' and
+        anonymous_user_permission.can() and
+        not system_user_permission.can()
+    )
+
+
+def _make_cached_response(cached):
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        response = Response(cached.body, status=200, content_type='application/json')
+    response.set_etag(cached.etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+class ResponseCachingGraphQLView(PersistedQueryGraphQLView):
+    """
+    Responses to queries of anonymous users are cached by (document hash, operation name,
+    variables) and revalidated with ETag / If-None-Match. The anonymous identity is the same for
+    every visitor, so fields resolved with the identity (isSelected, ...) are cached as well.
+    Responses of mutations and responses with errors are never cached (see
+    core.response_cache.mark_response_uncacheable()).
+
+    The document hash of a persisted query is the one sent by the client, a cached response is
+    served without looking the document up.
+    """
+
+    _parsed_body = None
+
+    def parse_body(self):
+        # the view is instantiated per request, the body is parsed once for the cache key and
+        # for the execution
+        if self._parsed_body is None:
+            self._parsed_body = super().parse_body()
+        return self._parsed_body
+
+    def dispatch_request(self):
+        try:
+            cache_key = self._get_response_cache_key()
+        except HttpQueryError:
+            cache_key = None  # the error is reported by regular query execution
+
+        if cache_key is None:
+            return super().dispatch_request()
+
+        cached = response_cache.get(cache_key)
+        if cached is None:
+            response = super().dispatch_request()
+            if response.status_code != 200 or not is_response_cacheable():
+                return response
+            cached = response_cache.set(cache_key, response.get_data())
+
+        return _make_cached_response(cached)
+
+    def _get_response_cache_key(self):
+        if not config.GRAPHQL_RESPONSE_CACHE_TTL or not _is_anonymous_request():
+            return None
+        if request.method == 'GET' and self.should_display_graphiql():
+            return None
+
+        data = self.parse_raw_body()
+        if not isinstance(data, dict):
+            return None  # batch requests are not cached
+
+        persisted_query = _get_persisted_query_extension(data)
+        document_hash = persisted_query and persisted_query.get('sha256Hash')
+        if not document_hash:
+            query = data.get('query') or request.args.get('query')
+            if not query:
+                return None
+            document_hash = get_document_hash(query)
+        return get_response_cache_key(
+            document_hash,
+            data.get('operationName') or request.args.get('operationName'),
+            data.get('variables') or request.args.get('variables'),
+        )
+
+
+class TracingGraphQLView(ResponseCachingGraphQLView):
+    """
+    Resolver timings of every request are aggregated in core.tracing.resolver_metrics
+    (see /metrics). An admin gets the timings of the request in ``extensions.tracing`` of the
+    response if the request has ``"extensions": {"tracing": true}``.
+    """
+
+    def dispatch_request(self):
+        if not config.GRAPHQL_TRACING:
+            return super().dispatch_request()
+
+        start_request_trace()
+        try:
+            response = super().dispatch_request()
+        finally:
+            trace = finish_request_trace()
+
+        if trace.paths and response.status_code == 200 and self._is_tracing_requested():
+            result = json.loads(response.get_data())
+            result.setdefault('extensions', {})['tracing'] = trace.to_dict()
+            response.set_data(json.dumps(result, separators=(',', ':')))
+        return response
+
+    def _is_tracing_requested(self):
+        if not admin_user_permission.can():
+            return False
+        try:
+            data = self.parse_body()
+            extensions = _get_extensions(data) if isinstance(data, dict) else None
+        except HttpQueryError:
+            return False
+        return bool(extensions and extensions.get('tracing'))
+
+
+class LoggingGraphQLView(TracingGraphQLView):
 
     def dispatch_request(self):
         try:
@@ -39,19 +274,47 @@ class LoggingGraphQLView(GraphQLView):
 
         try:
             logger.info('Response: %s', response.response)
+            logger.info('SQL queries executed: %s', get_sql_query_count())
         except Exception as e:
             logger.error('Can not log response: %s', e)
 
         return response
 
 
-graphql_view = LoggingGraphQLView if LOG_GQL else GraphQLView
+graphql_view = LoggingGraphQLView if LOG_GQL else TracingGraphQLView
 
 core_blueprint.add_url_rule(
     '/',
     view_func=anonymous_user_permission.require(http_exception=401)(
         # access_control_allow_origin(
-        graphql_view.as_view('graphql', schema=schema, graphiql=DEBUG)
+        graphql_view.as_view(
+            'graphql', schema=schema, graphiql=DEBUG, backend=query_document_cache,
+            middleware=resolver_tracing_middleware if config.GRAPHQL_TRACING else None,
+        )
         # )
     )
 )
+
+
+@core_blueprint.route('/stats')
+@system_user_permission.require(http_exception=401)
+def stats():
+    # all of these are counters of the web process that serves the request - the API clients of
+    # the Celery workers (which make most of the search API calls) log theirs after every
+    # batch of scheduled orders (see core.order.order_manager.run_orders())
+    return jsonify(
+        query_cache=query_document_cache.stats_to_dict(),
+        total_count_cache=total_count_cache.stats_to_dict(),
+        rate_index=rate_index.stats_to_dict(),
+        catalog_cache=catalog_cache.stats_to_dict(),
+        catalog_snapshot=catalog_snapshot_cache.stats_to_dict(),
+        response_cache=response_cache.stats_to_dict(),
+        search_api_client=search_api_client.stats_to_dict(),
+        integration_api_client=integration_api_client.stats_to_dict(),
+    )
+
+
+@core_blueprint.route('/metrics')
+@system_user_permission.require(http_exception=401)
+def metrics():
+    return jsonify(resolvers=resolver_metrics.stats_to_dict())
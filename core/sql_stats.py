@@ -0,0 +1,43 @@
+# pylint: disable=unused-argument
+from flask import (
+    g,
+    has_app_context,
+)
+from sqlalchemy import (
+    event,
+    text,
+)
+from sqlalchemy.engine import Engine
+
+
+def _count_sql_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.m3_sql_query_count = g.get('m3_sql_query_count', 0) + 1
+
+
+def register_sql_query_counter():
+    if not event.contains(Engine, 'before_cursor_execute', _count_sql_query):
+        event.listen(Engine, 'before_cursor_execute', _count_sql_query)
+
+
+def reset_sql_query_count():
+    g.m3_sql_query_count = 0
+
+
+def get_sql_query_count():
+    return g.get('m3_sql_query_count', 0)
+
+
+def get_table_change_count_query(*tables):
+    """
+    Returns a query of the number of rows inserted, updated and deleted in the tables since
+    the statistics were reset - a change marker that costs no scan of the tables. PostgreSQL
+    reports the counters of a transaction after it ends (within a second or so) and only with
+    track_counts on (the default). The snapshot of the statistics is cleared first, so that
+    a long transaction of the caller sees new counts.
+    """
+    return text('''
+        select pg_stat_clear_snapshot(), coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+        from pg_stat_user_tables
+        where relid in ({})
+    '''.format(', '.join("'{}'::regclass".format(table) for table in tables)))
@@ -3,9 +3,12 @@ import gevent.monkey
 
 gevent.monkey.patch_all()
 
-#from psycogreen.gevent import patch_psycopg
+from core import config
 
-#patch_psycopg()
+if config.DB_COOPERATIVE:
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
 
 import logging
 
@@ -18,7 +21,7 @@ from flask import (
     Response,
 )
 from core.cognito import (
-    populate_jwk_dict,
+    jwks_manager,
     exchange_auth_code_for_jwts,
 )
 from core.extensions import register_extensions
@@ -29,16 +32,18 @@ from core.db.models.domain_category import DomainCategory
 logging.basicConfig(level=logging.INFO)
 
 
-def create_app():
+def create_app(**config_overrides):
     app = Flask(__name__)
     app.config.from_pyfile('config.py')
+    app.config.update(config_overrides)
 
     register_extensions(app)
     register_blueprints(app)
+    jwks_manager.init_app(app)
 
     @app.before_first_request
     def startup_routine():
-        populate_jwk_dict()
+        jwks_manager.start_background_refresh()
         _load_domain_category_id()
 
     @app.route('/health')
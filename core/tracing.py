@@ -0,0 +1,245 @@
+# pylint: disable=unused-argument,invalid-name
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask import (
+    g,
+    has_app_context,
+)
+from graphql.execution.middleware import MiddlewareManager
+from promise import (
+    is_thenable,
+    Promise,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core import config
+
+# SQL executed while no resolver is running - mostly batches of data loaders, which are
+# dispatched after the resolvers that requested the rows have returned
+DEFERRED_PATH = '(deferred)'
+
+# upper bounds (ms) of the wall time histogram buckets, the last bucket is unbounded
+WALL_TIME_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def get_resolver_path(info):
+    # list indices are left out: userManagement.users.edges.node.userSubscription
+    return '.'.join(key for key in info.path if isinstance(key, str))
+
+
+class PathTiming:
+    __slots__ = ('calls', 'wall_time', 'sql_count', 'sql_time')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'wall_time_ms': round(self.wall_time * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_time_ms': round(self.sql_time * 1000, 3),
+        }
+
+
+class RequestTrace:
+    """
+    Resolver timings of one GraphQL request: {resolver path: PathTiming}. SQL statements are
+    attributed to the resolver that is running when they are executed.
+    """
+
+    def __init__(self):
+        self.operation_name = None
+        self.current_path = None
+        self.paths = {}
+        self._started_at = time.perf_counter()
+
+    def get_path_timing(self, path):
+        timing = self.paths.get(path)
+        if timing is None:
+            timing = self.paths[path] = PathTiming()
+        return timing
+
+    def add_sql(self, sql_time):
+        timing = self.get_path_timing(self.current_path or DEFERRED_PATH)
+        timing.sql_count += 1
+        timing.sql_time += sql_time
+
+    def to_dict(self):
+        return {
+            'operation_name': self.operation_name,
+            'duration_ms': round((time.perf_counter() - self._started_at) * 1000, 3),
+            'resolvers': {path: timing.to_dict() for path, timing in self.paths.items()},
+        }
+
+
+def start_request_trace():
+    g.m3_request_trace = RequestTrace()
+    return g.m3_request_trace
+
+
+def finish_request_trace():
+    trace = g.pop('m3_request_trace', None)
+    if trace is not None and trace.paths:
+        resolver_metrics.record(trace)
+    return trace
+
+
+def _get_request_trace():
+    if has_app_context():
+        return g.get('m3_request_trace')
+    return None
+
+
+class ResolverTracingMiddleware:
+    """
+    Graphene middleware measuring wall time of every resolver of a traced request (see
+    start_request_trace()). The time of a resolver that returns a promise (a data loader) is
+    measured till the promise is resolved.
+    """
+
+    @staticmethod
+    def resolve(next_resolver, root, info, **args):
+        trace = _get_request_trace()
+        if trace is None:
+            return next_resolver(root, info, **args)
+
+        if trace.operation_name is None and info.operation.name:
+            trace.operation_name = info.operation.name.value
+
+        path = get_resolver_path(info)
+        timing = trace.get_path_timing(path)
+        timing.calls += 1
+
+        parent_path = trace.current_path
+        trace.current_path = path
+        started_at = time.perf_counter()
+        try:
+            result = next_resolver(root, info, **args)
+        finally:
+            trace.current_path = parent_path
+
+        if is_thenable(result):
+            def _add_wall_time(value):
+                timing.wall_time += time.perf_counter() - started_at
+                return value
+
+            return Promise.resolve(result).then(_add_wall_time)
+
+        timing.wall_time += time.perf_counter() - started_at
+        return result
+
+
+# results are not wrapped in promises (the default of graphql-core) - that would slow down
+# every field
+resolver_tracing_middleware = MiddlewareManager(ResolverTracingMiddleware(), wrap_in_promise=False)
+
+
+# the start time is kept on the execution context of the statement, so nothing is left behind
+# when the statement raises (and after_cursor_execute is not called)
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _get_request_trace() is not None:
+        context.m3_sql_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _get_request_trace()
+    started_at = getattr(context, 'm3_sql_started_at', None)
+    if trace is not None and started_at is not None:
+        trace.add_sql(time.perf_counter() - started_at)
+
+
+def register_sql_tracing():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class PathHistogram:
+    """
+    Aggregated timings of one (operation name, resolver path) - one observation per request.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.calls = 0
+        self.wall_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.wall_time_buckets = [0] * (len(WALL_TIME_BUCKETS_MS) + 1)
+
+    def add(self, timing):
+        self.requests += 1
+        self.calls += timing.calls
+        self.wall_time += timing.wall_time
+        self.sql_count += timing.sql_count
+        self.sql_time += timing.sql_time
+        self.wall_time_buckets[bisect_left(WALL_TIME_BUCKETS_MS, timing.wall_time * 1000)] += 1
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'calls': self.calls,
+            'wall_time_ms': round(self.wall_time * 1000, 3),
+            'wall_time_ms_buckets': self.wall_time_buckets,
+            'sql_count': self.sql_count,
+            'sql_time_ms': round(self.sql_time * 1000, 3),
+        }
+
+
+class ResolverMetrics:
+    """
+    Process-local histograms of resolver timings by (operation name, resolver path). At most
+    max_paths keys are kept, timings of new paths are dropped (and counted) beyond that.
+    """
+
+    def __init__(self, max_paths):
+        self.max_paths = max_paths
+        self.request_count = 0
+        self.dropped = 0
+
+        self._histograms = {}
+        self._lock = Lock()
+
+    def record(self, trace):
+        with self._lock:
+            self.request_count += 1
+            for path, timing in trace.paths.items():
+                key = (trace.operation_name, path)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    if len(self._histograms) >= self.max_paths:
+                        self.dropped += 1
+                        continue
+                    histogram = self._histograms[key] = PathHistogram()
+                histogram.add(timing)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self.request_count = 0
+            self.dropped = 0
+
+    def stats_to_dict(self):
+        with self._lock:
+            paths = [
+                {'operation_name': operation_name, 'path': path, **histogram.to_dict()}
+                for (operation_name, path), histogram in self._histograms.items()
+            ]
+        paths.sort(key=lambda p: p['wall_time_ms'] + p['sql_time_ms'], reverse=True)
+        return {
+            'request_count': self.request_count,
+            'max_paths': self.max_paths,
+            'dropped': self.dropped,
+            'wall_time_ms_bucket_bounds': WALL_TIME_BUCKETS_MS,
+            'paths': paths,
+        }
+
+
+resolver_metrics = ResolverMetrics(config.GRAPHQL_TRACING_MAX_PATHS)
@@ -8,6 +8,13 @@ import pytest
 
 from core.startup import create_app
 from core.db.models import db
+from core.dbmethods.catalog import catalog_cache
+from core.dbmethods.rates import rate_index
+from core.dbmethods.search import create_search_indexes
+from core.graphql.catalog_snapshot import catalog_snapshot_cache
+from core.graphql.count_cache import total_count_cache
+from core.response_cache import response_cache
+from core.tracing import resolver_metrics
 
 pytest_plugins = [
     'tests.fixtures.authorization',
@@ -69,6 +76,7 @@ def app(monkeypatch, sample_jwks):
 
     assert os.environ['SQLALCHEMY_DATABASE_URI'].endswith('m3_test')
     db.session.rollback()  # kill hanging "in-progress" transaction if any (happens when previous tests fail)
+    create_search_indexes()  # no-op once they exist
     db.engine.execute(
         '''
         delete from themes_example_wines;
@@ -101,6 +109,12 @@ def app(monkeypatch, sample_jwks):
         delete from users;
         '''
     )
+    total_count_cache.clear()
+    rate_index.clear()
+    catalog_cache.clear()
+    catalog_snapshot_cache.clear()
+    response_cache.clear()
+    resolver_metrics.clear()
 
     yield app
 
@@ -1,5 +1,8 @@
 # pylint: disable=attribute-defined-outside-init
 import json
+from unittest.mock import patch
+
+import jwt
 import pytest
 
 
@@ -127,6 +130,16 @@ class TestAuthorization:
         resp = self._request_user('JWT ' + expired_jwt)
         assert resp.status_code == 401
 
+    def test_verified_jwt_is_cached(self, valid_jwt):
+        with patch('core.cognito.jwt.decode', wraps=jwt.decode) as decode_m:
+            resp = self._request_domain_cards('JWT ' + valid_jwt)
+            _assert_graphql_data_returned(resp, 'domainCards')
+
+            resp = self._request_user('JWT ' + valid_jwt)
+            _assert_graphql_data_returned(resp, 'user')
+
+        assert decode_m.call_count == 1
+
     def _request_api(self, authorization, query):
         return self._client.post(
             self._api_url,
@@ -0,0 +1,47 @@
+#
+# pylint: disable=unused-argument
+import time
+from unittest.mock import patch
+
+from core.db.models import db
+from core.db.models.source import Source
+from core.dbmethods.catalog import catalog_cache
+
+
+def test_catalog_cache_read_through_and_expiry(app, master_product_1, source_1):
+    master_product = catalog_cache.get_master_product(master_product_1.id)
+    assert master_product.source_id == source_1.id
+    assert catalog_cache.get_source(source_1.id).name == 'source_1'
+
+    source_1.name = 'renamed'
+    db.session.commit()
+
+    # cached rows are returned until their TTL runs out
+    assert catalog_cache.get_master_product(master_product_1.id) == master_product
+    assert catalog_cache.get_source(source_1.id).name == 'source_1'
+    assert catalog_cache.stats_to_dict()['hits'] == 2
+    assert catalog_cache.stats_to_dict()['misses'] == 2
+
+    expired_at = time.monotonic() + catalog_cache.ttl + 1
+    with patch('core.dbmethods.catalog.time.monotonic', return_value=expired_at):
+        assert catalog_cache.get_source(source_1.id).name == 'renamed'
+    assert catalog_cache.get_master_product(-1) is None
+
+
+def test_catalog_cache_dropped_on_catalog_change(app, monkeypatch, master_product_1, source_1):
+    monkeypatch.setattr(catalog_cache, 'check_interval', 0)
+    assert catalog_cache.get_source(source_1.id).name == 'source_1'
+
+    # an integration sync writes the catalog from another service
+    db.session.execute(Source.__table__.update().values(name='renamed'))
+    db.session.commit()
+
+    # PostgreSQL reports the change counters of the tables shortly after the commit
+    for _ in range(100):
+        if catalog_cache.get_source(source_1.id).name == 'renamed':
+            break
+        db.session.rollback()
+        time.sleep(0.1)
+
+    assert catalog_cache.get_source(source_1.id).name == 'renamed'
+    assert catalog_cache.stats_to_dict()['invalidations'] >= 1
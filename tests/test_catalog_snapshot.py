@@ -0,0 +1,100 @@
+#
+# pylint: disable=unused-argument,too-many-arguments
+import time
+from unittest.mock import patch
+
+from core.db.models import db
+from core.graphql.catalog_snapshot import (
+    build_catalog_snapshot,
+    catalog_snapshot_cache,
+)
+
+themes_query = '''
+    query {
+      themes {
+        edges {
+          node {
+            id
+            title
+            isSelected
+            themeGroup {
+              id
+              title
+              user {
+                firstName}}
+            exampleWines {
+              edges {
+                node {
+                  id
+                  name
+                  topProductReview {
+                    reviewScore}}}}}}}
+      themeGroups {
+        edges {
+          node {
+            id
+            title
+            themes {
+              edges {
+                node {
+                  title}}}}}}
+    }
+'''
+
+
+def test_catalog_served_from_snapshot_and_from_db_is_the_same(
+        graphql_client_anonymous, monkeypatch, theme_1, theme_2, theme_3, theme_4, theme_5,
+        theme_6, theme_7, theme_8, theme_9, theme_10, empty_theme_group, theme_example_wine_1,
+        theme_example_wine_2,
+):
+    from_snapshot = graphql_client_anonymous.post(themes_query)
+    assert catalog_snapshot_cache.build_count == 1
+
+    monkeypatch.setattr('core.config.CATALOG_SNAPSHOT_CHECK_INTERVAL', 0)
+    from_db = graphql_client_anonymous.post(themes_query)
+
+    assert 'errors' not in from_snapshot
+    assert from_snapshot == from_db
+    assert catalog_snapshot_cache.build_count == 1
+
+
+def test_catalog_snapshot_is_rebuilt_on_change(graphql_client_anonymous, monkeypatch, theme_4):
+    monkeypatch.setattr(catalog_snapshot_cache, 'check_interval', 0)
+    res = graphql_client_anonymous.post(themes_query)
+    assert res['data']['themes']['edges'][0]['node']['title'] == 'theme 4'
+
+    graphql_client_anonymous.post(themes_query)
+    assert catalog_snapshot_cache.build_count == 1
+
+    theme_4.title = 'renamed'
+    db.session.commit()
+
+    # PostgreSQL reports the change counters of the tables shortly after the commit
+    for _ in range(100):
+        res = graphql_client_anonymous.post(themes_query)
+        if res['data']['themes']['edges'][0]['node']['title'] == 'renamed':
+            break
+        db.session.rollback()
+        time.sleep(0.1)
+
+    assert res['data']['themes']['edges'][0]['node']['title'] == 'renamed'
+    assert catalog_snapshot_cache.build_count == 2
+
+
+@patch(
+    'core.graphql.catalog_snapshot.build_catalog_snapshot',
+    side_effect=RuntimeError('db is down'),
+)
+def test_catalog_served_from_db_without_snapshot(
+        build_m, graphql_client_anonymous, theme_4, theme_example_wine_1
+):
+    res = graphql_client_anonymous.post(themes_query)
+    assert 'errors' not in res
+    assert res['data']['themes']['edges'][0]['node']['title'] == 'theme 4'
+    assert catalog_snapshot_cache.build_count == 0
+
+    # the failed build is retried by the next request
+    build_m.side_effect = build_catalog_snapshot
+    from_snapshot = graphql_client_anonymous.post(themes_query)
+    assert from_snapshot == res
+    assert catalog_snapshot_cache.build_count == 1
@@ -0,0 +1,64 @@
+#
+# pylint: disable=unused-argument,invalid-name
+from core.db.models import db
+from core.db.models.user_address import UserAddress
+from core.db.models.user_subscription import UserSubscription
+from core.dbmethods import create_order
+from core.dbmethods.user import create_user
+from core.sql_stats import get_sql_query_count
+
+users_with_orders_query = '''
+    query {
+        userManagement {
+          users(first: 100) {
+            edges {
+              node {
+                firstName
+                userSubscription {
+                  monthToProcess
+                }
+                proposedOrder {
+                  orderNumber
+                  shippingTrackingUrl
+                }
+                upcomingOrder {
+                  orderNumber
+                }
+                allOrders {
+                  orderNumber}}}}}}
+'''
+
+
+def _create_users_with_orders(count):
+    for i in range(count):
+        _user = create_user('data-loader-test-sub-' + str(i) + '-' + str(count))
+        _user.first_name = 'data loader user'
+
+        address = UserAddress(user_id=_user.id, city='New York', country='US')
+        subscription = UserSubscription(user_id=_user.id, type='mixed', budget=100, bottle_qty=2)
+        db.session.add(address)
+        db.session.add(subscription)
+        db.session.flush()
+
+        _user.primary_user_address_id = address.id
+        _user.primary_user_subscription_id = subscription.id
+        db.session.commit()
+
+        create_order(_user.id, subscription.id)
+
+
+def _get_users_with_orders_query_count(graphql_client_admin):
+    res = graphql_client_admin.post(users_with_orders_query)
+    assert 'errors' not in res
+    return get_sql_query_count(), len(res['data']['userManagement']['users']['edges'])
+
+
+def test_query_count_does_not_depend_on_number_of_users(graphql_client_admin, user2, wine_expert):
+    _create_users_with_orders(2)
+    query_count_1, user_count_1 = _get_users_with_orders_query_count(graphql_client_admin)
+
+    _create_users_with_orders(4)
+    query_count_2, user_count_2 = _get_users_with_orders_query_count(graphql_client_admin)
+
+    assert user_count_2 == user_count_1 + 4
+    assert query_count_2 == query_count_1
@@ -0,0 +1,29 @@
+#
+# pylint: disable=unused-argument
+import time
+
+import gevent
+
+from core.db.models import db
+
+
+def test_requests_are_served_while_slow_query_runs(app):
+    client = app.test_client()
+    served_at = []
+
+    def slow_query():
+        with db.engine.connect() as connection:
+            connection.execute('select pg_sleep(1)')
+        return time.monotonic()
+
+    def request():
+        gevent.sleep(0.1)
+        assert client.get('/health').status_code == 200
+        served_at.append(time.monotonic())
+
+    slow_query_greenlet = gevent.spawn(slow_query)
+    gevent.joinall([slow_query_greenlet] + [gevent.spawn(request) for _ in range(5)], raise_error=True)
+
+    # the requests did not wait for the query (psycopg2 yields to the gevent hub)
+    assert len(served_at) == 5
+    assert max(served_at) < slow_query_greenlet.value - 0.5
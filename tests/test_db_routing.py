@@ -0,0 +1,85 @@
+#
+# pylint: disable=unused-argument,redefined-outer-name
+import os
+
+import pytest
+from graphene import Node
+from sqlalchemy import event
+
+from core.db.models import db
+from core.db_routing import REPLICA_BIND
+
+orders_query = '''
+    query {
+      orderManagement {
+        orders(first: 1) {
+          edges {
+            node {
+              shippingName}}}}}
+'''
+
+save_order_mutation = '''
+    mutation($input: SaveOrderInput!) {
+      saveOrder(input: $input) {
+        order {
+          shippingName}}}
+'''
+
+
+class StatementCounter:
+
+    def __init__(self, engine):
+        self.count = 0
+        self._engine = engine
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def remove(self):
+        event.remove(self._engine, 'before_cursor_execute', self._count)
+
+
+@pytest.fixture
+def replica_engine(app):
+    """
+    A second engine stands in for the replica - by default it connects to the test database
+    itself (SQLALCHEMY_TEST_REPLICA_URI may point to a real replica of it).
+    """
+    app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: os.environ.get(
+        'SQLALCHEMY_TEST_REPLICA_URI', app.config['SQLALCHEMY_DATABASE_URI']
+    )}
+    db.session.remove()
+
+    yield db.get_engine(app, bind=REPLICA_BIND)
+
+    app.config['SQLALCHEMY_BINDS'] = None
+    db.session.remove()
+
+
+def test_queries_read_from_replica_until_mutation(
+        replica_engine, graphql_client_admin, accepted_order
+):
+    primary_statements = StatementCounter(db.engine)
+    replica_statements = StatementCounter(replica_engine)
+    try:
+        res = graphql_client_admin.post(orders_query)
+        assert res['data']['orderManagement']['orders']['edges']
+        assert replica_statements.count > 0
+
+        replica_statements.count = 0
+        res = graphql_client_admin.post(save_order_mutation, variables={'input': {
+            'id': Node.to_global_id('Order', accepted_order.id),
+            'shippingName': 'new name',
+        }})
+        assert res['data']['saveOrder']['order']['shippingName'] == 'new name'
+        assert replica_statements.count == 0
+
+        # the test client requests share one app context - it has written, so it sticks
+        # to the primary (read-your-writes)
+        res = graphql_client_admin.post(orders_query)
+        assert res['data']['orderManagement']['orders']['edges']
+        assert replica_statements.count == 0
+    finally:
+        primary_statements.remove()
+        replica_statements.remove()
@@ -1,4 +1,6 @@
 # pylint: disable=unused-argument
+from unittest.mock import patch
+
 from core.dbmethods import get_sources_budget
 
 
@@ -11,3 +13,13 @@ def test_no_shipping_data(
     )
 
     assert res == {source_location.source_id: 82}
+
+
+@patch('core.dbmethods.rates.RateIndex._load', side_effect=RuntimeError('db is down'))
+def test_sources_budget_on_rates_error(load_m, app, source_location, shipping_rate, salestax_rate):
+    assert get_sources_budget([source_location.source_id], 100, 2, 123) == {}
+
+    # the failed load is retried by the next call
+    load_m.side_effect = None
+    get_sources_budget([source_location.source_id], 100, 2, 123)
+    assert load_m.call_count == 2
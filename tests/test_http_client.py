@@ -0,0 +1,55 @@
+#
+# pylint: disable=protected-access
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from core.http_client import (
+    ApiClient,
+    CircuitOpenError,
+    CIRCUIT_CLOSED,
+    CIRCUIT_OPEN,
+)
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr('core.http_client.time.sleep', MagicMock())
+
+
+def _create_api_client(reset_timeout):
+    client = ApiClient('test', max_retries=2, backoff=0, failure_threshold=3, reset_timeout=reset_timeout)
+    client._session = MagicMock()
+    return client
+
+
+def test_failed_requests_are_retried_until_circuit_opens(no_sleep):
+    client = _create_api_client(reset_timeout=3600)
+    client._session.request.side_effect = requests.exceptions.ConnectionError('unavailable')
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('https://search.api/api/search')
+    assert client._session.request.call_count == 3
+    assert client.stats_to_dict()['retry_count'] == 2
+    assert client.circuit_breaker.state == CIRCUIT_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.get('https://search.api/api/search')
+    assert client._session.request.call_count == 3
+    assert client.stats_to_dict()['rejected_count'] == 1
+
+
+def test_server_errors_are_retried_and_circuit_closes_after_trial_request(no_sleep):
+    client = _create_api_client(reset_timeout=0)
+    error_response = MagicMock(status_code=503)
+    ok_response = MagicMock(status_code=200)
+    client._session.request.side_effect = [error_response] * 3 + [ok_response]
+
+    assert client.get('https://search.api/api/search') is error_response
+    assert client.circuit_breaker.state == CIRCUIT_OPEN
+
+    # reset timeout has passed - the trial request succeeds
+    assert client.get('https://search.api/api/search') is ok_response
+    assert client.circuit_breaker.state == CIRCUIT_CLOSED
+    assert client.stats_to_dict()['request_count'] == 4
@@ -0,0 +1,50 @@
+# pylint: disable=unused-argument
+import copy
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.cognito import jwks_manager
+
+
+@pytest.fixture
+def public_jwks(sample_jwks):
+    jwks = copy.deepcopy(sample_jwks)
+    for key in jwks['keys']:
+        del key['d']  # remove private part of the key
+    return jwks
+
+
+def test_unknown_kid_is_fetched_once(app, monkeypatch, public_jwks, sample_kid):
+    download_jwks_m = MagicMock(return_value={'keys': []})
+    monkeypatch.setattr('core.cognito.download_jwks', download_jwks_m)
+    monkeypatch.setitem(app.config, 'COGNITO_JWKS_MIN_FETCH_INTERVAL', 0)
+    jwks_manager.init_app(app)
+    assert download_jwks_m.call_count == 1
+
+    # keys were rotated
+    download_jwks_m.return_value = public_jwks
+    assert jwks_manager.get_public_key(sample_kid) is not None
+    assert jwks_manager.get_public_key(sample_kid) is not None
+    assert download_jwks_m.call_count == 2
+
+    monkeypatch.setitem(app.config, 'COGNITO_JWKS_MIN_FETCH_INTERVAL', 3600)
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            jwks_manager.get_public_key('unknown kid')
+    assert download_jwks_m.call_count == 2  # the last fetch was too recent
+
+
+def test_jwks_is_loaded_from_disk(app, monkeypatch, tmp_path, public_jwks, sample_kid):
+    cache_path = tmp_path / 'jwks.json'
+    cache_path.write_text(json.dumps(public_jwks))
+    monkeypatch.setitem(app.config, 'COGNITO_JWKS_CACHE_PATH', str(cache_path))
+    monkeypatch.setitem(app.config, 'COGNITO_JWKS_MIN_FETCH_INTERVAL', 3600)
+
+    download_jwks_m = MagicMock(side_effect=ConnectionError('Cognito is unavailable'))
+    monkeypatch.setattr('core.cognito.download_jwks', download_jwks_m)
+    jwks_manager.init_app(app)
+
+    assert jwks_manager.get_public_key(sample_kid) is not None
+    assert download_jwks_m.call_count == 1
@@ -6,8 +6,11 @@ from unittest.mock import (
 )
 
 from graphene import Node
+from graphql_relay.utils import unbase64
 
 from core.db.models import (
+    db,
+    COMPLETED_STATE,
     PLACE_ORDER_ACTION,
     ORDER_PLACED_STATE,
     SET_SHIPPED_ACTION,
@@ -15,6 +18,8 @@ from core.db.models import (
     SET_USER_RECEIVED_ACTION,
 )
 from core.db.models.order import Order
+from core.graphql.count_cache import total_count_cache
+from core.graphql.schemas import KEYSET_CURSOR_PREFIX
 from core.order.order_manager import run_order
 
 order_list_query = '''
@@ -198,6 +203,70 @@ def test_order_list_sort_by_user_desc(
     assert res == expected
 
 
+order_list_keyset_query = '''
+    query ($first: Int, $after: String, $sort: OrderSortEnum, $listFilter: OrderFilter) {
+      orderManagement {
+        orders(first: $first, after: $after, sort: $sort, listFilter: $listFilter) {
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+          edges {
+            node {
+              shippingName}}}}}
+'''
+
+
+def test_order_list_keyset_pagination(
+        graphql_client_admin, proposed_to_user_offer_item, accepted_order, completed_orders
+):
+    variables = {
+        'first': 3,
+        'sort': 'order_time_desc',
+        'listFilter': {'state': 'completed'},
+    }
+    res = graphql_client_admin.post(order_list_keyset_query, variables=variables)
+    orders = res['data']['orderManagement']['orders']
+    assert [e['node']['shippingName'] for e in orders['edges']] == ['tuser3', 'tuser2', 'tuser1']
+    assert orders['pageInfo']['hasNextPage'] is True
+    assert unbase64(orders['pageInfo']['endCursor']).startswith(KEYSET_CURSOR_PREFIX)
+
+    variables['after'] = orders['pageInfo']['endCursor']
+    res = graphql_client_admin.post(order_list_keyset_query, variables=variables)
+    orders = res['data']['orderManagement']['orders']
+    assert [e['node']['shippingName'] for e in orders['edges']] == ['tuser0']
+    assert orders['pageInfo']['hasNextPage'] is False
+
+
+def test_order_list_total_count_is_lazy(
+        graphql_client_admin, proposed_to_user_offer_item, accepted_order, completed_orders
+):
+    with patch('sqlalchemy.orm.query.Query.count') as count_m:
+        res = graphql_client_admin.post(order_list_keyset_query, variables={'first': 2})
+    assert len(res['data']['orderManagement']['orders']['edges']) == 2
+    count_m.assert_not_called()
+
+
+def test_order_list_total_count_is_cached(
+        graphql_client_admin, proposed_to_user_offer_item, accepted_order, completed_orders
+):
+    variables = {'first': 1, 'listFilter': {'state': 'completed'}}
+    res = graphql_client_admin.post(order_list_query, variables=variables)
+    assert res['data']['orderManagement']['orders']['totalCount'] == 4
+
+    accepted_order.state = COMPLETED_STATE
+    db.session.commit()
+
+    variables['offset'] = 1
+    res = graphql_client_admin.post(order_list_query, variables=variables)
+    assert res['data']['orderManagement']['orders']['totalCount'] == 4
+    assert total_count_cache.stats_to_dict()['hits'] == 1
+
+    total_count_cache.invalidate(Order.__tablename__)
+    res = graphql_client_admin.post(order_list_query, variables=variables)
+    assert res['data']['orderManagement']['orders']['totalCount'] == 5
+
+
 def test_order_states_for_filtering(graphql_client_admin):
     query = '''
         { orderManagement { orderStates } }
@@ -563,15 +632,15 @@ def _run_order_task_mock(*args, **kwargs):
     return MagicMock()
 
 
-@patch('core.graphql.schemas.order.run_order')
+@patch('core.graphql.schemas.order.enqueue_order')
 @patch('core.order.actions.user.boto3')
 @patch('core.order.actions.support_admin.send_mail')
 @patch('core.order.actions.user.send_template_email')
 def test_order_run_action(
-        send_user_mail_m, send_mail_m, boto_m, run_order_m,
+        send_user_mail_m, send_mail_m, boto_m, enqueue_order_m,
         graphql_client_admin, proposed_to_wine_expert_order,
 ):
-    run_order_m.delay.side_effect = _run_order_task_mock
+    enqueue_order_m.side_effect = _run_order_task_mock
 
     query = '''
         mutation($input: SaveOrderInput!) {
@@ -823,6 +892,8 @@ def test_order_run_action(
     modified_order = Order.query.get(proposed_to_wine_expert_order.id)
     assert modified_order.state == 'proposed_to_user'
     send_user_mail_m.assert_called_once()
+    # approve is run inline
+    enqueue_order_m.assert_not_called()
 
 
 def test_order_edit(
@@ -940,11 +1011,11 @@ def test_order_edit(
     assert modified_order.shipping_date == datetime.date(2015, 9, 15)
 
 
-@patch('core.graphql.schemas.order.run_order')
+@patch('core.graphql.schemas.order.enqueue_order')
 def test_run_place_order_action_with_edit(
-        run_order_m, graphql_client_admin, support_notified_order, support_notified_product_offer
+        enqueue_order_m, graphql_client_admin, support_notified_order, support_notified_product_offer
 ):
-    run_order_m.delay.side_effect = _run_order_task_mock
+    enqueue_order_m.side_effect = _run_order_task_mock
 
     query = '''
         mutation ($input: SaveOrderInput!) {
@@ -1022,14 +1093,14 @@ def test_run_place_order_action_with_edit(
     assert modified_order.shipping_date == datetime.date(2020, 11, 29)
 
 
-@patch('core.graphql.schemas.order.run_order')
+@patch('core.graphql.schemas.order.enqueue_order')
 @patch('core.dbmethods.user.stripe')
 @patch('core.order.actions.user.send_template_email')
 def test_run_set_shipped_action(
-        send_mail_m, stripe_m, run_order_m,
+        send_mail_m, stripe_m, enqueue_order_m,
         graphql_client_admin, placed_order, placed_product_offer,
 ):
-    run_order_m.delay.side_effect = _run_order_task_mock
+    enqueue_order_m.side_effect = _run_order_task_mock
 
     query = '''
         mutation($input: SaveOrderInput!) {
@@ -1067,6 +1138,65 @@ def test_run_set_shipped_action(
     send_mail_m.assert_called_once()
 
 
+def test_run_invalid_manual_action(graphql_client_admin, placed_order):
+    query = '''
+        mutation($input: SaveOrderInput!) {
+          saveOrder(input: $input) {
+            clientMutationId
+          }
+        }
+    '''
+
+    # Test
+    res = graphql_client_admin.post(query, variables={
+        'input': {
+            'id': Node.to_global_id('Order', placed_order.id),
+            'action': PLACE_ORDER_ACTION,
+            'shippingName': 'test name 55',
+            'clientMutationId': 'test'
+        }
+    })
+
+    # Check
+    assert res['data']['saveOrder'] is None
+    assert 'Invalid action' in res['errors'][0]['message']
+
+    modified_order = Order.query.get(placed_order.id)
+    assert modified_order.state == ORDER_PLACED_STATE
+    assert modified_order.shipping_name != 'test name 55'
+
+
+@patch('core.graphql.schemas.order.enqueue_order')
+def test_run_action_of_queued_order(
+        enqueue_order_m, graphql_client_admin, support_notified_order, support_notified_product_offer
+):
+    # the order is already waiting in a queue
+    enqueue_order_m.return_value = None
+
+    query = '''
+        mutation($input: SaveOrderInput!) {
+          saveOrder(input: $input) {
+            clientMutationId
+            taskId
+          }
+        }
+    '''
+
+    # Test
+    res = graphql_client_admin.post(query, variables={
+        'input': {
+            'id': Node.to_global_id('Order', support_notified_order.id),
+            'action': PLACE_ORDER_ACTION,
+            'clientMutationId': 'test'
+        }
+    })
+
+    # Check
+    assert res['data']['saveOrder'] is None
+    assert 'already queued' in res['errors'][0]['message']
+    enqueue_order_m.assert_called_once_with(support_notified_order.id, PLACE_ORDER_ACTION)
+
+
 def test_order_run_action_nonadmin(graphql_client, accepted_order):
     query = '''
         mutation($input: SaveOrderInput!) {
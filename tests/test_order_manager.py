@@ -6,6 +6,8 @@ from unittest.mock import (
 )
 from datetime import datetime
 
+import pytest
+
 from core.db.models import (
     db,
     READY_TO_PROPOSE_STATE,
@@ -14,6 +16,7 @@ from core.db.models import (
     APPROVE_ACTION,
     STARTED_STATE,
     SET_SHIPPED_ACTION,
+    CAPTURE_MONEY_ACTION,
     USER_NOTIFIED_SHIPPED_STATE,
     ORDER_PLACED_STATE,
     PLACE_ORDER_ACTION,
@@ -33,8 +36,17 @@ from core.db.models.order_history import OrderHistory
 from core.db.models.user_subscription_snapshot import UserSubscriptionSnapshot
 from core.dbmethods import get_order_creation_month
 from core.dbmethods.user import get_user
+from core.order.exceptions import (
+    InvalidOrderActionException,
+    OrderLockedException,
+)
+from core.order.locks import (
+    order_execution_lock,
+    release_order_enqueue,
+)
 from core.order.order_manager import (
     OrderManager,
+    run_order,
     run_scheduled_orders,
     notify_timed_out_orders,
 )
@@ -60,22 +72,60 @@ def test_create_order(app, user, user_subscription, user_address):
                getattr(user_subscription, f)
 
 
-@patch('core.order.order_manager.run_order')
-def test_run_scheduled_orders(run_order_m, app, order, order_proposed):
+@patch('core.order.order_manager.run_orders')
+def test_run_scheduled_orders(run_orders_m, app, order, order_proposed):
+    # Test
+    run_scheduled_orders()
+
+    # Check
+    run_orders_m.delay.assert_called_once_with([order.id])
+
+
+class FakeRedisPipeline:
+    def __init__(self, store):
+        self.store = store
+        self.keys = []
+
+    def set(self, key, value, nx=False, ex=None):
+        self.keys.append((key, value))
+
+    def execute(self):
+        results = []
+        for key, value in self.keys:
+            results.append(key not in self.store)
+            self.store.setdefault(key, value)
+        return results
+
+
+@patch('core.order.order_manager.run_orders')
+@patch('core.order.locks._get_redis_client')
+@patch('core.order.locks.config.CELERY_TASK_ALWAYS_EAGER', False)
+def test_run_scheduled_orders_keeps_claim(get_redis_client_m, run_orders_m, app, order):
+    store = {}
+    get_redis_client_m.return_value.pipeline.side_effect = lambda **kwargs: FakeRedisPipeline(store)
+    get_redis_client_m.return_value.delete.side_effect = store.pop
+
     # Test
     run_scheduled_orders()
+    # the order is still waiting in the queue - the row lock ended with the first tick
+    run_scheduled_orders()
 
     # Check
-    run_order_m.delay.assert_called_once_with(order.id)
+    run_orders_m.delay.assert_called_once_with([order.id])
 
+    # the task of the order started
+    release_order_enqueue(order.id)
+    run_scheduled_orders()
+    assert run_orders_m.delay.call_count == 2
 
-@patch('core.order.actions.search.requests')
+
+@patch('core.order.actions.search.search_api_client')
 @patch('core.order.actions.wine_expert.send_mail')
 @patch('core.order.actions.search.create_product_offers')
 def test_run_action_after_started(
         create_product_offers_m,
         send_mail_m,
-        requests_m,
+        search_api_client_m,
         app,
         wine_expert,
         order,
@@ -105,14 +155,14 @@ def test_run_action_after_started(
 
     result = MagicMock()
     result.status_code = 200
-    requests_m.get.return_value = result
+    search_api_client_m.get.return_value = result
 
     manager = OrderManager(order.id)
 
     # Test
     manager.run_action()
 
-    requests_m.get.assert_called_with(
+    search_api_client_m.get.assert_called_with(
         '/api/search',
         params={
             'number_wines': 2,
@@ -146,13 +196,13 @@ def test_run_action_after_started(
         'New Order',
         'New order %s is available here: %s' % (order.id, order_url)
     )
-    create_product_offers_m.assert_called_once_with(order.id, requests_m.get().json())
+    create_product_offers_m.assert_called_once_with(order.id, search_api_client_m.get().json())
 
 
 @patch('core.order.actions.support_admin.send_mail')
-@patch('core.order.actions.search.requests')
+@patch('core.order.actions.search.search_api_client')
 def test_run_search_action_exception(
-        requests_m,
+        search_api_client_m,
         send_mail_m,
         app,
         wine_expert,
@@ -177,14 +227,14 @@ def test_run_search_action_exception(
     result = MagicMock()
     result.status_code = 400
     result.text = 'error'
-    requests_m.get.return_value = result
+    search_api_client_m.get.return_value = result
 
     manager = OrderManager(order.id)
 
     # Test
     manager.run_action()
 
-    requests_m.get.assert_called_with(
+    search_api_client_m.get.assert_called_with(
         '/api/search',
         params={
             'number_wines': 2,
@@ -203,13 +253,13 @@ def test_run_search_action_exception(
     assert states == [STARTED_STATE, SEARCH_EXCEPTION_TO_NOTIFY_STATE, SEARCH_EXCEPTION_STATE]
 
 
-@patch('core.order.actions.search.requests')
+@patch('core.order.actions.search.search_api_client')
 @patch('core.order.actions.wine_expert.send_mail')
 @patch('core.order.actions.search.create_product_offers')
 def test_run_action_after_started_with_sent_wines(
         create_product_offers_m,
         send_mail_m,
-        requests_m,
+        search_api_client_m,
         app,
         wine_expert,
         order,
@@ -245,14 +295,14 @@ def test_run_action_after_started_with_sent_wines(
 
     result = MagicMock()
     result.status_code = 200
-    requests_m.get.return_value = result
+    search_api_client_m.get.return_value = result
 
     manager = OrderManager(order.id)
 
     # Test
     manager.run_action()
 
-    requests_m.get.assert_called_with(
+    search_api_client_m.get.assert_called_with(
         '/api/search',
         params={
             'number_wines': 2,
@@ -289,7 +339,33 @@ def test_run_action_after_started_with_sent_wines(
         'New Order',
         'New order %s is available here: %s' % (order.id, order_url)
     )
-    create_product_offers_m.assert_called_once_with(order.id, requests_m.get().json())
+    create_product_offers_m.assert_called_once_with(order.id, search_api_client_m.get().json())
+
+
+def test_run_order_skipped_while_order_is_running(app, order_proposed):
+    with order_execution_lock(order_proposed.id) as acquired:
+        assert acquired
+
+        # Test
+        run_order(order_proposed.id, APPROVE_ACTION, handover=True)
+        # an explicitly requested action is not dropped silently
+        with pytest.raises(OrderLockedException):
+            run_order(order_proposed.id, APPROVE_ACTION)
+
+        # Check
+        with order_execution_lock(order_proposed.id) as acquired_again:
+            assert not acquired_again
+
+    db.session.refresh(order_proposed)
+    assert order_proposed.state == PROPOSED_TO_WINE_EXPERT_STATE
+
+
+def test_run_order_invalid_action(app, placed_order):
+    with pytest.raises(InvalidOrderActionException):
+        run_order(placed_order.id, APPROVE_ACTION)
+
+    db.session.refresh(placed_order)
+    assert placed_order.state == ORDER_PLACED_STATE
 
 
 @patch('core.order.actions.user.boto3')
@@ -319,19 +395,19 @@ def test_run_action_after_approved(boto3_m, send_push_m, boto_m, app, order_prop
     client_m.send_templated_email.assert_called_once()
 
 
-@patch('core.order.actions.search.requests')
+@patch('core.order.actions.search.search_api_client')
 @patch('core.order.actions.wine_expert.send_mail')
 @patch('core.order.actions.support_admin.send_mail')
 @patch('core.order.actions.search.create_product_offers')
 def test_run_action_exception(
-        create_product_offers_m, support_mail_m, send_mail_m, requests_m, app, wine_expert, order, user_address,
-        shipping_rate, salestax_rate
+        create_product_offers_m, support_mail_m, send_mail_m, search_api_client_m, app, wine_expert, order,
+        user_address, shipping_rate, salestax_rate
 ):
     send_mail_m.side_effect = Exception
 
     result = MagicMock()
     result.status_code = 200
-    requests_m.get.return_value = result
+    search_api_client_m.get.return_value = result
 
     manager = OrderManager(order.id)
 
@@ -357,7 +433,7 @@ def test_run_action_exception(
         'New order %s is available here: %s' % (order.id, order_url)
     )
     support_mail_m.assert_called_once()
-    create_product_offers_m.assert_called_once_with(order.id, requests_m.get().json())
+    create_product_offers_m.assert_called_once_with(order.id, search_api_client_m.get().json())
 
 
 @patch('core.order.actions.user._send')
@@ -437,6 +513,86 @@ def test_run_action_after_placed(
     client_m.send_templated_email.assert_called_once()
 
 
+@patch('core.order.order_manager.enqueue_order')
+@patch('core.order.order_manager.run_bulk_orders')
+def test_run_bulk(run_bulk_orders_m, enqueue_order_m, app, order, placed_order):
+    placed_order_id = placed_order.id
+    order_id = order.id
+
+    # Test
+    OrderManager.run_bulk([placed_order_id, order_id], SET_SHIPPED_ACTION)
+
+    # Check
+    db.session.expire_all()
+    shipped_order = db.session.query(Order).get(placed_order_id)
+    assert shipped_order.state == ORDER_SHIPPED_STATE
+    assert shipped_order.action == CAPTURE_MONEY_ACTION
+
+    order_history = db.session.query(OrderHistory).filter_by(
+        order_id=placed_order_id
+    ).order_by(OrderHistory.created_at.desc()).all()
+    assert [h.state for h in order_history[:2]] == [ORDER_SHIPPED_STATE, ORDER_PLACED_STATE]
+    assert order_history[0].parent_id == order_history[1].id
+
+    # the action is not valid for the started order
+    assert db.session.query(Order).get(order_id).state == STARTED_STATE
+
+    # capturing money calls Stripe - it runs per order under the order's execution lock
+    run_bulk_orders_m.apply_async.assert_not_called()
+    enqueue_order_m.assert_called_once_with(
+        placed_order_id, CAPTURE_MONEY_ACTION, handover=True
+    )
+
+
+def test_run_action_hands_over_to_action_queue(app, placed_order):
+    manager = OrderManager(placed_order.id)
+
+    # Test
+    next_action = manager.run_action(SET_SHIPPED_ACTION, time_budget=60, queue='orders')
+
+    # Check
+    # capturing money belongs to the external calls queue
+    assert next_action == CAPTURE_MONEY_ACTION
+    assert manager.order.state == ORDER_SHIPPED_STATE
+
+
+def test_run_bulk_only_transitions(app, order):
+    with pytest.raises(ValueError):
+        OrderManager.run_bulk([order.id], CAPTURE_MONEY_ACTION)
+
+
+@patch('core.order.actions.support_admin.datetime')
+def test_run_bulk_completes_order(
+        datetime_m, app, user_notified_shipped_order_20150530, user, user_address
+):
+    datetime_m.utcnow.return_value = datetime(2015, 6, 15, 13, 13, 13, 13)
+    datetime_m.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+    order_id = user_notified_shipped_order_20150530.id
+
+    # Test
+    OrderManager.run_bulk([order_id], SET_USER_RECEIVED_ACTION)
+
+    # Check
+    db.session.expire_all()
+    completed_order = db.session.query(Order).get(order_id)
+    assert completed_order.action is None
+    assert completed_order.state == COMPLETED_STATE
+
+    states = [h.state for h in db.session.query(OrderHistory).filter_by(
+        order_id=order_id
+    ).order_by(OrderHistory.created_at)]
+    assert states == [
+        STARTED_STATE,
+        USER_NOTIFIED_SHIPPED_STATE,
+        USER_RECEIVED_STATE,
+        COMPLETED_STATE,
+    ]
+
+    next_month_orders = [o for o in get_user(user.id).orders if o.id != order_id]
+    assert len(next_month_orders) == 1
+    assert next_month_orders[0].state == STARTED_STATE
+
+
 @patch('core.order.order_manager.send_mail')
 def test_notify_timed_out_orders(send_mail_m, app, order, timed_out_order):
     order_id = timed_out_order.id
@@ -539,7 +695,7 @@ def test_dont_run_next_month_order_yet(
     manager = OrderManager(user_notified_shipped_order_20150530.id)
     manager.run_action(SET_USER_RECEIVED_ACTION)
 
-    with patch('core.order.order_manager.run_order') as run_order_m:
+    with patch('core.order.order_manager.run_orders') as run_orders_m:
         # Test
         run_scheduled_orders()
 
@@ -549,7 +705,7 @@ def test_dont_run_next_month_order_yet(
         next_month_order = [o for o in user.orders if o.id != user_notified_shipped_order_20150530.id]
         assert len(next_month_order) == 1
 
-        run_order_m.delay.assert_not_called()
+        run_orders_m.delay.assert_not_called()
 
 
 @patch('core.order.actions.support_admin.datetime')
@@ -566,7 +722,7 @@ def test_run_next_month_order_already(
     manager = OrderManager(user_notified_shipped_order_20150530.id)
     manager.run_action(SET_USER_RECEIVED_ACTION)
 
-    with patch('core.order.order_manager.run_order') as run_order_m:
+    with patch('core.order.order_manager.run_orders') as run_orders_m:
         # Test
         run_scheduled_orders()
 
@@ -576,7 +732,7 @@ def test_run_next_month_order_already(
         next_month_order = [o for o in user.orders if o.id != user_notified_shipped_order_20150530.id]
         assert len(next_month_order) == 1
 
-        run_order_m.delay.assert_called_once_with(next_month_order[0].id)
+        run_orders_m.delay.assert_called_once_with([next_month_order[0].id])
 
 
 @patch('core.order.actions.support_admin.datetime')
@@ -596,7 +752,7 @@ def test_dont_run_next_month_order_subscription_suspended(
     manager = OrderManager(user_notified_shipped_order_20150530.id)
     manager.run_action(SET_USER_RECEIVED_ACTION)
 
-    with patch('core.order.order_manager.run_order') as run_order_m:
+    with patch('core.order.order_manager.run_orders') as run_orders_m:
         # Test
         run_scheduled_orders()
 
@@ -606,4 +762,4 @@ def test_dont_run_next_month_order_subscription_suspended(
         next_month_order = [o for o in user.orders if o.id != user_notified_shipped_order_20150530.id]
         assert len(next_month_order) == 1
 
-        run_order_m.delay.assert_not_called()
+        run_orders_m.delay.assert_not_called()
@@ -10,10 +10,14 @@ from graphene import Node
 
 from core.order.actions.base import get_admin_order_url
 from core.db.models import db
-from core.db.models import SUPPORT_NOTIFIED_STATE
+from core.db.models import (
+    PROPOSED_TO_USER_STATE,
+    SUPPORT_NOTIFIED_STATE,
+)
 from core.db.models.product_offer import ProductOffer
 from core.db.models.offer_item import OfferItem
 from core.dbmethods.product import create_product_offers
+from core.order.locks import order_execution_lock
 
 
 def test_create_product_offers(
@@ -70,6 +74,44 @@ def test_create_product_offers(
     assert product_offer1.product_cost == Decimal('21')
 
 
+def test_create_product_offers_with_reviews(
+        app,
+        order,
+        product_dict_1,
+        product_dict_2,
+        product_1_review_1,
+        product_1_review_2,
+        product_1_review_3_zero_score,
+        product_2_review_1,
+        source_1,
+        source_2,
+        shipping_rate,
+        shipping_rate_2,
+        salestax_rate,
+        salestax_rate_2,
+        theme_1,
+):
+    # Test
+    create_product_offers(order.id, [[product_dict_1, product_dict_2]])
+    db.session.commit()
+
+    # Check
+    offer_items = db.session.query(OfferItem).order_by(OfferItem.id.asc()).all()
+
+    assert [o.sku for o in offer_items] == ['sku1', 'sku2']
+    # the same reviews (and order) as OfferItem.product_reviews
+    assert offer_items[0].prof_reviews == [{'name': 'reviewer 1 2', 'score': 90},
+                                           {'name': 'reviewer 1 1', 'score': 80}]
+    assert offer_items[1].prof_reviews == [{'name': 'reviewer 2 1', 'score': 78}]
+
+    product_offer = offer_items[0].product_offer
+    assert product_offer.bottle_qty == 2
+    assert product_offer.product_cost == Decimal('21')
+    assert product_offer.salestax_cost == Decimal('1.94')
+    assert product_offer.shipping_cost == Decimal('10')
+    assert product_offer.total_cost == Decimal('32.94')
+
+
 def _assert_offer_items_are_same(offer_items, idx1, idx2):
     assert offer_items[idx1].product_offer.id == offer_items[idx2].product_offer.id
     assert offer_items[idx1].name == offer_items[idx2].name
@@ -750,3 +792,28 @@ def test_accept_product_offer(
     )
 
     assert order.state == SUPPORT_NOTIFIED_STATE
+
+
+def test_accept_product_offer_while_order_is_running(
+        graphql_client, user, proposed_to_user_order, proposed_to_user_product_offer):
+    offer_id = proposed_to_user_product_offer.id
+    query = """mutation acceptOffer($input: AcceptProductOfferInput!) {
+        acceptOffer(input: $input) { clientMutationId }
+    }
+    """
+    variables = {
+        'input': {
+            'offerId': graphene.Node.to_global_id('ProductOffer', offer_id),
+        }}
+
+    with order_execution_lock(proposed_to_user_order.id) as acquired:
+        assert acquired
+
+        # Test
+        res = graphql_client.post(query, variables)
+
+    # Check
+    assert 'already running' in res['errors'][0]['message']
+    offer = db.session.query(ProductOffer).filter_by(id=offer_id).first()
+    assert not offer.accepted
+    assert offer.order.state == PROPOSED_TO_USER_STATE
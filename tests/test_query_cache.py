@@ -0,0 +1,95 @@
+# pylint: disable=unused-argument
+import json
+
+from core.graphql.query_cache import (
+    get_document_hash,
+    query_document_cache,
+)
+
+domain_cards_query = '''
+  query {
+    domainCards {
+      edges {
+        node {
+          displayText}}}}
+'''
+
+
+def _post_persisted_query(client, api_url, valid_secret, document_hash, query=None):
+    body = {
+        'extensions': {
+            'persistedQuery': {
+                'version': 1,
+                'sha256Hash': document_hash,
+            },
+        },
+    }
+    if query is not None:
+        body['query'] = query
+
+    resp = client.post(
+        api_url,
+        headers={
+            'Authorization': 'SECRET ' + valid_secret,
+            'Content-Type': 'application/json',
+        },
+        json=body
+    )
+    return resp.status_code, json.loads(resp.data.decode('utf8'))
+
+
+def test_persisted_query(client, api_url, valid_secret, monkeypatch, domain_card_1, domain_card_2):
+    # identical anonymous requests would be answered from the response cache
+    monkeypatch.setattr('core.config.GRAPHQL_RESPONSE_CACHE_TTL', 0)
+    query_document_cache.clear()
+    document_hash = get_document_hash(domain_cards_query)
+    expected = {'data': {'domainCards': {'edges': [
+        {'node': {'displayText': 'text1'}},
+        {'node': {'displayText': 'text2'}},
+    ]}}}
+
+    status_code, res = _post_persisted_query(client, api_url, valid_secret, document_hash)
+    assert status_code == 200
+    assert res == {'errors': [{'message': 'PersistedQueryNotFound'}]}
+
+    status_code, res = _post_persisted_query(
+        client, api_url, valid_secret, document_hash, query=domain_cards_query
+    )
+    assert status_code == 200
+    assert res == expected
+
+    status_code, res = _post_persisted_query(client, api_url, valid_secret, document_hash)
+    assert status_code == 200
+    assert res == expected
+
+    stats = query_document_cache.stats_to_dict()
+    assert stats['registrations'] == 1
+    assert stats['hits'] == 2
+    assert stats['not_found'] == 1
+
+
+def test_persisted_query_hash_mismatch(client, api_url, valid_secret, domain_category):
+    query_document_cache.clear()
+
+    status_code, res = _post_persisted_query(
+        client, api_url, valid_secret, get_document_hash('{ currentTimeUtc }'),
+        query=domain_cards_query
+    )
+    assert status_code == 400
+    assert res == {'errors': [{'message': 'Provided sha256Hash does not match query'}]}
+
+
+def test_validated_document_is_reused(graphql_client_anonymous, monkeypatch, domain_card_1):
+    # identical anonymous requests would be answered from the response cache
+    monkeypatch.setattr('core.config.GRAPHQL_RESPONSE_CACHE_TTL', 0)
+    query_document_cache.clear()
+
+    graphql_client_anonymous.post(domain_cards_query)
+    graphql_client_anonymous.post(domain_cards_query)
+    res = graphql_client_anonymous.post('{ domainCards { unknownField } }')
+
+    assert 'errors' in res
+    stats = query_document_cache.stats_to_dict()
+    assert stats['misses'] == 2
+    assert stats['hits'] == 1
+    assert stats['size'] == 2
@@ -0,0 +1,73 @@
+#
+# pylint: disable=unused-argument,too-many-arguments
+import time
+
+from core.db.models import db
+from core.dbmethods import (
+    get_shipping_cost,
+    get_sources_budget,
+    get_tax_rate,
+)
+from core.dbmethods.rates import (
+    RateIntervals,
+    rate_index,
+)
+
+
+def test_sources_budget_with_and_without_rate_index(
+        app, monkeypatch, source_1, source_2, source_no_shipping, shipping_rate, shipping_rate_2,
+        shipping_rate_3, salestax_rate, salestax_rate_2
+):
+    sources = [source_1.id, source_2.id, source_no_shipping.id]
+    expected = {
+        source_1.id: 82,  # (100 - 10) / (1 + 0.0925)
+        source_2.id: 73,  # (100 - 20) / (1 + 0.09)
+    }
+
+    assert get_sources_budget(sources, 100, 2, '1234') == expected
+    assert get_sources_budget(sources, 100, 2, 1234) == expected
+    assert get_shipping_cost(source_1.id, 4, '1234') == 25
+    assert float(get_tax_rate(source_1.id, '50')) == 0.01
+    assert rate_index.load_count == 1
+
+    monkeypatch.setattr('core.config.RATE_INDEX_CHECK_INTERVAL', 0)
+    assert get_sources_budget(sources, 100, 2, '1234') == expected
+    assert get_shipping_cost(source_1.id, 4, '1234') == 25
+    assert float(get_tax_rate(source_1.id, '50')) == 0.01
+
+
+def test_rate_index_is_reloaded_on_change(app, monkeypatch, source_1, shipping_rate, salestax_rate):
+    monkeypatch.setattr(rate_index, 'check_interval', 0)
+    assert get_shipping_cost(source_1.id, 2, '1234') == 10
+
+    shipping_rate.shipping_cost = 15
+    db.session.commit()
+
+    # PostgreSQL reports the change counters of the table shortly after the commit
+    for _ in range(100):
+        if get_shipping_cost(source_1.id, 2, '1234') == 15:
+            break
+        db.session.rollback()
+        time.sleep(0.1)
+
+    assert get_shipping_cost(source_1.id, 2, '1234') == 15
+    assert rate_index.load_count == 2
+
+
+def test_rate_intervals_gaps_and_overlaps():
+    intervals = RateIntervals()
+    intervals.add(0, 9999, 'wide')
+    intervals.add(100, 199, 'narrow')
+    intervals.add(300, 399, 'other')
+
+    assert intervals.find(150) == 'narrow'
+    assert intervals.find(250) == 'wide'
+    assert intervals.find(10000) is None
+
+    intervals = RateIntervals()
+    intervals.add(100, 199, 'a')
+    intervals.add(300, 399, 'b')
+
+    assert intervals.find(250) is None
+    assert intervals.find(50) is None
+    assert intervals.find(399) == 'b'
@@ -0,0 +1,124 @@
+#
+# pylint: disable=unused-argument
+from core.graphql.query_cache import (
+    get_document_hash,
+    query_document_cache,
+)
+from core.response_cache import response_cache
+
+domain_cards_query = '''
+  query {
+    domainCards {
+      edges {
+        node {
+          displayText}}}}
+'''
+
+themes_query = '''
+  query {
+    themes {
+      edges {
+        node {
+          title
+          isSelected}}}}
+'''
+
+
+def _post(client, api_url, authorization, query, headers=None):
+    return client.post(
+        api_url,
+        headers={
+            'Authorization': authorization,
+            'Content-Type': 'application/json',
+            **(headers or {}),
+        },
+        json={'query': query},
+    )
+
+
+def test_anonymous_response_is_cached_and_revalidated(
+        client, api_url, valid_secret, domain_card_1, domain_card_2
+):
+    resp = _post(client, api_url, 'SECRET ' + valid_secret, domain_cards_query)
+    assert resp.status_code == 200
+    etag = resp.headers['ETag']
+    assert resp.headers['Cache-Control'] == 'no-cache'
+
+    resp = _post(client, api_url, 'SECRET ' + valid_secret, domain_cards_query)
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == etag
+    assert b'text1' in resp.data
+
+    resp = _post(
+        client, api_url, 'SECRET ' + valid_secret, domain_cards_query,
+        headers={'If-None-Match': etag},
+    )
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+    stats = response_cache.stats_to_dict()
+    assert stats['size'] == 1
+    assert stats['hits'] == 2
+
+    response_cache.invalidate()
+    resp = _post(
+        client, api_url, 'SECRET ' + valid_secret, domain_cards_query,
+        headers={'If-None-Match': etag},
+    )
+    # the same bytes are produced again - the ETag still matches
+    assert resp.status_code == 304
+
+
+def test_authenticated_responses_are_not_cached(
+        client, api_url, valid_secret, valid_jwt, user, theme_4, domain_card_1
+):
+    resp = _post(client, api_url, 'JWT ' + valid_jwt, themes_query)
+    assert resp.status_code == 200
+    assert 'ETag' not in resp.headers
+
+    resp = _post(client, api_url, 'JWT ' + valid_jwt, domain_cards_query)
+    assert resp.status_code == 200
+    assert 'ETag' not in resp.headers
+
+    assert response_cache.stats_to_dict()['size'] == 0
+
+    # isSelected of the anonymous identity is the same for every visitor
+    resp = _post(client, api_url, 'SECRET ' + valid_secret, themes_query)
+    assert resp.status_code == 200
+    assert 'ETag' in resp.headers
+
+
+def test_persisted_query_response_is_cached_by_hash(
+        client, api_url, valid_secret, domain_card_1
+):
+    persisted_query = {'persistedQuery': {
+        'version': 1,
+        'sha256Hash': get_document_hash(domain_cards_query),
+    }}
+
+    query_document_cache.clear()
+    resp = client.post(
+        api_url,
+        headers={'Authorization': 'SECRET ' + valid_secret},
+        json={'extensions': persisted_query},
+    )
+    assert b'PersistedQueryNotFound' in resp.data
+    assert 'ETag' not in resp.headers
+
+    resp = client.post(
+        api_url,
+        headers={'Authorization': 'SECRET ' + valid_secret},
+        json={'query': domain_cards_query, 'extensions': persisted_query},
+    )
+    etag = resp.headers['ETag']
+
+    query_document_cache.clear()
+    resp = client.post(
+        api_url,
+        headers={'Authorization': 'SECRET ' + valid_secret},
+        json={'extensions': persisted_query},
+    )
+    # served without the document
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == etag
+    assert response_cache.stats_to_dict()['hits'] == 1
@@ -177,9 +177,9 @@ run_pipeline_sequence_query = '''
 '''
 
 
-@patch('core.graphql.schemas.pipeline_sequence.requests')
+@patch('core.graphql.schemas.pipeline_sequence.integration_api_client')
 def test_run_pipeline_sequence_nonadmin(
-        requests_m,
+        integration_api_client_m,
         graphql_client,
         pipeline_sequence_3,
         pipeline_sequence_1,
@@ -198,10 +198,10 @@ def test_run_pipeline_sequence_nonadmin(
 
     assert res['data']['runPipelineSequence'] is None
     assert '401 Unauthorized' in res['errors'][0]['message']
-    requests_m.get.assert_not_called()
+    integration_api_client_m.get.assert_not_called()
 
 
-def _run_pipeline_sequence_requests_get_mock(url, *args, **kwargs):
+def _run_pipeline_sequence_integration_api_get_mock(url, *args, **kwargs):
     source_id = int(integration_url_regex.match(url).group(1))
     pipeline_sequence = PipelineSequence.query.filter(
         PipelineSequence.source_id == source_id
@@ -216,9 +216,9 @@ def _run_pipeline_sequence_requests_get_mock(url, *args, **kwargs):
     return result_mock
 
 
-@patch('core.graphql.schemas.pipeline_sequence.requests')
+@patch('core.graphql.schemas.pipeline_sequence.integration_api_client')
 def test_run_pipeline_sequence(
-        requests_m,
+        integration_api_client_m,
         graphql_client_admin,
         pipeline_sequence_3,
         pipeline_sequence_1,
@@ -226,7 +226,7 @@ def test_run_pipeline_sequence(
         pipeline_sequence_4,
         pipeline_sequence_5,
 ):
-    requests_m.get.side_effect = _run_pipeline_sequence_requests_get_mock
+    integration_api_client_m.get.side_effect = _run_pipeline_sequence_integration_api_get_mock
 
     ps_id_4 = Node.to_global_id('PipelineSequence', pipeline_sequence_4.id)
     ps_source_id_4 = pipeline_sequence_4.source_id
@@ -238,7 +238,7 @@ def test_run_pipeline_sequence(
         },
     })
 
-    requests_m.get.assert_called_once_with(
+    integration_api_client_m.get.assert_called_once_with(
         f'https://m3-integration-test.com/api/1/source/{ps_source_id_4}/sync/'
     )
     expected = {'data': {'runPipelineSequence': {
@@ -0,0 +1,80 @@
+#
+# pylint: disable=unused-argument
+import json
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+from core.db.models import db
+from core.tracing import (
+    DEFERRED_PATH,
+    finish_request_trace,
+    start_request_trace,
+)
+
+orders_query = '''
+    query AdminOrders {
+      orderManagement {
+        orders(first: 10) {
+          edges {
+            node {
+              shippingName
+              user {
+                firstName}}}}}}
+'''
+
+
+def _post(client, api_url, authorization, body):
+    resp = client.post(
+        api_url,
+        headers={
+            'Authorization': authorization,
+            'Content-Type': 'application/json',
+        },
+        json=body,
+    )
+    return json.loads(resp.data.decode('utf8'))
+
+
+def test_resolver_timings_in_response_and_metrics(
+        client, api_url, valid_jwt_admin, valid_system_secret, accepted_order
+):
+    res = _post(client, api_url, 'JWT ' + valid_jwt_admin, {
+        'query': orders_query,
+        'extensions': {'tracing': True},
+    })
+    assert res['data']['orderManagement']['orders']['edges']
+
+    tracing = res['extensions']['tracing']
+    assert tracing['operation_name'] == 'AdminOrders'
+    resolvers = tracing['resolvers']
+    assert resolvers['orderManagement.orders']['calls'] == 1
+    assert resolvers['orderManagement.orders']['sql_count'] > 0
+    assert resolvers['orderManagement.orders.edges.node.shippingName']['calls'] == 1
+
+    # without the extension the response is not changed
+    res = _post(client, api_url, 'JWT ' + valid_jwt_admin, {'query': orders_query})
+    assert 'extensions' not in res
+
+    resp = client.get(api_url + 'metrics', headers={'Authorization': 'SECRET ' + valid_system_secret})
+    assert resp.status_code == 200
+    metrics = resp.json['resolvers']
+    assert metrics['request_count'] == 2
+    orders_metrics = [
+        p for p in metrics['paths']
+        if p['operation_name'] == 'AdminOrders' and p['path'] == 'orderManagement.orders'
+    ]
+    assert orders_metrics[0]['requests'] == 2
+    assert sum(orders_metrics[0]['wall_time_ms_buckets']) == 2
+
+
+def test_failed_statement_is_not_timed(app):
+    start_request_trace()
+    with pytest.raises(DBAPIError):
+        db.session.execute('select 1 / 0')
+    db.session.rollback()
+    db.session.execute('select 1')
+    trace = finish_request_trace()
+
+    # only the statement that completed is counted
+    assert trace.paths[DEFERRED_PATH].sql_count == 1
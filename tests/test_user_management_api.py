@@ -1746,3 +1746,38 @@ def test_failure_updating_user_in_cognito(
         'userCards': {'edges': [], 'totalCount': 0},
         'userSubscription': None}}}
     assert updated_user == expected
+
+
+user_search_query = '''
+    query ($listFilter: UserFilter) {
+        userManagement {
+          users(listFilter: $listFilter) {
+            edges {
+              node {
+                firstName}}}}}
+'''
+
+
+def test_user_list_filter_by_display_name_escapes_wildcards(
+        graphql_client_admin, user, user_no_stripe, wine_expert
+):
+    res = graphql_client_admin.post(user_search_query, variables={
+        'listFilter': {'displayName': 'R_'},
+    })
+    edges = res['data']['userManagement']['users']['edges']
+    assert [e['node']['firstName'] for e in edges] == ['tuser_no_stripe']
+
+
+def test_user_list_filter_by_display_name_ranked(
+        graphql_client_admin, user, user_no_stripe, wine_expert
+):
+    # the default sort (user_number_asc) puts user_no_stripe first - the exact match
+    # has to come first only because of the ranking
+    user_no_stripe.user_number = '0000000'
+    db.session.commit()
+
+    res = graphql_client_admin.post(user_search_query, variables={
+        'listFilter': {'displayName': 'tuser', 'rankByRelevance': True},
+    })
+    edges = res['data']['userManagement']['users']['edges']
+    assert [e['node']['firstName'] for e in edges] == ['tuser', 'tuser_no_stripe']